@@ -0,0 +1,227 @@
+import argparse
+import csv
+import heapq
+import json
+import sys
+
+import colorinterface
+import sessionstore
+import themelibrary
+
+"""
+audit.py
+
+This file checks color schemes for readability, using the contrast
+ratio defined by the Web Content Accessibility Guidelines (WCAG 2). The
+pairs of colors that PuTTY draws on top of each other (foreground on
+background, cursor text on the cursor, each ANSI color on the
+background) are compared, and any pair below its minimum ratio is
+reported, worst first.
+
+Identical schemes are only checked once, and the luminance of each
+component comes from a 256-entry table, so auditing many sessions
+costs little more than reading them.
+"""
+
+# The minimum contrast ratio for body text (WCAG AA) and for the less
+# critical pairs, such as the cursor and ANSI colors (WCAG AA, large
+# text).
+TEXT_MIN_RATIO = 4.5
+ACCENT_MIN_RATIO = 3.0
+
+def _pair(foreground, background, min_ratio):
+    """
+    a helper function that builds an AUDIT_PAIRS entry from color names
+    """
+    return ('{0} on {1}'.format(foreground, background),
+            colorinterface.color_position(foreground),
+            colorinterface.color_position(background),
+            min_ratio)
+
+# The color pairs that are checked, as (label, foreground position,
+# background position, minimum ratio) tuples.
+AUDIT_PAIRS = [
+    _pair('Default Foreground', 'Default Background', TEXT_MIN_RATIO),
+    _pair('Default Bold Foreground', 'Default Background', TEXT_MIN_RATIO),
+    _pair('Default Bold Foreground', 'Default Bold Background',
+          TEXT_MIN_RATIO),
+    _pair('Cursor Text', 'Cursor Color', ACCENT_MIN_RATIO),
+    _pair('Cursor Color', 'Default Background', ACCENT_MIN_RATIO),
+] + [_pair(name, 'Default Background', ACCENT_MIN_RATIO)
+     for name in colorinterface.PUTTY_COLOR_ORDER[6:]]
+
+def relative_luminance(color):
+    """
+    Get the WCAG relative luminance of a color.
+
+    Parameters
+    ----------
+    color : tuple
+        the RGB integer values of the color
+
+    Returns
+    -------
+    float
+        the luminance, from 0 (black) to 1 (white)
+    """
+    linear = colorinterface.LINEAR_COMPONENTS
+    return (0.2126 * linear[color[0]] + 0.7152 * linear[color[1]] +
+            0.0722 * linear[color[2]])
+
+def contrast_ratio(color1, color2):
+    """
+    Get the WCAG contrast ratio between two colors.
+
+    Returns
+    -------
+    float
+        the ratio, from 1 (identical luminance) to 21 (black on white)
+    """
+    lum1 = relative_luminance(color1)
+    lum2 = relative_luminance(color2)
+    return (max(lum1, lum2) + 0.05) / (min(lum1, lum2) + 0.05)
+
+def scheme_failures(scheme):
+    """
+    Check every pair in AUDIT_PAIRS for a single scheme.
+
+    Parameters
+    ----------
+    scheme : colorinterface.ColorScheme or list
+        the colors to check
+
+    Returns
+    -------
+    list
+        (pair label, ratio, minimum ratio) tuples for the pairs below
+        their minimum ratio
+    """
+    data = colorinterface.ColorScheme.from_colors(scheme).data
+    colors = [data[x:x + 3] for x in range(0, len(data), 3)]
+    failures = []
+    for label, foreground, background, min_ratio in AUDIT_PAIRS:
+        ratio = contrast_ratio(colors[foreground], colors[background])
+        if ratio < min_ratio:
+            failures.append((label, ratio, min_ratio))
+    return failures
+
+def audit_schemes(schemes, limit=None):
+    """
+    Find the least readable color pairs across many schemes.
+
+    Parameters
+    ----------
+    schemes : dict
+        maps names (e.g. session names or theme file paths) to
+        ColorSchemes or color lists
+    limit : int, optional
+        the maximum number of findings to return
+
+    Returns
+    -------
+    list
+        (name, pair label, ratio, minimum ratio) tuples for every pair
+        below its minimum ratio, worst (lowest ratio) first
+    """
+    failures_by_scheme = {}
+    findings = []
+    for name, scheme in schemes.items():
+        scheme = colorinterface.ColorScheme.from_colors(scheme)
+        failures = failures_by_scheme.get(scheme)
+        if failures is None:
+            failures = failures_by_scheme[scheme] = scheme_failures(scheme)
+        findings.extend((name, label, ratio, min_ratio)
+                        for label, ratio, min_ratio in failures)
+
+    if limit is not None:
+        return heapq.nsmallest(limit, findings, key=lambda x: (x[2], x[0]))
+    return sorted(findings, key=lambda x: (x[2], x[0]))
+
+def audit_sessions(store=None, limit=None):
+    """
+    Audit the colors of every PuTTY session in a store.
+
+    Returns
+    -------
+    tuple
+        the findings, as returned by audit_schemes, and a dict mapping
+        each session whose colors couldn't be read to an error message
+    """
+    schemes, problems = colorinterface.read_all_session_colors(store)
+    errors = {name: '; '.join(messages)
+              for name, messages in problems.items()}
+    return audit_schemes(schemes, limit), errors
+
+def audit_theme_directory(directory, limit=None):
+    """
+    Audit every theme file in a directory.
+
+    Returns
+    -------
+    tuple
+        the findings, as returned by audit_schemes, and a dict mapping
+        each unreadable theme file to its error message
+    """
+    library = themelibrary.ThemeLibrary().scan(directory)
+    return audit_schemes(library.themes, limit), library.errors
+
+def write_report(findings, out, report_format='csv'):
+    """
+    Write findings out one at a time.
+
+    Parameters
+    ----------
+    findings : iterable
+        the findings, as returned by audit_schemes
+    out : file
+        the text file to write to
+    report_format : string, optional
+        'csv' for a CSV file with a header row, or 'json' for one JSON
+        object per line
+    """
+    if report_format == 'csv':
+        writer = csv.writer(out, lineterminator='\n')
+        writer.writerow(['name', 'pair', 'ratio', 'min_ratio'])
+        for name, label, ratio, min_ratio in findings:
+            writer.writerow([name, label, '{0:.2f}'.format(ratio), min_ratio])
+    elif report_format == 'json':
+        for name, label, ratio, min_ratio in findings:
+            out.write(json.dumps({'name': name, 'pair': label,
+                                  'ratio': round(ratio, 2),
+                                  'min_ratio': min_ratio}) + '\n')
+    else:
+        raise ValueError('Unknown report format: {0}'.format(report_format))
+
+def main(argv=None):
+    """
+    Audit sessions or theme files from the command line and write the
+    report to standard output. Sessions are read from the registry (or
+    a .reg file with --reg-file), and theme files with --themes.
+    """
+    parser = argparse.ArgumentParser(
+        description='Report PuTTY color pairs with poor contrast.')
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--themes', metavar='DIR',
+                        help='audit the theme files in DIR')
+    source.add_argument('--reg-file', metavar='FILE',
+                        help='audit the sessions in a .reg export')
+    parser.add_argument('--limit', type=int,
+                        help='report at most this many findings')
+    parser.add_argument('--format', choices=['csv', 'json'], default='csv')
+    args = parser.parse_args(argv)
+
+    if args.themes:
+        findings, problems = audit_theme_directory(args.themes, args.limit)
+    else:
+        store = sessionstore.RegFileSessionStore(args.reg_file) \
+            if args.reg_file else None
+        findings, problems = audit_sessions(store, args.limit)
+
+    write_report(findings, sys.stdout, args.format)
+    for name in sorted(problems):
+        sys.stderr.write('Could not read {0}: {1}\n'.format(
+            name, problems[name]))
+    return 1 if findings else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
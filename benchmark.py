@@ -0,0 +1,331 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import colorinterface
+import sessionstore
+import themelibrary
+
+"""
+benchmark.py
+
+This file times the operations that get slower as the number of PuTTY
+sessions grows: enumerating sessions, reading and applying colors,
+exporting and importing .reg and theme INI files, and populating the
+GUI's session list. Everything runs against synthetic sessions held in
+a MemorySessionStore or RegFileSessionStore, so no registry is needed.
+
+The results are written as JSON, one entry per (size, operation), so
+that runs from different releases can be compared:
+
+    python benchmark.py --sizes 10 1000 --output results.json
+"""
+
+DEFAULT_SIZES = [10, 1000, 10000, 100000]
+DEFAULT_REPEAT = 3
+# Theme directories are capped at this many files by default, since
+# writing 100k small files says more about the file system than about
+# this application.
+DEFAULT_MAX_THEMES = 10000
+# The number of distinct color schemes shared by the synthetic sessions.
+SCHEME_COUNT = 50
+RESULTS_VERSION = 2
+
+def random_scheme(rng):
+    """
+    Create a random color list.
+
+    Parameters
+    ----------
+    rng : random.Random
+        the random number generator to use
+
+    Returns
+    -------
+    list
+        a list of RGB integer tuples, in PUTTY_COLOR_ORDER order
+    """
+    return [(rng.randrange(256), rng.randrange(256), rng.randrange(256))
+            for _ in colorinterface.PUTTY_COLOR_ORDER]
+
+def synthetic_sessions(count, seed=0):
+    """
+    Create the values of synthetic PuTTY sessions. The sessions share
+    SCHEME_COUNT color schemes and hold a few other settings, like
+    real sessions do.
+
+    Returns
+    -------
+    dict
+        maps session names to dicts of value names and (data, type)
+        tuples, as accepted by sessionstore.MemorySessionStore
+    """
+    rng = random.Random(seed)
+    schemes = [colorinterface.build_color_values(random_scheme(rng))
+               for _ in range(SCHEME_COUNT)]
+    sessions = {}
+    for x in range(count):
+        values = dict(schemes[x % SCHEME_COUNT])
+        values['HostName'] = ('host{0}.example.com'.format(x),
+                              sessionstore.REG_SZ)
+        values['PortNumber'] = (22, sessionstore.REG_DWORD)
+        sessions['session%20{0:06d}'.format(x)] = values
+    return sessions
+
+def time_operation(operation, repeat, setup=None):
+    """
+    Time a callable several times.
+
+    Parameters
+    ----------
+    operation : callable
+        called with the value returned by setup, or with no arguments
+    repeat : int
+        the number of times to run it
+    setup : callable, optional
+        called before each run, outside of the timing
+
+    Returns
+    -------
+    list
+        the time of each run, in seconds
+    """
+    timings = []
+    for run in range(repeat):
+        if setup is None:
+            start = time.perf_counter()
+            operation()
+        else:
+            argument = setup(run)
+            start = time.perf_counter()
+            operation(argument)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+class BenchmarkRun(object):
+    """
+    the results of a benchmark run
+
+    Attributes
+    ----------
+    results : list
+        one dict per (size, operation), holding the item count and the
+        best, median and individual timings in seconds
+    """
+
+    def __init__(self, repeat=DEFAULT_REPEAT, max_themes=DEFAULT_MAX_THEMES):
+        self.repeat = repeat
+        self.max_themes = max_themes
+        self.results = []
+
+    def record(self, size, operation, items, timings=None, skipped=None):
+        """
+        Add the timings of one operation; skipped gives the reason an
+        operation couldn't be run instead.
+        """
+        entry = {'size': size, 'operation': operation, 'items': items}
+        if skipped is not None:
+            entry['skipped'] = skipped
+        else:
+            best = min(timings)
+            entry.update({
+                'best': best,
+                'median': statistics.median(timings),
+                'timings': timings,
+                'per_item_us': best / items * 1e6 if items else None,
+            })
+        self.results.append(entry)
+        return entry
+
+    def run_size(self, size, work_dir, progress=None):
+        """
+        Run every benchmark for one number of sessions.
+
+        Parameters
+        ----------
+        size : int
+            the number of synthetic sessions
+        work_dir : string
+            an empty directory for the benchmark's files
+        progress : callable, optional
+            called with each result entry as it is recorded
+        """
+        def record(*args, **kwargs):
+            entry = self.record(size, *args, **kwargs)
+            if progress is not None:
+                progress(entry)
+
+        repeat = self.repeat
+        store = sessionstore.MemorySessionStore(synthetic_sessions(size))
+        session_names = store.get_session_names()
+        rng = random.Random(size)
+        # Different colors for every run, so each apply writes.
+        apply_schemes = [random_scheme(rng) for _ in range(repeat)]
+
+        record('enumerate', size, time_operation(
+            lambda: colorinterface.get_all_session_names(store), repeat))
+        record('read_session_colors', size, time_operation(
+            lambda: [colorinterface.read_session_colors(x, store)
+                     for x in session_names], repeat))
+        record('read_all_session_colors', size, time_operation(
+            lambda: colorinterface.read_all_session_colors(store), repeat))
+        record('write_session_colors', size, time_operation(
+            lambda colors: [colorinterface.write_session_colors(x, colors,
+                                                                store)
+                            for x in session_names],
+            repeat, lambda run: apply_schemes[run]))
+        record('apply_colors_to_sessions', size, time_operation(
+            lambda colors: colorinterface.apply_colors_to_sessions(
+                session_names, colors, store),
+            repeat, lambda run: apply_schemes[-1 - run]))
+        record('apply_unchanged', size, time_operation(
+            lambda: colorinterface.apply_colors_to_sessions(
+                session_names, apply_schemes[0], store), repeat))
+
+        reg_path = os.path.join(work_dir, 'sessions.reg')
+
+        def export_setup(run):
+            reg_store = sessionstore.RegFileSessionStore(reg_path)
+            for session_name, values in store.iter_session_values():
+                reg_store.add_session(session_name, values)
+            return reg_store
+
+        record('export_reg', size, time_operation(
+            lambda reg_store: reg_store.flush(), repeat, export_setup))
+        record('import_reg', size, time_operation(
+            lambda: sessionstore.RegFileSessionStore(reg_path), repeat))
+
+        theme_count = min(size, self.max_themes)
+        theme_dir = os.path.join(work_dir, 'themes')
+        os.mkdir(theme_dir)
+        theme_rng = random.Random(theme_count)
+        theme_colors = [random_scheme(theme_rng) for _ in range(theme_count)]
+        theme_paths = [os.path.join(theme_dir, 'theme{0:06d}.ini'.format(x))
+                       for x in range(theme_count)]
+        record('write_colors_to_INI', theme_count, time_operation(
+            lambda: [colorinterface.write_colors_to_INI(path, colors,
+                                                        color_names=True)
+                     for path, colors in zip(theme_paths, theme_colors)],
+            repeat))
+
+        def read_themes():
+            return [colorinterface.read_colors_from_INI(x)
+                    for x in theme_paths]
+
+        def cold_cache(run):
+            # Reads go through the shared theme resolver, which would
+            # otherwise answer every run after the first from its cache.
+            colorinterface.get_theme_resolver().invalidate()
+
+        record('read_colors_from_INI', theme_count, time_operation(
+            lambda _: read_themes(), repeat, cold_cache))
+        record('theme_library_scan', theme_count, time_operation(
+            lambda _: themelibrary.ThemeLibrary().scan(theme_dir), repeat,
+            cold_cache))
+        # The same reads when the files haven't changed since they were
+        # last read, so only need to be checked.
+        read_themes()
+        record('read_colors_from_INI_cached', theme_count, time_operation(
+            read_themes, repeat))
+        record('theme_library_scan_cached', theme_count, time_operation(
+            lambda: themelibrary.ThemeLibrary().scan(theme_dir), repeat))
+        colorinterface.get_theme_resolver().invalidate()
+
+        self._run_gui(size, session_names, record)
+
+    def _run_gui(self, size, session_names, record):
+        """
+        a helper method that times populating the GUI's session list;
+        it is skipped when Tkinter or a display isn't available
+        """
+        try:
+            import colorgui
+        except ImportError as e:
+            record('session_list_index', size, skipped=str(e))
+            record('session_list_populate', size, skipped=str(e))
+            return
+
+        record('session_list_index', size, time_operation(
+            lambda: colorgui.SessionNameIndex(session_names), self.repeat))
+        try:
+            root = colorgui.tk.Tk()
+        except colorgui.tk.TclError as e:
+            record('session_list_populate', size, skipped=str(e))
+            return
+        try:
+            def populate():
+                widget = colorgui.ConfigDisplayWidget(root, session_names)
+                widget.pack()
+                root.update()
+                widget.destroy()
+
+            record('session_list_populate', size,
+                   time_operation(populate, self.repeat))
+        finally:
+            root.destroy()
+
+    def to_json(self):
+        """
+        Get the results, along with details of the machine they came
+        from, as a JSON-compatible dict.
+        """
+        return {
+            'version': RESULTS_VERSION,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': self.repeat,
+            'results': self.results,
+        }
+
+def main(argv=None):
+    """
+    Run the benchmarks from the command line, printing a summary to
+    standard error and writing the JSON results to --output (standard
+    output by default).
+    """
+    parser = argparse.ArgumentParser(
+        description='Time PuTTY Color Manager operations at scale.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='the numbers of sessions to benchmark')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help='the number of times to run each operation')
+    parser.add_argument('--max-themes', type=int, default=DEFAULT_MAX_THEMES,
+                        help='the most theme files to generate')
+    parser.add_argument('--output', metavar='FILE',
+                        help='write the JSON results to FILE')
+    args = parser.parse_args(argv)
+
+    def report(entry):
+        if 'skipped' in entry:
+            summary = 'skipped ({0})'.format(entry['skipped'])
+        else:
+            summary = '{0:.4f}s'.format(entry['best'])
+        sys.stderr.write('{0:>7} {1:<28} {2}\n'.format(
+            entry['size'], entry['operation'], summary))
+
+    run = BenchmarkRun(args.repeat, args.max_themes)
+    for size in args.sizes:
+        work_dir = tempfile.mkdtemp(prefix='puttycolorbench')
+        try:
+            run.run_size(size, work_dir, report)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = json.dumps(run.to_json(), indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(results + '\n')
+    else:
+        sys.stdout.write(results + '\n')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
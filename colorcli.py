@@ -0,0 +1,362 @@
+import argparse
+import json
+import sys
+
+import colorinterface
+import journal
+import sessionstore
+import settings
+
+"""
+colorcli.py
+
+This file is a command line interface for scripting color changes
+across many PuTTY sessions, e.g. from login scripts or configuration
+management. It never imports tkinter, and only imports what it needs,
+so that it starts quickly. Every command writes JSON to standard
+output:
+
+    list                      the names of the sessions
+    show                      the colors of the sessions
+    apply THEME               write the colors from a theme INI file to
+                              the sessions, as one transaction
+    export                    write the colors of the sessions to a
+                              file that import accepts
+    import FILE               write the colors from an export back, as
+                              one transaction
+    copy SOURCE               copy other settings (e.g. --settings font
+                              keepalive) from one session to the
+                              sessions, as one transaction
+
+Sessions are chosen by name, by --sessions glob patterns (matched
+against both the registry form of the name and the form with spaces),
+or by reading names from standard input, one per line, when a name is
+given as -. Without any of these, list, show and export cover every
+session.
+"""
+
+EXPORT_FORMAT = 'puttycolormanager-colors'
+EXPORT_VERSION = 1
+
+def registry_name(session_name):
+    """
+    Convert a session name as shown to users (with spaces) into the
+    form used in the registry, where spaces are written as %20.
+    """
+    return session_name.replace(' ', '%20')
+
+def select_sessions(store, names=None, patterns=None, stdin=None):
+    """
+    Work out which sessions a command applies to.
+
+    Parameters
+    ----------
+    store : sessionstore.SessionStore
+        the store that holds the sessions
+    names : list, optional
+        session names; a name of - is replaced by the names read from
+        stdin, one per line
+    patterns : list, optional
+        glob patterns; every session matching any of them is included
+    stdin : file, optional
+        where to read names from; by default, sys.stdin
+
+    Returns
+    -------
+    list
+        the registry names of the selected sessions, without duplicates,
+        or None when neither names nor patterns were given
+    """
+    if not names and not patterns:
+        return None
+    selected = []
+    for name in names or []:
+        if name == '-':
+            stdin = stdin if stdin is not None else sys.stdin
+            selected.extend(registry_name(line.strip()) for line in stdin
+                            if line.strip())
+        else:
+            selected.append(registry_name(name))
+    if patterns:
+        selected.extend(settings.match_session_names(
+            store.get_session_names(), patterns))
+    return list(dict.fromkeys(selected))
+
+def read_colors(store, session_names):
+    """
+    Read the colors of the selected sessions, reading every session in
+    one pass when session_names is None.
+
+    Returns
+    -------
+    tuple
+        a dict mapping session names to ColorSchemes, and a dict
+        mapping the sessions that couldn't be read to error messages
+    """
+    if session_names is None:
+        schemes, problems = colorinterface.read_all_session_colors(store)
+        return schemes, {session_name: '; '.join(messages)
+                         for session_name, messages in problems.items()}
+    schemes = {}
+    errors = {}
+    for session_name in session_names:
+        try:
+            schemes[session_name] = colorinterface.ColorScheme.intern(
+                colorinterface.read_session_colors(session_name, store))
+        except (KeyError, ValueError) as e:
+            errors[session_name] = str(e).strip('"\'')
+    return schemes, errors
+
+def result_to_json(result):
+    """
+    Convert a colorinterface.BulkApplyResult into a JSON-compatible
+    dict.
+    """
+    return {
+        'changed': result.sessions_with_status(colorinterface.APPLY_CHANGED),
+        'unchanged': result.sessions_with_status(
+            colorinterface.APPLY_UNCHANGED),
+        'failed': {session_name: str(error).strip('"\'')
+                   for session_name, error in result.errors.items()},
+        'write_count': result.write_count,
+        'rolled_back': result.rolled_back,
+    }
+
+def _history(store):
+    """
+    a helper function that creates the ApplyHistory that writes go
+    through, rolling back anything left unfinished by an earlier run
+    """
+    history_journal = None
+    if store.location is not None:
+        history_journal = journal.Journal(journal.default_journal_path())
+    history = journal.ApplyHistory(store, history_journal)
+    history.recover()
+    return history
+
+def command_list(args, store):
+    """
+    List the names of the selected sessions that exist.
+
+    Returns
+    -------
+    tuple
+        the JSON output and the exit status, as do the other command
+        functions
+    """
+    session_names = select_sessions(store, args.names, args.sessions)
+    if session_names is None:
+        return store.get_session_names(), 0
+    existing = set(store.get_session_names())
+    return [x for x in session_names if x in existing], 0
+
+def command_show(args, store):
+    """
+    Show the colors of the selected sessions, by color name.
+    """
+    session_names = select_sessions(store, args.names, args.sessions)
+    schemes, errors = read_colors(store, session_names)
+    sessions = {}
+    for session_name, scheme in schemes.items():
+        sessions[session_name] = {
+            color_name: colorinterface.pack_registry_colors(color)
+            for color_name, color
+            in zip(colorinterface.PUTTY_COLOR_ORDER, scheme)}
+    return {'sessions': sessions, 'errors': errors}, 1 if errors else 0
+
+def command_apply(args, store):
+    """
+    Write the colors from a theme file to the selected sessions, or
+    with --dry-run, report which sessions would change.
+    """
+    session_names = select_sessions(store, args.names, args.sessions)
+    if not session_names:
+        raise ValueError('No sessions selected; use --sessions or names.')
+    try:
+        colors = colorinterface.read_colors_from_INI(args.theme)
+    except KeyError:
+        raise ValueError('{0} has no [{1}] section.'.format(
+            args.theme, colorinterface.COLOR_INI_SECTION_NAME))
+    reg_values = colorinterface.build_color_values(colors)
+    session_values = [(session_name, reg_values)
+                      for session_name in session_names]
+
+    if args.dry_run:
+        changes, result = journal.plan_changes(session_values, store,
+                                               args.workers)
+        output = result_to_json(result)
+        output['changed'] = sorted(changes)
+        output['unchanged'] = [x for x in output['unchanged']
+                               if x not in changes]
+        return output, 1 if result.errors else 0
+
+    result = _history(store).apply(session_values, args.workers)
+    return result_to_json(result), 1 if result.errors else 0
+
+def command_export(args, store):
+    """
+    Export the colors of the selected sessions, as the registry values
+    that hold them.
+    """
+    session_names = select_sessions(store, args.names, args.sessions)
+    schemes, errors = read_colors(store, session_names)
+    sessions = {}
+    for session_name, scheme in schemes.items():
+        sessions[session_name] = {
+            name: data for name, (data, reg_type)
+            in colorinterface.build_color_values(scheme).items()}
+    export = {'format': EXPORT_FORMAT, 'version': EXPORT_VERSION,
+              'sessions': sessions}
+    if args.output in (None, '-'):
+        return export, 1 if errors else 0
+    with open(args.output, 'w') as export_file:
+        json.dump(export, export_file, indent=2)
+    return ({'exported': len(schemes), 'file': args.output,
+             'errors': errors}, 1 if errors else 0)
+
+def command_import(args, store):
+    """
+    Write the colors from an export back to the sessions it lists, or
+    to the selected ones among them.
+    """
+    if args.file == '-':
+        export = json.load(sys.stdin)
+    else:
+        with open(args.file) as export_file:
+            export = json.load(export_file)
+    if export.get('format') != EXPORT_FORMAT:
+        raise ValueError('{0} is not a color export.'.format(args.file))
+
+    wanted = select_sessions(store, args.names, args.sessions)
+    session_values = []
+    for session_name, colors in export['sessions'].items():
+        if wanted is not None and session_name not in wanted:
+            continue
+        try:
+            scheme = colorinterface.ColorScheme.from_colors(
+                [colorinterface.unpack_color(colors[name])
+                 for name in colorinterface.REG_COLOR_NAMES])
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError('Bad colors for {0} in {1}: {2}'.format(
+                session_name, args.file, e))
+        # Colors may be given as #rrggbb and the like, but PuTTY only
+        # reads them as red,green,blue.
+        session_values.append((session_name,
+                               colorinterface.build_color_values(scheme)))
+
+    result = _history(store).apply(session_values, args.workers)
+    return result_to_json(result), 1 if result.errors else 0
+
+def command_copy(args, store):
+    """
+    Copy settings from one session to the selected sessions, or with
+    --dry-run, report which sessions would change.
+    """
+    session_names = select_sessions(store, args.names, args.sessions)
+    if not session_names:
+        raise ValueError('No sessions selected; use --sessions or names.')
+    source = registry_name(args.source)
+    try:
+        values = settings.read_session_settings(source, args.settings, store)
+    except KeyError as e:
+        raise ValueError(str(e).strip('"\''))
+    session_values = [(session_name, values)
+                      for session_name in session_names
+                      if session_name != source]
+
+    if args.dry_run:
+        changes, result = journal.plan_changes(session_values, store,
+                                               args.workers)
+        output = result_to_json(result)
+        output['changed'] = sorted(changes)
+        output['unchanged'] = [x for x in output['unchanged']
+                               if x not in changes]
+        return output, 1 if result.errors else 0
+
+    result = _history(store).apply(session_values, args.workers)
+    return result_to_json(result), 1 if result.errors else 0
+
+def build_parser():
+    """
+    Create the argument parser for main.
+    """
+    parser = argparse.ArgumentParser(
+        description='Script color changes across PuTTY sessions.')
+    parser.add_argument('--reg-file', metavar='FILE',
+                        help=('work on the sessions in a .reg export instead '
+                              'of the registry'))
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND')
+    commands.required = True
+
+    def add_command(name, function, help_text, positional=None):
+        command = commands.add_parser(name, help=help_text)
+        command.set_defaults(function=function)
+        # A command's own positional argument comes before the names.
+        if positional is not None:
+            command.add_argument(positional[0], metavar=positional[1],
+                                 help=positional[2])
+        command.add_argument('names', nargs='*', metavar='SESSION',
+                             help='session names, or - to read them from '
+                                  'standard input')
+        command.add_argument('--sessions', action='append', metavar='GLOB',
+                             help='select the sessions matching GLOB')
+        return command
+
+    add_command('list', command_list, 'list session names')
+    add_command('show', command_show, 'show session colors')
+    apply_command = add_command(
+        'apply', command_apply, 'apply a theme INI file to sessions',
+        ('theme', 'THEME', 'the theme INI file'))
+    apply_command.add_argument('--dry-run', action='store_true',
+                               help='report what would change')
+    export_command = add_command('export', command_export,
+                                 'export session colors')
+    export_command.add_argument('-o', '--output', metavar='FILE',
+                                help='write to FILE instead of standard '
+                                     'output')
+    import_command = add_command(
+        'import', command_import, 'import exported session colors',
+        ('file', 'FILE', 'the export file, or - for standard input'))
+    copy_command = add_command(
+        'copy', command_copy, 'copy settings from one session to others',
+        ('source', 'SOURCE', 'the session to copy from'))
+    copy_command.add_argument(
+        '--settings', nargs='+', required=True, metavar='NAME',
+        help='registry value names, or groups of them: {0}'.format(
+            ', '.join(sorted(settings.SETTING_GROUPS))))
+    copy_command.add_argument('--dry-run', action='store_true',
+                              help='report what would change')
+    for command in (apply_command, import_command, copy_command):
+        command.add_argument('--workers', type=int,
+                             default=colorinterface.DEFAULT_APPLY_WORKERS,
+                             help='the number of threads used for writing')
+    return parser
+
+def main(argv=None):
+    """
+    Run a command, writing its JSON output to standard output.
+
+    Returns
+    -------
+    int
+        the exit status: 0 on success, 1 when some sessions couldn't be
+        read or written, and 2 for bad arguments or input files
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.reg_file:
+        store = sessionstore.RegFileSessionStore(args.reg_file)
+    else:
+        store = colorinterface.get_session_store()
+
+    try:
+        output, status = args.function(args, store)
+    except (OSError, ValueError) as e:
+        sys.stderr.write('{0}: {1}\n'.format(parser.prog, e))
+        return 2
+    json.dump(output, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
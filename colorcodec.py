@@ -0,0 +1,335 @@
+import re
+
+"""
+colorcodec.py
+
+This file converts colors between RGB integer tuples and the text forms
+they are stored in. PuTTY stores each color in the registry as
+"red,green,blue"; colors may also be written as #rrggbb or as X11
+rgb:rr/gg/bb specifications, in theme files or on the command line.
+
+Decoding is strict: a color must have exactly three components, each
+from 0 to 255, so malformed values are reported instead of being
+written back to the registry. Values read from the registry must be in
+PuTTY's own form, since that is the only one PuTTY reads; the other
+forms are only accepted as input, and are always written out as
+"red,green,blue". Components are looked up in precomputed
+tables, and whole schemes, or the colors of many sessions at once, can
+be decoded or encoded in a single call, with errors that name the
+session and value (e.g. Colour5) at fault.
+"""
+
+# The text of each component value, as PuTTY writes it, and the same
+# followed by the separating comma.
+_COMPONENT_TEXT = [str(x) for x in range(256)]
+_LEADING_TEXT = [x + ',' for x in _COMPONENT_TEXT]
+# Maps the text of each component value to the value.
+_COMPONENT_VALUES = {text: x for x, text in enumerate(_COMPONENT_TEXT)}
+# Sequences that bytes accepts, but that aren't RGB tuples.
+_NOT_COLORS = (str, bytes, bytearray)
+_HEX_COLOR = re.compile(r'^#([0-9a-fA-F]{6})$')
+_X11_COLOR = re.compile(
+    r'^rgb:([0-9a-fA-F]{1,4})/([0-9a-fA-F]{1,4})/([0-9a-fA-F]{1,4})$',
+    re.IGNORECASE)
+
+def _decode_component(text, color_text):
+    """
+    a helper function that converts one component of a "red,green,blue"
+    color
+    """
+    value = _COMPONENT_VALUES.get(text)
+    if value is not None:
+        return value
+    text = text.strip()
+    value = _COMPONENT_VALUES.get(text)
+    if value is not None:
+        return value
+    # Not in its usual form, e.g. with leading zeros.
+    try:
+        value = int(text)
+    except ValueError:
+        raise ValueError('{0!r} is not a color: {1!r} is not an '
+                         'integer'.format(color_text, text))
+    if not 0 <= value <= 255:
+        raise ValueError('{0!r} is not a color: {1} is outside 0 to '
+                         '255'.format(color_text, value))
+    return value
+
+def decode_registry_color(text):
+    """
+    Convert a color in the "red,green,blue" form PuTTY uses in the
+    registry into an RGB tuple. Whitespace is allowed around the
+    numbers; no other form is accepted.
+
+    Parameters
+    ----------
+    text : string
+        the color as read from the registry
+
+    Returns
+    -------
+    tuple
+        a tuple containing the RGB values as integers
+
+    Raises
+    ------
+    ValueError
+        when the text doesn't have exactly three components or has a
+        component outside 0 to 255
+    """
+    if not isinstance(text, str):
+        raise ValueError('{0!r} is not a color: expected a string'.format(
+            text))
+    parts = text.split(',')
+    if len(parts) != 3:
+        raise ValueError('{0!r} is not a color: expected red,green,blue'
+                         .format(text))
+    return (_decode_component(parts[0], text),
+            _decode_component(parts[1], text),
+            _decode_component(parts[2], text))
+
+def decode_color(text):
+    """
+    Convert a color from text into an RGB tuple.
+
+    Parameters
+    ----------
+    text : string
+        the color as "red,green,blue" (the form PuTTY uses in the
+        registry; whitespace is allowed around the numbers), #rrggbb,
+        or rgb:r/g/b with one to four hex digits per component
+
+    Returns
+    -------
+    tuple
+        a tuple containing the RGB values as integers
+
+    Raises
+    ------
+    ValueError
+        when the text isn't in any of these forms, doesn't have exactly
+        three components, or has a component outside 0 to 255
+    """
+    if not isinstance(text, str):
+        raise ValueError('{0!r} is not a color: expected a string'.format(
+            text))
+    parts = text.split(',')
+    if len(parts) == 3:
+        return (_decode_component(parts[0], text),
+                _decode_component(parts[1], text),
+                _decode_component(parts[2], text))
+    if len(parts) != 1:
+        raise ValueError('{0!r} is not a color: expected 3 components, '
+                         'got {1}'.format(text, len(parts)))
+
+    stripped = text.strip()
+    match = _HEX_COLOR.match(stripped)
+    if match:
+        return tuple(bytes.fromhex(match.group(1)))
+    match = _X11_COLOR.match(stripped)
+    if match:
+        # Each component is scaled from its own number of hex digits.
+        return tuple((int(x, 16) * 255 + (16 ** len(x) - 1) // 2) //
+                     (16 ** len(x) - 1) for x in match.groups())
+    raise ValueError('{0!r} is not a color: expected red,green,blue, '
+                     '#rrggbb or rgb:rr/gg/bb'.format(text))
+
+def _pack_color(color):
+    """
+    a helper function that checks an RGB tuple and packs it into three
+    bytes, raising ValueError when it isn't three integers from 0 to
+    255
+    """
+    if isinstance(color, (int,) + _NOT_COLORS):
+        raise ValueError(color)
+    try:
+        # bytes does the range checking.
+        packed = bytes(color)
+    except TypeError:
+        raise ValueError(color)
+    if len(packed) != 3:
+        raise ValueError(color)
+    return packed
+
+def encode_color(color):
+    """
+    Convert an RGB tuple into the "red,green,blue" form PuTTY uses in
+    the registry.
+
+    Parameters
+    ----------
+    color : tuple
+        three integers from 0 to 255
+
+    Returns
+    -------
+    string
+        the color as text
+
+    Raises
+    ------
+    ValueError
+        when color isn't three integers from 0 to 255
+    """
+    try:
+        packed = _pack_color(color)
+    except ValueError:
+        raise ValueError('{0!r} is not a color: expected three integers '
+                         'from 0 to 255'.format(color))
+    return (_LEADING_TEXT[packed[0]] + _LEADING_TEXT[packed[1]] +
+            _COMPONENT_TEXT[packed[2]])
+
+def _value_label(pos, names, session_name):
+    """
+    a helper function that names the value at a position, for error
+    messages
+    """
+    label = names[pos] if names is not None else 'color {0}'.format(pos)
+    if session_name is not None:
+        label = '{0} of {1}'.format(label, session_name)
+    return label
+
+def decode_colors(texts, names=None, session_name=None, registry=False):
+    """
+    Decode a whole scheme at once.
+
+    Parameters
+    ----------
+    texts : iterable
+        the colors as text, in any of the forms decode_color accepts
+    names : list, optional
+        the names of the values the colors came from (e.g. Colour0), by
+        position, for error messages
+    session_name : string, optional
+        the session the colors came from, for error messages
+    registry : bool, optional
+        accept only the "red,green,blue" form, as for values read from
+        the registry (see decode_registry_color)
+
+    Returns
+    -------
+    bytes
+        the packed colors, three bytes (red, green, blue) per color, as
+        held by colorinterface.ColorScheme
+
+    Raises
+    ------
+    ValueError
+        when any color is malformed; the message names the value and
+        session
+    """
+    decode = decode_registry_color if registry else decode_color
+    packed = bytearray()
+    for pos, text in enumerate(texts):
+        try:
+            packed.extend(decode(text))
+        except ValueError as e:
+            raise ValueError('{0}: {1}'.format(
+                _value_label(pos, names, session_name), e))
+    return bytes(packed)
+
+def encode_colors(colors, names=None, session_name=None):
+    """
+    Encode a whole scheme at once.
+
+    Parameters
+    ----------
+    colors : bytes or iterable
+        packed colors (e.g. colorinterface.ColorScheme.data), which are
+        always valid, or RGB tuples
+    names : list, optional
+        as in decode_colors
+    session_name : string, optional
+        as in decode_colors
+
+    Returns
+    -------
+    list
+        the colors in the "red,green,blue" form
+
+    Raises
+    ------
+    ValueError
+        when any color isn't three integers from 0 to 255; the message
+        names the value and session
+    """
+    if isinstance(colors, (bytes, bytearray)):
+        leading = _LEADING_TEXT
+        last = _COMPONENT_TEXT
+        return [leading[red] + leading[green] + last[blue]
+                for red, green, blue in zip(colors[0::3], colors[1::3],
+                                            colors[2::3])]
+    colors = list(colors)
+    try:
+        # The common case is checked in one pass; bytes does the range
+        # checking.
+        if all(len(color) == 3 and not isinstance(color, _NOT_COLORS)
+               for color in colors):
+            return encode_colors(bytes([x for color in colors
+                                        for x in color]))
+    except (TypeError, ValueError):
+        pass
+    # Find the color at fault.
+    packed = bytearray()
+    for pos, color in enumerate(colors):
+        try:
+            packed.extend(_pack_color(color))
+        except ValueError:
+            raise ValueError('{0}: {1!r} is not a color: expected three '
+                             'integers from 0 to 255'.format(
+                                 _value_label(pos, names, session_name),
+                                 color))
+    return encode_colors(packed)
+
+def iter_decode_sessions(session_values, names):
+    """
+    Decode the colors of many sessions, one session at a time. Each
+    distinct color string is decoded only once across all sessions.
+    The values are registry values, so only the "red,green,blue" form
+    is accepted (see decode_registry_color).
+
+    Parameters
+    ----------
+    session_values : iterable
+        (session_name, reg_values) pairs, where reg_values maps
+        registry value names to (data, type) tuples, as returned by
+        sessionstore.SessionStore.iter_session_values
+    names : list
+        the names of the values holding the colors, in order
+
+    Returns
+    -------
+    generator
+        yields (session_name, packed, problems) tuples, where packed is
+        the session's packed colors, as returned by decode_colors, or
+        None when problems (a list of messages naming the values) says
+        why they couldn't be decoded
+    """
+    decoded = {}
+    for session_name, reg_values in session_values:
+        colors = []
+        problems = []
+        for name in names:
+            reg_value = reg_values.get(name)
+            if reg_value is None:
+                problems.append('{0} is missing'.format(name))
+                continue
+            text = reg_value[0]
+            try:
+                color = decoded.get(text)
+            except TypeError:
+                # Not hashable, so certainly not a color string.
+                color = None
+            if color is None:
+                try:
+                    color = bytes(decode_registry_color(text))
+                except ValueError as e:
+                    problems.append('{0} is malformed: {1}'.format(name, e))
+                    continue
+                decoded[text] = color
+            colors.append(color)
+
+        if problems:
+            yield session_name, None, problems
+        else:
+            yield session_name, b''.join(colors), []
@@ -1,33 +1,207 @@
 
+import argparse
+import bisect
+import collections
+import os
+import queue
+import sys
+import threading
+import time
 import tkinter as tk
 from tkinter import filedialog
+from tkinter import font as tkfont
 from tkinter import messagebox
+from tkinter import ttk
 
 import colorinterface
+import journal
+import preview
+import profiling
+import sessionstore
+import similarity
+import snapshot
+import themelibrary
+import transforms
+import watcher
 
 """
 colorgui.py
 
 This file contains the classes that create the main UI and allow user
-interaction. It consists of three main components: the configuration
+interaction. It consists of four main components: the configuration
 display (ConfigDisplayWidget), the color values display
-(ColorValuesWidget), and the buttons (ButtonFrame). There are currently
-four supported actions for interaction with PuTTY sessions: loading one
-of the currently-selected PuTTY sessions as the colors in the entry
-fields, loading the colors from a file, applying the colors from the
-entry fields to the currently-selected PuTTY sessions, and saving the
-entered color values to a file.
+(ColorValuesWidget), the buttons (ButtonFrame) and the status bar
+(StatusBar). There are currently nine supported actions for
+interaction with PuTTY sessions: loading one of the currently-selected
+PuTTY sessions as the colors in the entry fields, loading the colors
+from a file, finding the theme file closest to the entered colors,
+browsing a directory of theme files (ThemeLibraryWindow),
+applying the colors from the entry fields to the currently-selected
+PuTTY sessions, transforming the colors of the currently-selected PuTTY
+sessions (TransformWindow), undoing and redoing those changes, saving
+the entered color values to a file, and selecting every PuTTY session
+that uses the entered colors. Slow actions run in the background
+(BackgroundTask), with their progress shown in the status bar, and
+sessions changed by other programs while the window is open are
+patched into the display as they change (watcher.SessionWatcher).
+Thumbnails of the entered colors, the selected session and the
+selected library theme are drawn on a background thread
+(preview.ThumbnailRenderer) and cached by scheme.
 """
 
+# How often, in milliseconds, the GUI checks on background tasks.
+TASK_POLL_MS = 100
+# How often, in milliseconds, the GUI checks for sessions changed by
+# something else (see watcher.SessionWatcher).
+WATCH_POLL_MS = 500
+# How often, in milliseconds, the GUI collects finished preview
+# thumbnails.
+PREVIEW_POLL_MS = 50
+# The number of themes on either side of the selected one in the theme
+# library whose thumbnails are drawn ahead of time.
+PREVIEW_PREFETCH_ROWS = 10
+# The number of sessions listed under each outcome in the dialogs that
+# report on a bulk write.
+MAX_LISTED_SESSIONS = 10
+# The number of themes listed by the "Find Closest Theme" action.
+CLOSEST_THEME_COUNT = 5
+# The number of session list rows shown before the window is resized.
+SESSION_LIST_ROWS = 20
+# The number of session list rows scrolled by one mouse wheel step.
+MOUSE_WHEEL_ROWS = 3
+# The event.state bits set while Shift and Control are held down.
+SHIFT_MASK = 0x0001
+CONTROL_MASK = 0x0004
+
+class SessionNameIndex(object):
+    """
+    a substring index over PuTTY session names, used to filter the
+    session list as the user types
+    
+    Names are matched case-insensitively against their display form
+    (i.e. with %20 shown as a space). Every three-character sequence in
+    each name is indexed, so a search only has to check the names that
+    contain all of the query's three-character sequences. When a query
+    extends the previous one, only the previous matches are checked.
+    Names can be added and removed without indexing the rest again.
+    Names are kept in the session store's order (see
+    sessionstore.session_sort_key).
+    """
+    
+    def __init__(self, session_names):
+        """
+        Parameters
+        ----------
+        session_names : list
+            the registry-style PuTTY session names to index
+        """
+        self.session_names = sorted(session_names,
+                                    key=sessionstore.session_sort_key)
+        self._folded = {}
+        self._trigrams = {}
+        for name in self.session_names:
+            self._index_name(name)
+        self._last_query = ''
+        self._last_matches = self.session_names
+        
+    def _index_name(self, name):
+        """
+        a helper method that adds a name's three-character sequences
+        to the index
+        """
+        folded = self._folded[name] = display_name(name).lower()
+        for start in range(len(folded) - 2):
+            self._trigrams.setdefault(folded[start:start + 3],
+                                      set()).add(name)
+            
+    def add(self, session_name):
+        """
+        Add a name to the index, keeping session_names sorted.
+        """
+        if session_name in self._folded:
+            return
+        bisect.insort(self.session_names, session_name,
+                      key=sessionstore.session_sort_key)
+        self._index_name(session_name)
+        self._last_query = ''
+        
+    def remove(self, session_name):
+        """
+        Remove a name from the index. Names that aren't indexed are
+        ignored.
+        """
+        folded = self._folded.pop(session_name, None)
+        if folded is None:
+            return
+        pos = bisect.bisect_left(self.session_names,
+                                 sessionstore.session_sort_key(session_name),
+                                 key=sessionstore.session_sort_key)
+        # Names that differ only in case sort together.
+        pos = self.session_names.index(session_name, pos)
+        del self.session_names[pos]
+        # A name can contain the same sequence more than once.
+        for trigram in {folded[x:x + 3] for x in range(len(folded) - 2)}:
+            postings = self._trigrams[trigram]
+            postings.discard(session_name)
+            if not postings:
+                del self._trigrams[trigram]
+        self._last_query = ''
+        
+    def search(self, query):
+        """
+        Find the session names that contain some text.
+        
+        Parameters
+        ----------
+        query : string
+            the text to look for; an empty string matches every name
+        
+        Returns
+        -------
+        list
+            the matching registry-style names, in sorted order
+        """
+        query = query.lower()
+        if not query:
+            candidates = self.session_names
+        elif self._last_query and self._last_query in query:
+            candidates = self._last_matches
+        elif len(query) >= 3:
+            postings = sorted((self._trigrams.get(query[x:x + 3], set())
+                               for x in range(len(query) - 2)), key=len)
+            candidates = sorted(postings[0].intersection(*postings[1:]),
+                                key=sessionstore.session_sort_key)
+        else:
+            candidates = self.session_names
+        
+        folded = self._folded
+        matches = [name for name in candidates if query in folded[name]]
+        self._last_query = query
+        self._last_matches = matches
+        return list(matches)
+
+def display_name(session_name):
+    """
+    Convert a registry-style PuTTY session name into the form shown in
+    the UI, where %20 is shown as a space.
+    """
+    return session_name.replace('%20', ' ')
+
 class ConfigDisplayWidget(tk.Frame):
     """
     a Tkinter widget for displaying the list of PuTTY configurations
     
-    It contains a Tkinter Listbox, whose values are the names of the
-    PuTTY sessions found in the Windows registry. Spaces, which are
-    expressed as %20 in the registry, are converted to actually spaces
-    for the display. The selection of multiple PuTTY sessions is
-    allowed.
+    It contains a filter entry above a Tkinter Listbox, whose values are
+    the names of the PuTTY sessions found in the Windows registry that
+    contain the filter text. Spaces, which are expressed as %20 in the
+    registry, are converted to actually spaces for the display. The
+    selection of multiple PuTTY sessions is allowed, and selections are
+    kept when the filter changes.
+    
+    The Listbox only ever holds the rows that are currently visible;
+    the scrollbar and mouse wheel move a window over the full list of
+    matching sessions, so the number of sessions doesn't affect how
+    long the list takes to display or scroll.
     """
     
     def __init__(self, master, session_names):
@@ -43,31 +217,198 @@ class ConfigDisplayWidget(tk.Frame):
         """
         tk.Frame.__init__(self, master)
         self.master = master
-        self.session_names = session_names
+        self._index = SessionNameIndex(session_names)
+        # Shared with the index, which keeps it sorted as sessions are
+        # added and removed.
+        self.session_names = self._index.session_names
+        self.selected = set()
+        self._matches = self.session_names
+        self._top = 0
+        self._visible_rows = SESSION_LIST_ROWS
+        
+        self.filter_text = tk.StringVar(self)
+        self.filter_text.trace_add('write', lambda *args: self.refilter())
+        filter_entry = tk.Entry(self, textvariable=self.filter_text)
+        filter_entry.pack(fill=tk.X)
         
+        list_frame = tk.Frame(self)
+        self.scrollbar = tk.Scrollbar(list_frame, command=self._scroll)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.session_list = tk.Listbox(
-            self, selectmode=tk.EXTENDED)
+            list_frame, selectmode=tk.EXTENDED, exportselection=False,
+            height=SESSION_LIST_ROWS)
+        self.session_list.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        list_frame.pack(fill=tk.BOTH, expand=True)
         
-        for name in self.session_names:
-            session_display_name = name.replace('%20', ' ')
-            self.session_list.insert(tk.END, session_display_name)
-
-        self.session_list.pack(fill=tk.BOTH, expand=True)
+        # Shows a thumbnail of the selected session's colors.
+        self.preview_label = tk.Label(self)
+        self.preview_label.pack()
+        
+        self.session_list.bind('<ButtonPress-1>', self._on_click)
+        self.session_list.bind('<<ListboxSelect>>', self._on_select)
+        self.session_list.bind('<Configure>', self._on_resize)
+        self.session_list.bind('<MouseWheel>', self._on_mouse_wheel)
+        self.session_list.bind('<Button-4>', self._on_mouse_wheel)
+        self.session_list.bind('<Button-5>', self._on_mouse_wheel)
+        
+        self._render()
+        
+    def _render(self):
+        """
+        a helper method that fills the Listbox with the rows in the
+        visible window and updates the scrollbar to match
+        """
+        with profiling.get_profiler().timed('tk.render_session_list'):
+            total = len(self._matches)
+            self._top = max(0, min(self._top, total - self._visible_rows))
+            visible = self._matches[self._top:self._top + self._visible_rows]
+            
+            self.session_list.delete(0, tk.END)
+            if visible:
+                self.session_list.insert(
+                    tk.END, *[display_name(x) for x in visible])
+            for row, name in enumerate(visible):
+                if name in self.selected:
+                    self.session_list.selection_set(row)
+            
+            if total:
+                self.scrollbar.set(self._top / total,
+                                   (self._top + len(visible)) / total)
+            else:
+                self.scrollbar.set(0, 1)
+                
+    def _scroll(self, action, amount, unit=None):
+        """
+        a helper method that handles scrollbar commands, which either
+        move to a fraction of the list or scroll by units or pages
+        """
+        if action == 'moveto':
+            self._top = int(float(amount) * len(self._matches))
+        else:
+            step = self._visible_rows if unit == 'pages' else 1
+            self._top += int(amount) * step
+        self._render()
+        
+    def _on_mouse_wheel(self, event):
+        """
+        a helper method that scrolls the list with the mouse wheel
+        """
+        if event.num == 4 or getattr(event, 'delta', 0) > 0:
+            self._scroll('scroll', -MOUSE_WHEEL_ROWS)
+        else:
+            self._scroll('scroll', MOUSE_WHEEL_ROWS)
+        return 'break'
+        
+    def _on_resize(self, event):
+        """
+        a helper method that works out how many rows fit in the Listbox
+        after it has been resized
+        """
+        row_height = tkfont.Font(
+            font=self.session_list.cget('font')).metrics('linespace') + 1
+        visible_rows = max(1, event.height // row_height)
+        if visible_rows != self._visible_rows:
+            self._visible_rows = visible_rows
+            self._render()
+            
+    def _on_click(self, event):
+        """
+        a helper method that drops the selection of rows that are
+        scrolled or filtered out of view when a plain click (i.e.
+        without Shift or Control) starts a new selection
+        """
+        if not event.state & (SHIFT_MASK | CONTROL_MASK):
+            self.selected.clear()
+            
+    def _on_select(self, event):
+        """
+        a helper method that copies the Listbox's selection of the
+        visible rows into the full selection
+        """
+        visible = self._matches[self._top:self._top + self._visible_rows]
+        for row, name in enumerate(visible):
+            if self.session_list.selection_includes(row):
+                self.selected.add(name)
+            else:
+                self.selected.discard(name)
+                
+    def refilter(self):
+        """
+        Show only the sessions that contain the current filter text.
+        """
+        self._matches = self._index.search(self.filter_text.get())
+        self._top = 0
+        self._render()
+        
+    def get_visible_selected(self):
+        """
+        Get the selected PuTTY sessions among the rows currently shown.
+        
+        Returns
+        -------
+        list
+            the registry-style names of the sessions, in the order they
+            are listed
+        """
+        visible = self._matches[self._top:self._top + self._visible_rows]
+        return [visible[row] for row in self.session_list.curselection()
+                if row < len(visible)]
         
     def get_selected(self):
         """
-        Get the currently selected PuTTY sessions. The names from the
-        Listbox are converted back into their registry format (i.e.
-        spaces are converted back into %20).
+        Get the currently selected PuTTY sessions. This includes
+        sessions that are hidden by the filter.
         
         Returns
         -------
         list
             a list of strings, each element corresponding to the
-            registry-style name of a selected PuTTY session
+            registry-style name of a selected PuTTY session, in the
+            order they are listed
+        """
+        return [x for x in self.session_names if x in self.selected]
+    
+    def set_selected(self, session_names):
+        """
+        Replace the current selection. Sessions that aren't in the list
+        are ignored.
+        
+        Parameters
+        ----------
+        session_names : iterable
+            the registry-style names of the sessions to select
+        """
+        self.selected = set(session_names).intersection(self.session_names)
+        self._render()
+    
+    def update_sessions(self, added, removed, renamed=()):
+        """
+        Add, remove and rename PuTTY sessions, patching the index and
+        keeping the scroll position, filter and selection.
+        
+        Parameters
+        ----------
+        added : list
+            the registry-style names of new sessions
+        removed : list
+            the registry-style names of sessions that no longer exist
+        renamed : list, optional
+            (old name, new name) tuples; a renamed session stays
+            selected under its new name
         """
-        return [self.session_list.get(x).replace(' ', '%20')
-                for x in self.session_list.curselection()]
+        for old_name, new_name in renamed:
+            self._index.remove(old_name)
+            self._index.add(new_name)
+            if old_name in self.selected:
+                self.selected.discard(old_name)
+                self.selected.add(new_name)
+        for name in removed:
+            self._index.remove(name)
+            self.selected.discard(name)
+        for name in added:
+            self._index.add(name)
+        self._matches = self._index.search(self.filter_text.get())
+        self._render()
 
 class ColorValuesFrame(tk.Frame):
     """
@@ -160,7 +501,8 @@ class ColorValuesWidget(tk.Frame):
     a Tkinter widget for displaying all color inputs
     
     It is a series of ColorValuesFrame components stacked on top of each
-    other.
+    other, under a thumbnail of the colors. A <<ColorsChanged>> event is
+    generated whenever the colors are loaded or edited.
     """
     
     def __init__(self, master):
@@ -175,11 +517,20 @@ class ColorValuesWidget(tk.Frame):
         self.master = master
         self.color_inputs = {}
         
+        self.preview_label = tk.Label(self)
+        self.preview_label.pack()
+        
         # Create the column for the inputs.
         for num, color in enumerate(colorinterface.PUTTY_COLOR_ORDER):
             next_input_group = ColorValuesFrame(self, color)
             next_input_group.pack(fill=tk.X)
             self.color_inputs[color] = next_input_group
+            for color_input in (next_input_group.red_input,
+                                next_input_group.green_input,
+                                next_input_group.blue_input):
+                color_input.bind(
+                    '<KeyRelease>',
+                    lambda event: self.event_generate('<<ColorsChanged>>'))
             
     def load_colors(self, colors_list):
         """
@@ -199,6 +550,7 @@ class ColorValuesWidget(tk.Frame):
         for pos, color_tuple in enumerate(colors_list):
             color_name = colorinterface.PUTTY_COLOR_ORDER[pos]
             self.color_inputs[color_name].set_colors(color_tuple)
+        self.event_generate('<<ColorsChanged>>')
     
     def get_current_entry(self):
         """
@@ -225,7 +577,7 @@ class ColorInterface(tk.Frame):
     under the master Tk object.
     """
     
-    def __init__(self, master, session_names):
+    def __init__(self, master, session_names, store=None):
         """
         Parameters
         ----------
@@ -234,9 +586,39 @@ class ColorInterface(tk.Frame):
         session_names : list
             a list of PuTTY session names read from the Windows
             registry, each in the form of a string
+        store : sessionstore.SessionStore, optional
+            the store that holds the PuTTY sessions; by default, the
+            store from colorinterface.get_session_store is used
         """
         tk.Frame.__init__(self, master)
         self.master = master
+        self.store = (store if store is not None
+                      else colorinterface.get_session_store())
+        self.color_cache = colorinterface.SessionColorCache(self.store)
+        # Changes to sessions are made through the history, so that they
+        # can be rolled back and undone. Only stores that outlive the
+        # process get a journal.
+        history_journal = None
+        if self.store.location is not None:
+            history_journal = journal.Journal(journal.default_journal_path())
+        self.history = journal.ApplyHistory(self.store, history_journal)
+        # Built the first time sessions are selected by scheme.
+        self.scheme_index = None
+        self.theme_library = themelibrary.ThemeLibrary()
+        self.library_window = None
+        # Built the first time the closest theme is looked up.
+        self.similarity_index = None
+        # The session last loaded into the entry fields and its colors,
+        # so the fields can follow changes made to it elsewhere.
+        self.loaded_session = None
+        self.loaded_colors = None
+        # Started by watch_sessions.
+        self.watcher = None
+        self._watch_queue = queue.Queue()
+        # Draws the preview thumbnails; maps each waiting label's name to
+        # the label.
+        self.previews = preview.ThumbnailRenderer()
+        self._preview_labels = {}
         
         # Initialize the sub-widgets.
         display_frame = tk.Frame(self)
@@ -250,9 +632,21 @@ class ColorInterface(tk.Frame):
         # Initialize the button frame.
         button_frame = ButtonFrame(self)
         
-        # Add the display and button frames to the main frame.
+        # Initialize the status bar, which shows the progress of
+        # background tasks.
+        self.status_bar = StatusBar(self)
+        
+        # Add the display, button and status frames to the main frame.
         display_frame.pack()
         button_frame.pack()
+        self.status_bar.pack(fill=tk.X)
+        
+        self.color_values.bind('<<ColorsChanged>>',
+                               lambda event: self.preview_entries())
+        self.config_display.session_list.bind(
+            '<<ListboxSelect>>', lambda event: self.preview_selected(),
+            add='+')
+        self.after(PREVIEW_POLL_MS, self._poll_previews)
         
     def _invalid_inputs_message(self, dialog_title):
         """
@@ -273,6 +667,380 @@ class ColorInterface(tk.Frame):
             title=dialog_title,
             message='\n'.join(error_lines))
 
+    def _apply_errors_message(self, dialog_title, result):
+        """
+        a helper method that displays an error dialog listing the PuTTY
+        sessions that couldn't be written during a bulk apply
+        
+        Parameters
+        ----------
+        dialog_title : string
+            the text to display as the window title for the error dialog
+        result : colorinterface.BulkApplyResult
+            the result of the bulk apply
+        """
+        failed = sorted(result.errors)
+        error_lines = ['Could not apply the colors to {0} of {1} sessions:'
+                       .format(len(failed), len(result.statuses)), '']
+        for session_name in failed[:MAX_LISTED_SESSIONS]:
+            error_lines.append('{0}: {1}'.format(
+                display_name(session_name), result.errors[session_name]))
+        if len(failed) > MAX_LISTED_SESSIONS:
+            error_lines.append('...and {0} more'.format(
+                len(failed) - MAX_LISTED_SESSIONS))
+        if result.rolled_back:
+            error_lines.extend(['', 'No sessions were changed.'])
+        messagebox.showerror(
+            title=dialog_title,
+            message='\n'.join(error_lines))
+
+    def _cancelled_message(self, dialog_title, result):
+        """
+        a helper method that reports a cancelled bulk write, which may
+        have written some sessions before it was cancelled
+        
+        Parameters
+        ----------
+        dialog_title : string
+            the text to display as the window title for the dialog
+        result : colorinterface.BulkApplyResult
+            the result of the cancelled write
+        """
+        written = result.sessions_with_status(colorinterface.APPLY_CHANGED)
+        if not result.write_count:
+            self.status_bar.show_message(
+                'Cancelled; no sessions were changed.')
+        elif result.rolled_back:
+            self.status_bar.show_message(
+                ('Cancelled; the {0} sessions already written were rolled '
+                 'back, so no sessions were changed.').format(len(written)))
+        else:
+            self._apply_summary_message(dialog_title, result, written)
+        
+    def _apply_summary_message(self, dialog_title, result, session_names):
+        """
+        a helper method that displays a dialog listing which sessions
+        were and weren't written during a bulk apply, by outcome
+        
+        Parameters
+        ----------
+        dialog_title : string
+            the text to display as the window title for the dialog
+        result : colorinterface.BulkApplyResult
+            the result of the bulk apply
+        session_names : list
+            the sessions the apply was asked to write
+        """
+        changed = result.sessions_with_status(colorinterface.APPLY_CHANGED)
+        unchanged = result.sessions_with_status(
+            colorinterface.APPLY_UNCHANGED)
+        failed = sorted(result.errors)
+        skipped = [x for x in session_names if x not in result.statuses]
+        
+        if result.rolled_back and not result.write_count:
+            summary = [('The apply was {0} before any sessions were '
+                        'written; no sessions were changed.').format(
+                            'cancelled' if result.cancelled else 'stopped')]
+            changed_heading = 'Not written'
+        elif result.rolled_back:
+            summary = [('The apply was {0}, so the {1} sessions already '
+                        'written were rolled back; no sessions were '
+                        'changed.').format(
+                            'cancelled' if result.cancelled else 'stopped',
+                            len(changed))]
+            changed_heading = 'Written, then rolled back'
+        elif result.cancelled or failed:
+            summary = [('The apply was {0}, and the sessions already '
+                        'written could not be rolled back.').format(
+                            'cancelled' if result.cancelled else 'stopped')]
+            changed_heading = 'Changed'
+        else:
+            summary = [('Applied the current color selection to the '
+                        'selected PuTTY sessions successfully ({0} values '
+                        'changed).').format(result.write_count)]
+            changed_heading = 'Changed'
+        
+        groups = [(changed_heading, changed, None),
+                  ('Already had these colors', unchanged, None),
+                  ('Failed', failed, result.errors),
+                  ('Not reached', skipped, None)]
+        for heading, names, errors in groups:
+            if not names:
+                continue
+            summary.extend(['', '{0} ({1}):'.format(heading, len(names))])
+            for session_name in names[:MAX_LISTED_SESSIONS]:
+                if errors is None:
+                    summary.append(display_name(session_name))
+                else:
+                    summary.append('{0}: {1}'.format(
+                        display_name(session_name), errors[session_name]))
+            if len(names) > MAX_LISTED_SESSIONS:
+                summary.append('...and {0} more'.format(
+                    len(names) - MAX_LISTED_SESSIONS))
+        
+        if failed or (result.cancelled and not result.rolled_back):
+            show = messagebox.showerror
+        else:
+            show = messagebox.showinfo
+        show(title=dialog_title, message='\n'.join(summary))
+
+    def run_task(self, description, work, on_done):
+        """
+        Run slow work (e.g. reading or writing many sessions) on a
+        background thread, showing its progress in the status bar. Only
+        one task runs at a time.
+        
+        Parameters
+        ----------
+        description : string
+            the text to show in the status bar while the task runs
+        work : callable
+            called as work(task) on the background thread, where task
+            is the BackgroundTask; its return value is passed to
+            on_done
+        on_done : callable
+            called as on_done(result) on the Tkinter thread when work
+            returns
+        
+        Returns
+        -------
+        bool
+            False when another task is still running, in which case
+            the user is told and nothing is started
+        """
+        if self.status_bar.task is not None:
+            messagebox.showerror(
+                title=description,
+                message=('Please wait for "{0}" to finish, or cancel '
+                         'it.').format(self.status_bar.description))
+            return False
+        
+        def on_error(e):
+            messagebox.showerror(
+                title=description,
+                message='{0} failed:\n\n{1}'.format(description, e))
+        
+        task = BackgroundTask(work, on_done, on_error)
+        self.status_bar.track(task, description)
+        task.start()
+        return True
+        
+    def reconcile_snapshot(self, entries, snapshot_path):
+        """
+        Check the sessions shown from a snapshot against the session
+        store on a background thread, then patch the session list with
+        any sessions that were added or removed and save the updated
+        snapshot.
+        
+        Parameters
+        ----------
+        entries : dict
+            the snapshot entries that the session list was built from,
+            as returned by snapshot.load_snapshot
+        snapshot_path : string
+            the file to save the updated snapshot to
+        """
+        for session_name, (write_time, scheme) in entries.items():
+            if scheme is not None:
+                self.color_cache.put(session_name, write_time, scheme)
+        
+        def reconcile(task):
+            outcome = snapshot.reconcile_snapshot(
+                entries, self.store, task.report_progress, task.cancel_event)
+            try:
+                snapshot.save_snapshot(snapshot_path, outcome[0],
+                                       self.store.location)
+            except OSError:
+                pass
+            return outcome
+        
+        def reconciled(outcome):
+            updated, changed, removed = outcome
+            added = [x for x in changed if x not in entries]
+            self.config_display.update_sessions(added, removed)
+            if self.scheme_index is not None:
+                for session_name in removed:
+                    self.scheme_index.remove_session(session_name)
+                for session_name in changed:
+                    if updated[session_name][1] is None:
+                        self.scheme_index.remove_session(session_name)
+                    else:
+                        self.scheme_index.set_scheme(
+                            session_name, updated[session_name][1])
+            if self.watcher is None:
+                self.watch_sessions(updated)
+        
+        self.run_task('Checking sessions', reconcile, reconciled)
+        
+    def watch_sessions(self, entries=None):
+        """
+        Start watching the session store for sessions that are added,
+        removed, renamed or recolored by something else, such as PuTTY
+        itself or a script, and patch the session list, the color cache
+        and the entry fields as they change.
+        
+        Parameters
+        ----------
+        entries : dict, optional
+            the (write_time, scheme) of every session currently shown,
+            as in snapshot entries; when omitted, the store is read once
+            in the background first
+        """
+        self.watcher = watcher.SessionWatcher(self.store, entries)
+        self.watcher.start(self._watch_queue.put, self._watch_queue.put)
+        self.after(WATCH_POLL_MS, self._poll_watcher)
+        
+    def _poll_watcher(self):
+        """
+        a helper method that applies the changes reported by the
+        watcher's thread on the Tkinter thread
+        """
+        try:
+            while True:
+                changes = self._watch_queue.get_nowait()
+                if isinstance(changes, Exception):
+                    self.status_bar.show_message(
+                        'Stopped watching for session changes: {0}'.format(
+                            changes))
+                    return
+                self.apply_session_changes(changes)
+        except queue.Empty:
+            pass
+        self.after(WATCH_POLL_MS, self._poll_watcher)
+        
+    def apply_session_changes(self, changes):
+        """
+        Patch the session list, the cached colors, the scheme index and
+        the entry fields with sessions that changed in the store. Only
+        the affected sessions are touched.
+        
+        Parameters
+        ----------
+        changes : watcher.SessionChanges
+            the sessions that changed
+        """
+        self.config_display.update_sessions(changes.added, changes.removed,
+                                            changes.renamed)
+        gone = changes.removed + [old for old, new in changes.renamed]
+        for session_name in gone:
+            self.color_cache.invalidate(session_name)
+            if self.scheme_index is not None:
+                self.scheme_index.remove_session(session_name)
+        for session_name, (write_time, scheme) in changes.entries.items():
+            if scheme is None:
+                self.color_cache.invalidate(session_name)
+                if self.scheme_index is not None:
+                    self.scheme_index.remove_session(session_name)
+            else:
+                self.color_cache.put(session_name, write_time, scheme)
+                if self.scheme_index is not None:
+                    self.scheme_index.set_scheme(session_name, scheme)
+        
+        for old_name, new_name in changes.renamed:
+            if self.loaded_session == old_name:
+                self.loaded_session = new_name
+        if self.loaded_session in changes.recolored:
+            scheme = changes.entries[self.loaded_session][1]
+            # Edits made in the entry fields since loading are kept.
+            try:
+                unedited = self.color_values.get_current_entry() == \
+                    self.loaded_colors
+            except ValueError:
+                unedited = False
+            if unedited and scheme is not None:
+                self.loaded_colors = scheme.to_list()
+                self.color_values.load_colors(self.loaded_colors)
+        self.status_bar.show_message(
+            'Picked up changes to {0} sessions.'.format(len(changes)))
+
+    def show_preview(self, label, get_scheme):
+        """
+        Show a thumbnail of a scheme in a label once it has been drawn
+        in the background. A later request for the same label replaces
+        this one.
+        
+        Parameters
+        ----------
+        label : tkinter.Label
+            the label to show the thumbnail in
+        get_scheme : callable
+            called with no arguments on the preview thread to get the
+            scheme, so it may read from the session store
+        """
+        self._preview_labels[str(label)] = label
+        self.previews.request(str(label), get_scheme)
+        
+    def prefetch_preview(self, key, get_scheme):
+        """
+        Draw a thumbnail in the background ahead of time, so it is
+        cached when it is shown.
+        
+        Parameters
+        ----------
+        key : hashable
+            identifies what the thumbnail is for, e.g. a theme's path
+        get_scheme : callable
+            as in show_preview
+        """
+        self.previews.request(('prefetch', key), get_scheme)
+        
+    def preview_entries(self):
+        """
+        Show a thumbnail of the colors in the entry fields, or nothing
+        while they are invalid.
+        """
+        label = self.color_values.preview_label
+        try:
+            scheme = colorinterface.ColorScheme.from_colors(
+                self.color_values.get_current_entry())
+        except ValueError:
+            self._preview_labels.pop(str(label), None)
+            self._set_thumbnail(label, None)
+            return
+        self.show_preview(label, lambda: scheme)
+        
+    def preview_selected(self):
+        """
+        Show a thumbnail of the colors of the first selected PuTTY
+        session in view. The session is read through the color cache,
+        so sessions that have been read before aren't read again.
+        """
+        selected = self.config_display.get_visible_selected()
+        if selected:
+            session_name = selected[0]
+            self.show_preview(
+                self.config_display.preview_label,
+                lambda: self.color_cache.get_colors(session_name))
+        
+    def _set_thumbnail(self, label, data):
+        """
+        a helper method that shows a drawn thumbnail in a label, or
+        "No preview" when data is None
+        """
+        if data is None:
+            label.config(image='', text='No preview')
+            label.image = None
+        else:
+            # The label doesn't keep the image alive by itself.
+            label.image = tk.PhotoImage(master=self, data=data,
+                                        format='ppm')
+            label.config(image=label.image, text='')
+        
+    def _poll_previews(self):
+        """
+        a helper method that shows the thumbnails drawn by the preview
+        thread on the Tkinter thread
+        """
+        for key, scheme, data, error in self.previews.poll():
+            label = self._preview_labels.get(key)
+            if label is None:
+                continue
+            if not label.winfo_exists():
+                del self._preview_labels[key]
+                continue
+            self._set_thumbnail(label, data)
+        self.after(PREVIEW_POLL_MS, self._poll_previews)
+        
     def load_selected(self):
         """
         Read the colors of the first (as in highest in the Listbox)
@@ -283,8 +1051,16 @@ class ColorInterface(tk.Frame):
         curr_selections = self.config_display.get_selected()
         if curr_selections:
             used_session = curr_selections[0]
-            session_colors = colorinterface.read_session_colors(used_session)
-            self.color_values.load_colors(session_colors)
+            
+            def loaded(colors):
+                self.loaded_session = used_session
+                self.loaded_colors = list(colors)
+                self.color_values.load_colors(colors)
+            
+            self.run_task(
+                'Load Selected',
+                lambda task: self.color_cache.get_colors(used_session),
+                loaded)
         
     def load_from_file(self):
         """
@@ -297,21 +1073,19 @@ class ColorInterface(tk.Frame):
         dialog_title = 'Load From File'
         filename = filedialog.askopenfilename()
         if filename:
-            try:
-                colors_list = colorinterface.read_colors_from_INI(filename)
-                self.color_values.load_colors(colors_list)
-            except KeyError:
-                messagebox.showerror(
-                    title=dialog_title,
-                    message=('Malformed INI file. Please ensure that the file '
-                             'contains the color definitions in a section '
-                             'called "{0}"').format(
-                                 colorinterface.COLOR_INI_SECTION_NAME))
-            except Exception as e:
-                messagebox.showerror(
-                    title=dialog_title,
-                    message='Could not load colors from {0}:\n\n{1}'.format(
-                        filename, e))
+            # The file may be on a slow network share, or extend a chain
+            # of other theme files, so it is read in the background.
+            def read(task):
+                try:
+                    return colorinterface.read_colors_from_INI(filename)
+                except KeyError:
+                    raise ValueError(
+                        ('Malformed INI file. Please ensure that the file '
+                         'contains the color definitions in a section '
+                         'called "{0}"').format(
+                             colorinterface.COLOR_INI_SECTION_NAME))
+            
+            self.run_task(dialog_title, read, self.color_values.load_colors)
         
     def apply_to_selected(self):
         """
@@ -330,15 +1104,245 @@ class ColorInterface(tk.Frame):
                     title=dialog_title,
                     message='Please select one or more PuTTY sessions.')
             else:
-                for selection in curr_selections:
-                    colorinterface.write_session_colors(
-                        selection, colors_from_inputs)
-                messagebox.showinfo(
-                    title=dialog_title,
-                    message=('Applied the current color selection to the '
-                             'selected PuTTY sessions successfully.'))
+                def apply_colors(task):
+                    return self.history.apply_colors(
+                        curr_selections, colors_from_inputs,
+                        progress=task.report_progress,
+                        cancel_event=task.cancel_event)
+                
+                def applied(result):
+                    if self.scheme_index is not None and \
+                       not result.rolled_back:
+                        self.scheme_index.update_from_apply(
+                            result, colors_from_inputs)
+                    self._apply_summary_message(dialog_title, result,
+                                                curr_selections)
+                
+                self.run_task(dialog_title, apply_colors, applied)
+        except ValueError:
+            self._invalid_inputs_message(dialog_title)
+        
+    def select_matching(self):
+        """
+        Select every PuTTY session whose colors are exactly the colors
+        in the entry fields. The sessions are looked up in a
+        colorinterface.SchemeUsageIndex, which is built in the
+        background the first time. This is the logic that is run when
+        the "Select Matching" button is pressed.
+        """
+        dialog_title = 'Select Matching'
+        try:
+            scheme = colorinterface.ColorScheme.from_colors(
+                self.color_values.get_current_entry())
+        except ValueError:
+            self._invalid_inputs_message(dialog_title)
+            return
+        
+        def select(index):
+            self.scheme_index = index
+            matches = index.sessions_using(scheme)
+            self.config_display.set_selected(matches)
+            self.status_bar.show_message(
+                'Selected {0} sessions using these colors.'.format(
+                    len(matches)))
+        
+        if self.scheme_index is not None:
+            select(self.scheme_index)
+        else:
+            self.run_task(
+                dialog_title,
+                lambda task: colorinterface.SchemeUsageIndex.build(
+                    self.store, task.report_progress),
+                select)
+        
+    def load_library(self):
+        """
+        Ask the user for a directory of theme INI files, read all of
+        them in the background and show them in a ThemeLibraryWindow.
+        This is the logic that is run when the "Load Library" button is
+        pressed.
+        """
+        directory = filedialog.askdirectory()
+        if directory:
+            self._scan_library(directory)
+            
+    def rescan_library(self):
+        """
+        Read the theme library directory again; only the files that
+        have changed since the last scan are parsed.
+        """
+        if self.theme_library.directory is not None:
+            self._scan_library(self.theme_library.directory)
+            
+    def _scan_library(self, directory):
+        """
+        a helper method that scans a theme directory in the background
+        and then shows the library window
+        """
+        def scanned(library):
+            if self.library_window is not None and \
+               self.library_window.winfo_exists():
+                self.library_window.show_library(library)
+                self.library_window.lift()
+            else:
+                self.library_window = ThemeLibraryWindow(self, library)
+        
+        self.run_task(
+            'Load Library',
+            lambda task: self.theme_library.scan(
+                directory, progress=task.report_progress,
+                cancel_event=task.cancel_event),
+            scanned)
+        
+    def find_closest_theme(self):
+        """
+        Find the themes in the theme library that look the most like
+        the colors in the entry fields, and offer to load the closest
+        one. When no library has been loaded yet, the user is asked for
+        a directory first. The similarity.ThemeSimilarityIndex is
+        built in the background, once per scan of the library. This is
+        the logic that is run when the "Find Closest Theme" button is
+        pressed.
+        """
+        dialog_title = 'Find Closest Theme'
+        try:
+            scheme = colorinterface.ColorScheme.from_colors(
+                self.color_values.get_current_entry())
         except ValueError:
             self._invalid_inputs_message(dialog_title)
+            return
+        directory = self.theme_library.directory
+        if directory is None:
+            directory = filedialog.askdirectory()
+            if not directory:
+                return
+        index = self.similarity_index
+        
+        def find(task):
+            library = self.theme_library
+            if library.directory is None:
+                library.scan(directory, progress=task.report_progress,
+                             cancel_event=task.cancel_event)
+            themes = library.themes
+            found_index = index
+            if found_index is None or found_index.themes is not themes:
+                found_index = similarity.ThemeSimilarityIndex(themes)
+            return found_index, found_index.nearest(scheme,
+                                                    CLOSEST_THEME_COUNT)
+        
+        def found(outcome):
+            self.similarity_index, matches = outcome
+            if not matches:
+                messagebox.showinfo(
+                    title=dialog_title,
+                    message='There are no themes in {0}.'.format(directory))
+                return
+            lines = ['{0}  (difference {1:.1f})'.format(
+                os.path.relpath(path, directory), distance)
+                     for path, distance in matches]
+            if messagebox.askyesno(
+                    title=dialog_title,
+                    message=('The closest themes are:\n\n{0}\n\nLoad the '
+                             'closest theme?').format('\n'.join(lines))):
+                self.color_values.load_colors(
+                    self.similarity_index.themes[matches[0][0]])
+        
+        self.run_task(dialog_title, find, found)
+        
+    def show_transforms(self):
+        """
+        Open the window for transforming the colors of the selected
+        PuTTY sessions. This is the logic that is run when the
+        "Transform" button is pressed.
+        """
+        TransformWindow(self)
+        
+    def transform_selected(self, transform):
+        """
+        Apply a color transform to every selected PuTTY session in the
+        background, writing only the colors that change.
+        
+        Parameters
+        ----------
+        transform : transforms.ColorTransform
+            the transform to apply
+        """
+        dialog_title = 'Transform Selected'
+        curr_selections = self.config_display.get_selected()
+        if not curr_selections:
+            messagebox.showerror(
+                title=dialog_title,
+                message='Please select one or more PuTTY sessions.')
+            return
+        
+        def transform_sessions(task):
+            return transforms.transform_sessions(
+                curr_selections, [transform],
+                progress=task.report_progress,
+                cancel_event=task.cancel_event, history=self.history)
+        
+        def transformed(outcome):
+            result, new_schemes = outcome
+            if self.scheme_index is not None and not result.rolled_back:
+                for session_name, status in result.statuses.items():
+                    if status != colorinterface.APPLY_FAILED:
+                        self.scheme_index.set_scheme(
+                            session_name, new_schemes[session_name])
+            if result.errors:
+                self._apply_errors_message(dialog_title, result)
+            elif result.cancelled:
+                self._cancelled_message(dialog_title, result)
+            else:
+                self.status_bar.show_message(
+                    'Transformed {0} sessions ({1} values changed).'.format(
+                        len(result.statuses), result.write_count))
+        
+        self.run_task(dialog_title, transform_sessions, transformed)
+        
+    def undo_apply(self):
+        """
+        Restore the colors changed by the most recent apply or
+        transform. This is the logic that is run when the "Undo" button
+        is pressed.
+        """
+        self._replay_history('Undo', self.history.undo, 'Undid',
+                             'There is nothing to undo.')
+        
+    def redo_apply(self):
+        """
+        Write the colors of the most recently undone apply or transform
+        again. This is the logic that is run when the "Redo" button is
+        pressed.
+        """
+        self._replay_history('Redo', self.history.redo, 'Redid',
+                             'There is nothing to redo.')
+        
+    def _replay_history(self, dialog_title, replay, done_verb, empty_message):
+        """
+        a helper method that runs an undo or redo in the background and
+        reports the outcome
+        """
+        def replayed(result):
+            if result is None:
+                self.status_bar.show_message(empty_message)
+                return
+            # Only some of each session's colors are known here, so the
+            # scheme index is rebuilt the next time it is needed.
+            self.scheme_index = None
+            if result.errors:
+                self._apply_errors_message(dialog_title, result)
+            elif result.cancelled:
+                self._cancelled_message(dialog_title, result)
+            else:
+                self.status_bar.show_message(
+                    '{0} the changes to {1} sessions ({2} values).'.format(
+                        done_verb, len(result.statuses), result.write_count))
+        
+        self.run_task(
+            dialog_title,
+            lambda task: replay(progress=task.report_progress,
+                                cancel_event=task.cancel_event),
+            replayed)
         
     def save_to_file(self):
         """
@@ -350,19 +1354,417 @@ class ColorInterface(tk.Frame):
         dialog_title = 'Save to File'
         try:
             colors_from_inputs = self.color_values.get_current_entry()
-            filename = filedialog.asksaveasfilename()
-            if filename:
-                colorinterface.write_colors_to_INI(filename, colors_from_inputs,
-                                                   color_names=True)
+        except ValueError:
+            self._invalid_inputs_message(dialog_title)
+            return
+        filename = filedialog.asksaveasfilename()
+        if filename:
+            def saved(result):
                 messagebox.showinfo(
                     title=dialog_title,
-                    message='Wrote colors to {0} successfully.'.format(filename))
-        except ValueError as e:
-            self._invalid_inputs_message(dialog_title)
+                    message='Wrote colors to {0} successfully.'.format(
+                        filename))
+            
+            # The file is written in the background, like every other
+            # action that does I/O.
+            self.run_task(
+                dialog_title,
+                lambda task: colorinterface.write_colors_to_INI(
+                    filename, colors_from_inputs, color_names=True),
+                saved)
+
+class BackgroundTask(object):
+    """
+    a piece of work run on a background thread on behalf of the GUI
+    
+    Tkinter widgets may only be used from the thread running the main
+    loop, so the work never touches them; instead, its result is handed
+    back through a queue and the callbacks are run from poll, which is
+    called on the Tkinter thread.
+    
+    Attributes
+    ----------
+    cancel_event : threading.Event
+        set when the user asks for the task to be cancelled; the work
+        is expected to check it and stop early
+    progress : tuple
+        the latest (done, total) pair reported by the work; total is
+        None when it isn't known
+    """
+    
+    def __init__(self, work, on_done, on_error=None):
+        """
+        Parameters
+        ----------
+        work : callable
+            called as work(task) on the background thread
+        on_done : callable
+            called as on_done(result) with work's return value
+        on_error : callable, optional
+            called as on_error(exception) when work raises
+        """
+        self.work = work
+        self.on_done = on_done
+        self.on_error = on_error
+        self.cancel_event = threading.Event()
+        self.progress = (0, None)
+        self._results = queue.Queue()
+        
+    def start(self):
+        """Start running the work on a new daemon thread."""
+        threading.Thread(target=self._run, daemon=True).start()
+        
+    def _run(self):
+        """
+        a helper method that runs the work and queues the callback to
+        run with its outcome
+        """
+        try:
+            self._results.put((self.on_done, self.work(self)))
         except Exception as e:
-            messagebox.showerror(
-                title=dialog_title,
-                message='Could not save the colors to file:\n\n{0}'.format(e))
+            self._results.put((self.on_error, e))
+            
+    def report_progress(self, done, total):
+        """
+        Record how far the work has got. This is safe to call from the
+        background thread.
+        """
+        self.progress = (done, total)
+        
+    def cancel(self):
+        """Ask the work to stop early."""
+        self.cancel_event.set()
+        
+    def poll(self):
+        """
+        Run the callback for the task's outcome if the work has
+        finished. This needs to be called on the Tkinter thread.
+        
+        Returns
+        -------
+        bool
+            True when the work has finished
+        """
+        try:
+            callback, value = self._results.get_nowait()
+        except queue.Empty:
+            return False
+        if callback is not None:
+            callback(value)
+        return True
+
+class StatusBar(tk.Frame):
+    """
+    a widget that shows the progress of the running BackgroundTask
+    
+    It consists of a description of the task, a progress bar and a
+    button that cancels the task. It is displayed at the very bottom of
+    the window. While profiling is enabled (see
+    profiling.enable_profiling), a second line shows where the
+    time went during the last task.
+    """
+    
+    def __init__(self, master):
+        """
+        Parameters
+        ----------
+        master : tkinter.Frame
+            the parent widget; this will be an instance of a
+            ColorInterface
+        """
+        tk.Frame.__init__(self, master)
+        self.master = master
+        self.task = None
+        self.description = ''
+        self._stats_before = None
+        self._started = None
+        
+        self.stats_text = tk.StringVar(self)
+        stats_label = tk.Label(self, textvariable=self.stats_text,
+                               anchor=tk.W)
+        stats_label.pack(side=tk.BOTTOM, fill=tk.X)
+        
+        self.status_text = tk.StringVar(self, value='Ready')
+        status_label = tk.Label(self, textvariable=self.status_text,
+                                anchor=tk.W)
+        status_label.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        
+        self.cancel_button = tk.Button(self, text='Cancel',
+                                       state=tk.DISABLED,
+                                       command=lambda: self._cancel())
+        self.cancel_button.pack(side=tk.RIGHT)
+        
+        self.progress_bar = ttk.Progressbar(self, length=150)
+        self.progress_bar.pack(side=tk.RIGHT)
+        
+    def track(self, task, description):
+        """
+        Show the progress of a task until it finishes.
+        
+        Parameters
+        ----------
+        task : BackgroundTask
+            the task to track
+        description : string
+            the text to show while the task runs
+        """
+        self.task = task
+        self.description = description
+        self._stats_before = None
+        self._started = time.perf_counter()
+        profiler = profiling.get_profiler()
+        if profiler.enabled:
+            self._stats_before = profiler.stats()
+        self.status_text.set(description + '...')
+        self.cancel_button.config(state=tk.NORMAL)
+        self.after(TASK_POLL_MS, self._poll)
+        
+    def _poll(self):
+        """
+        a helper method that updates the progress bar and checks
+        whether the tracked task has finished
+        """
+        task = self.task
+        done, total = task.progress
+        elapsed = time.perf_counter() - self._started
+        rate = ' ({0:.0f}/s)'.format(done / elapsed) if elapsed > 0 else ''
+        if total:
+            self.progress_bar.config(mode='determinate', maximum=total,
+                                     value=done)
+            self.status_text.set('{0}... {1} of {2}{3}'.format(
+                self.description, done, total, rate))
+        elif done:
+            self.progress_bar.config(mode='indeterminate')
+            self.progress_bar.step()
+            self.status_text.set('{0}... {1}{2}'.format(
+                self.description, done, rate))
+        
+        # Go back to idle before the task's callback runs, so that the
+        # callback can start another task.
+        self.task = None
+        finished = True
+        stats_before = self._stats_before
+        profiler = profiling.get_profiler()
+        try:
+            with profiler.timed('tk.task_callback'):
+                finished = task.poll()
+        finally:
+            if not finished:
+                self.task = task
+                self.after(TASK_POLL_MS, self._poll)
+            else:
+                if stats_before is not None and profiler.enabled:
+                    self.stats_text.set(profiler.summary(stats_before))
+                if self.task is None:
+                    self._reset()
+            
+    def _reset(self):
+        """
+        a helper method that puts the status bar back into its idle
+        state
+        """
+        self.description = ''
+        self.status_text.set('Ready')
+        self.progress_bar.config(mode='determinate', value=0)
+        self.cancel_button.config(state=tk.DISABLED)
+        
+    def show_message(self, message):
+        """
+        Show a message in place of the idle text until the next task
+        starts.
+        """
+        if self.task is None:
+            self.status_text.set(message)
+        
+    def _cancel(self):
+        """
+        The callback for the "Cancel" button.
+        """
+        if self.task is not None:
+            self.task.cancel()
+            self.status_text.set(self.description + '... cancelling')
+
+class ThemeLibraryWindow(tk.Toplevel):
+    """
+    a window for browsing the themes in a themelibrary.ThemeLibrary
+    
+    The themes that were read successfully are listed by their path
+    within the library directory; clicking one loads its colors into
+    the entry fields of the main window and shows its thumbnail, and the
+    thumbnails of the themes around it are drawn ahead of time. Files
+    that couldn't be read are listed underneath, along with the reason.
+    """
+    
+    def __init__(self, master, library):
+        """
+        Parameters
+        ----------
+        master : tkinter.Frame
+            the parent widget; this will be an instance of a
+            ColorInterface
+        library : themelibrary.ThemeLibrary
+            the scanned library to display
+        """
+        tk.Toplevel.__init__(self, master)
+        self.master = master
+        
+        self.theme_list = tk.Listbox(self, width=50, exportselection=False)
+        self.theme_list.pack(fill=tk.BOTH, expand=True)
+        self.theme_list.bind('<<ListboxSelect>>', self._on_select)
+        
+        self.preview_label = tk.Label(self)
+        self.preview_label.pack()
+        
+        self.summary_text = tk.StringVar(self)
+        summary = tk.Label(self, textvariable=self.summary_text, anchor=tk.W)
+        summary.pack(fill=tk.X)
+        
+        self.error_list = tk.Listbox(self, width=50, height=5,
+                                     exportselection=False)
+        self.error_list.pack(fill=tk.BOTH)
+        
+        rescan = tk.Button(self, text='Rescan',
+                           command=lambda: self.master.rescan_library())
+        rescan.pack(side=tk.RIGHT)
+        
+        self.show_library(library)
+        
+    def show_library(self, library):
+        """
+        Fill the window with the contents of a library.
+        
+        Parameters
+        ----------
+        library : themelibrary.ThemeLibrary
+            the scanned library to display
+        """
+        self.library = library
+        self.title('Theme Library - {0}'.format(library.directory))
+        self.theme_paths = []
+        self.theme_list.delete(0, tk.END)
+        self.error_list.delete(0, tk.END)
+        
+        theme_names = library.theme_names()
+        if theme_names:
+            self.theme_list.insert(tk.END, *[x[0] for x in theme_names])
+        self.theme_paths = [x[1] for x in theme_names]
+        
+        for path in sorted(library.errors):
+            self.error_list.insert(tk.END, '{0}: {1}'.format(
+                os.path.relpath(path, library.directory),
+                library.errors[path]))
+        self.summary_text.set(
+            '{0} themes, {1} files could not be read ({2} parsed)'.format(
+                len(library.themes), len(library.errors),
+                library.parsed_count))
+        
+    def _on_select(self, event):
+        """
+        a helper method that loads the selected theme into the main
+        window's entry fields
+        """
+        selection = self.theme_list.curselection()
+        if selection:
+            themes = self.library.themes
+            row = selection[0]
+            path = self.theme_paths[row]
+            # The newest requests are drawn first, so the nearest themes
+            # are requested last, after the farthest.
+            for offset in range(PREVIEW_PREFETCH_ROWS, 0, -1):
+                for nearby_row in (row - offset, row + offset):
+                    if 0 <= nearby_row < len(self.theme_paths):
+                        nearby = self.theme_paths[nearby_row]
+                        self.master.prefetch_preview(
+                            nearby, lambda nearby=nearby: themes[nearby])
+            self.master.show_preview(self.preview_label,
+                                     lambda: themes[path])
+            self.master.color_values.load_colors(themes[path])
+
+class TransformWindow(tk.Toplevel):
+    """
+    a window for applying a color transform (see transforms.py) to the
+    currently-selected PuTTY sessions
+    
+    It has a choice of operation, an amount for the operation and a
+    choice of which colors to change. Blending uses the colors in the
+    main window's entry fields as its target.
+    """
+    
+    # Maps each operation name to a function that creates its transform
+    # from the amount, the colors to change and the entry fields.
+    OPERATIONS = collections.OrderedDict([
+        ('Brightness (factor)',
+         lambda amount, colors, entry: transforms.brightness(amount, colors)),
+        ('Contrast (factor)',
+         lambda amount, colors, entry: transforms.contrast(amount, colors)),
+        ('Gamma',
+         lambda amount, colors, entry: transforms.gamma(amount, colors)),
+        ('Hue Shift (degrees)',
+         lambda amount, colors, entry: transforms.hsl_shift(
+             hue=amount, colors=colors)),
+        ('Saturation Shift (-1 to 1)',
+         lambda amount, colors, entry: transforms.hsl_shift(
+             saturation=amount, colors=colors)),
+        ('Lightness Shift (-1 to 1)',
+         lambda amount, colors, entry: transforms.hsl_shift(
+             lightness=amount, colors=colors)),
+        ('Blend Toward Entries (0 to 1)',
+         lambda amount, colors, entry: transforms.blend(
+             entry(), amount, colors)),
+        ('Invert',
+         lambda amount, colors, entry: transforms.invert(colors)),
+    ])
+    
+    def __init__(self, master):
+        """
+        Parameters
+        ----------
+        master : tkinter.Frame
+            the parent widget; this will be an instance of a
+            ColorInterface
+        """
+        tk.Toplevel.__init__(self, master)
+        self.master = master
+        self.title('Transform Selected')
+        
+        self.operation = tk.StringVar(self, value=next(iter(self.OPERATIONS)))
+        tk.OptionMenu(self, self.operation, *self.OPERATIONS).pack(fill=tk.X)
+        
+        amount_frame = tk.Frame(self)
+        tk.Label(amount_frame, text='Amount').pack(side=tk.LEFT)
+        self.amount_input = tk.Entry(amount_frame, width=10)
+        self.amount_input.insert(0, '0.9')
+        self.amount_input.pack(side=tk.RIGHT)
+        amount_frame.pack(fill=tk.X)
+        
+        self.color_group = tk.StringVar(self, value='All Colors')
+        tk.OptionMenu(self, self.color_group,
+                      *transforms.COLOR_GROUPS).pack(fill=tk.X)
+        
+        apply_button = tk.Button(self, text='Apply To Selected',
+                                 command=lambda: self._apply_callback())
+        apply_button.pack(side=tk.RIGHT)
+        
+    def _apply_callback(self):
+        """
+        The callback for the "Apply To Selected" button.
+        
+        See Also
+        --------
+        ColorInterface.transform_selected
+        """
+        dialog_title = 'Transform Selected'
+        make_transform = self.OPERATIONS[self.operation.get()]
+        colors = transforms.COLOR_GROUPS[self.color_group.get()]
+        try:
+            amount = float(self.amount_input.get() or 0)
+            transform = make_transform(
+                amount, colors, self.master.color_values.get_current_entry)
+        except ValueError as e:
+            messagebox.showerror(title=dialog_title, message=str(e),
+                                 parent=self)
+            return
+        self.master.transform_selected(transform)
 
 class ButtonFrame(tk.Frame):
     """
@@ -394,6 +1796,11 @@ class ButtonFrame(tk.Frame):
             command=lambda: self._load_from_file_callback())
         load_from_file.pack(side=tk.LEFT)
         
+        find_closest_theme = tk.Button(
+            self, text='Find Closest Theme',
+            command=lambda: self._find_closest_theme_callback())
+        find_closest_theme.pack(side=tk.LEFT)
+        
         apply_to_selected = tk.Button(
             self, text='Apply To Selected',
             command=lambda: self._apply_to_selected_callback())
@@ -404,6 +1811,31 @@ class ButtonFrame(tk.Frame):
             command=lambda: self._save_to_file_callback())
         save_to_file.pack(side=tk.LEFT)
         
+        load_library = tk.Button(
+            self, text='Load Library',
+            command=lambda: self._load_library_callback())
+        load_library.pack(side=tk.LEFT)
+        
+        transform = tk.Button(
+            self, text='Transform',
+            command=lambda: self._transform_callback())
+        transform.pack(side=tk.LEFT)
+        
+        select_matching = tk.Button(
+            self, text='Select Matching',
+            command=lambda: self._select_matching_callback())
+        select_matching.pack(side=tk.LEFT)
+        
+        undo = tk.Button(
+            self, text='Undo',
+            command=lambda: self._undo_callback())
+        undo.pack(side=tk.LEFT)
+        
+        redo = tk.Button(
+            self, text='Redo',
+            command=lambda: self._redo_callback())
+        redo.pack(side=tk.LEFT)
+        
     def _load_selected_callback(self):
         """
         The callback for the "Load Selected" button.
@@ -424,6 +1856,16 @@ class ButtonFrame(tk.Frame):
         """
         self.master.load_from_file()
         
+    def _find_closest_theme_callback(self):
+        """
+        The callback for the "Find Closest Theme" button.
+        
+        See Also
+        --------
+        ColorInterface.find_closest_theme
+        """
+        self.master.find_closest_theme()
+        
     def _apply_to_selected_callback(self):
         """
         The callback for the "Apply To Selected" button.
@@ -443,15 +1885,112 @@ class ButtonFrame(tk.Frame):
         ColorInterface.save_to_file
         """
         self.master.save_to_file()
+        
+    def _load_library_callback(self):
+        """
+        The callback for the "Load Library" button.
+        
+        See Also
+        --------
+        ColorInterface.load_library
+        """
+        self.master.load_library()
+        
+    def _transform_callback(self):
+        """
+        The callback for the "Transform" button.
+        
+        See Also
+        --------
+        ColorInterface.show_transforms
+        """
+        self.master.show_transforms()
+        
+    def _select_matching_callback(self):
+        """
+        The callback for the "Select Matching" button.
+        
+        See Also
+        --------
+        ColorInterface.select_matching
+        """
+        self.master.select_matching()
+        
+    def _undo_callback(self):
+        """
+        The callback for the "Undo" button.
+        
+        See Also
+        --------
+        ColorInterface.undo_apply
+        """
+        self.master.undo_apply()
+        
+    def _redo_callback(self):
+        """
+        The callback for the "Redo" button.
+        
+        See Also
+        --------
+        ColorInterface.redo_apply
+        """
+        self.master.redo_apply()
 
-def main():
-    """Initialize the window and enter the Tkinter main loop."""
+def main(argv=None):
+    """
+    Initialize the window and enter the Tkinter main loop. When the
+    session store has a snapshot from a previous run, the session list
+    is shown from the snapshot and checked against the store in the
+    background. Any change to the sessions left unfinished by an
+    earlier run is rolled back first.
+    
+    With --profile, every session store call, INI file access and Tk
+    update is timed, a summary is shown after each action, and the
+    timings are written out as JSON when the window is closed.
+    """
+    parser = argparse.ArgumentParser(description='Manage PuTTY colors.')
+    parser.add_argument('--profile', metavar='FILE', nargs='?', const='-',
+                        help=('time store, INI and Tk operations and write '
+                              'the results as JSON to FILE (standard error '
+                              'by default) on exit'))
+    args = parser.parse_args(argv)
+    profiling.enable_profiling(args.profile is not None)
+    
     top = tk.Tk()
     top.wm_title('PuTTY Color Manager')
-    interface = ColorInterface(top, colorinterface.get_all_session_names())
+    store = colorinterface.get_session_store()
+    snapshot_path = snapshot.default_snapshot_path()
+    entries = None
+    if store.location is not None:
+        entries = snapshot.load_snapshot(snapshot_path, store.location)
+    
+    if entries is not None:
+        session_names = sorted(entries, key=sessionstore.session_sort_key)
+    else:
+        session_names = colorinterface.get_all_session_names(store)
+    interface = ColorInterface(top, session_names, store)
     interface.pack()
+    restored, errors = interface.history.recover()
+    if restored or errors:
+        messagebox.showwarning(
+            title='PuTTY Color Manager',
+            message=('An earlier change to the PuTTY sessions did not finish. '
+                     'The colors of {0} sessions were restored; {1} sessions '
+                     'could not be restored.').format(restored, len(errors)))
+    if store.location is not None:
+        interface.reconcile_snapshot(entries or {}, snapshot_path)
+    else:
+        interface.watch_sessions()
     tk.mainloop()
+    if interface.watcher is not None:
+        interface.watcher.stop()
+    interface.previews.stop()
+    
+    if args.profile == '-':
+        sys.stderr.write(profiling.get_profiler().to_json() + '\n')
+    elif args.profile is not None:
+        with open(args.profile, 'w') as profile_file:
+            profile_file.write(profiling.get_profiler().to_json() + '\n')
 
 if __name__ == '__main__':
     main()
-
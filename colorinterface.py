@@ -1,16 +1,26 @@
 
+import collections
 import configparser
-import logging
-import winreg
+import os
+import threading
+import time
+import weakref
+
+import colorcodec
+import profiling
+import sessionstore
 
 """
 colorinterface.py
 
 This file acts as an interface for reading, writing, and manipulating
-the colors for PuTTY sessions held in the Windows registry.
+the colors for PuTTY sessions held in the Windows registry. The
+registry is reached through a session store (see sessionstore.py);
+every function that touches sessions accepts a store argument, and uses
+the store returned by get_session_store when it is omitted.
 """
 
-BASE_PUTTY_PATH = 'Software\\SimonTatham\\PuTTY\\Sessions\\'
+BASE_PUTTY_PATH = sessionstore.BASE_PUTTY_PATH
 PUTTY_COLOR_ORDER = ['Default Foreground',
                      'Default Bold Foreground',
                      'Default Background',
@@ -57,90 +67,358 @@ PUTTY_DEFAULT_COLORS = (
     (187, 187, 187), # 20
     (255, 255, 255)  # 21
 )
-PUTTY_REG_COLOR_TYPE = winreg.REG_SZ
-# Used in Windows Registry API calls, where the calls have reserved
-# parameters that are always set to zero.
-WINDOWS_RESERVED = 0
+# The registry value names for the colors, in PUTTY_COLOR_ORDER order.
+REG_COLOR_NAMES = ['Colour{0}'.format(color_number)
+                   for color_number in range(len(PUTTY_COLOR_ORDER))]
+PUTTY_REG_COLOR_TYPE = sessionstore.REG_SZ
+# The number of bytes used by a ColorScheme (three per color).
+SCHEME_SIZE = 3 * len(PUTTY_COLOR_ORDER)
 # The INI section name for color themes read from an INI file.
 COLOR_INI_SECTION_NAME = 'Colors'
+# The key in the color INI section that names the theme a theme file
+# extends, relative to the file's directory.
+THEME_EXTENDS_KEY = 'extends'
+# The number of threads used for bulk writes by default.
+DEFAULT_APPLY_WORKERS = 8
+# The number of sessions handed to a bulk write thread at a time.
+APPLY_CHUNK_SIZE = 64
+# The number of session color lists kept by SessionColorCache by default.
+DEFAULT_CACHE_SIZE = 4096
+# The per-session outcomes of a bulk write (see BulkApplyResult).
+APPLY_CHANGED = 'changed'
+APPLY_UNCHANGED = 'unchanged'
+APPLY_FAILED = 'failed'
+
+_session_store = None
+# Maps both color names and registry color names to their positions.
+_COLOR_POSITIONS = dict(
+    [(name, pos) for pos, name in enumerate(PUTTY_COLOR_ORDER)] +
+    [(name, pos) for pos, name in enumerate(REG_COLOR_NAMES)])
+# The shared schemes handed out by ColorScheme.intern.
+_interned_schemes = weakref.WeakValueDictionary()
+_interned_schemes_lock = threading.Lock()
+
+def get_session_store():
+    """
+    Get the session store used when no store is passed to the functions
+    in this file. It is created with sessionstore.default_store the
+    first time it is needed, and wrapped in a
+    sessionstore.ProfiledSessionStore.
+
+    Returns
+    -------
+    sessionstore.SessionStore
+        the default session store
+    """
+    global _session_store
+    if _session_store is None:
+        _session_store = sessionstore.ProfiledSessionStore(
+            sessionstore.default_store())
+    return _session_store
+
+def set_session_store(store):
+    """
+    Replace the session store used when no store is passed to the
+    functions in this file.
+
+    Parameters
+    ----------
+    store : sessionstore.SessionStore
+        the new default store, or None to go back to the platform
+        default
+    """
+    global _session_store
+    _session_store = store
+
+def color_position(color_name):
+    """
+    Get the position of a color in PUTTY_COLOR_ORDER.
+
+    Parameters
+    ----------
+    color_name : string
+        the name of the color, either as in PUTTY_COLOR_ORDER or as its
+        registry name (e.g. Colour0)
+
+    Returns
+    -------
+    int
+        the position of the color
+
+    Raises
+    ------
+    KeyError
+        when the name isn't a known color
+    """
+    try:
+        return _COLOR_POSITIONS[color_name]
+    except KeyError:
+        raise KeyError('Unknown color: {0}'.format(color_name))
 
 def unpack_color(color_val):
     """
     Get a RGB color tuple from a value packed as a string. The format is
     the format used by PuTTY in the Windows registry. Whitspace is
     allowed between integers.
-    
+
     Parameters
     ----------
     reg_values : string
         This is the value read from the registry. It is a string in the
-        format red,green,blue.
-    
+        format red,green,blue; #rrggbb and rgb:rr/gg/bb are accepted as
+        well.
+
     Returns
     -------
     tuple
         a tuple containing the RGB values as integers
-    
+
     Raises
     ------
     ValueError
-        when the input string a malformed
+        when the input string a malformed, i.e. doesn't have exactly
+        three components or has one outside 0 to 255
+
+    See Also
+    --------
+    colorcodec.decode_color
     """
-    return tuple([int(x.strip()) for x in color_val.split(',')])
+    return colorcodec.decode_color(color_val)
 
 def pack_registry_colors(color_list):
     """
     Converts RGB integer values into the format used by PuTTY to store
     colors in the Windows registry.
-    
+
     Parameters
     ----------
     color_list : list or tuple
         the collection of three integers that make up the RGB values for
         a color
-    
+
     Returns
     -------
     string
         color_list as a string in the format red,green,blue
+
+    Raises
+    ------
+    ValueError
+        when color_list isn't three integers from 0 to 255
     """
-    return ','.join([str(x) for x in color_list])
+    return colorcodec.encode_color(color_list)
+
+class ColorScheme(object):
+    """
+    an immutable, hashable set of the colors for a PuTTY session
+
+    The colors are held in a single bytes object of three bytes (red,
+    green, blue) per color, ordered as in PUTTY_COLOR_ORDER. A scheme
+    behaves like a read-only color list: iterating over it or indexing
+    it by position gives RGB integer tuples, and it can also be indexed
+    by the color's name in PUTTY_COLOR_ORDER or its registry name (e.g.
+    Colour0).
 
-def read_session_colors(session_name):
+    Identical schemes can share a single object through
+    ColorScheme.intern.
+    """
+
+    __slots__ = ('_data', '__weakref__')
+
+    def __init__(self, data):
+        """
+        Parameters
+        ----------
+        data : bytes
+            the packed colors; see ColorScheme.from_colors to create a
+            scheme from a color list
+
+        Raises
+        ------
+        ValueError
+            when data isn't exactly SCHEME_SIZE bytes long
+        """
+        data = bytes(data)
+        if len(data) != SCHEME_SIZE:
+            raise ValueError('A color scheme needs {0} bytes, not {1}'.format(
+                SCHEME_SIZE, len(data)))
+        object.__setattr__(self, '_data', data)
+
+    @classmethod
+    def from_colors(cls, color_list):
+        """
+        Create a scheme from a color list.
+
+        Parameters
+        ----------
+        color_list : list
+            a list of RGB integer tuples
+
+        Returns
+        -------
+        ColorScheme
+            the new scheme
+
+        Raises
+        ------
+        ValueError
+            when there aren't exactly as many colors as in
+            PUTTY_COLOR_ORDER, or a color isn't three integers in the
+            range 0 to 255
+
+        See Also
+        --------
+        read_session_colors for more information on the color list format
+        """
+        if isinstance(color_list, cls):
+            return color_list
+        colors = list(color_list)
+        if len(colors) != len(PUTTY_COLOR_ORDER):
+            raise ValueError('Expected {0} colors, got {1}'.format(
+                len(PUTTY_COLOR_ORDER), len(colors)))
+        for color_number, color in enumerate(colors):
+            if len(color) != 3 or not all(
+                    isinstance(x, int) and 0 <= x <= 255 for x in color):
+                raise ValueError(('{0} must be three integers from 0 to 255, '
+                                  'not {1}').format(
+                                      REG_COLOR_NAMES[color_number], color))
+        return cls(bytes(x for color in colors for x in color))
+
+    @classmethod
+    def intern(cls, scheme):
+        """
+        Get the shared instance of a scheme. While any session still
+        refers to it, every identical scheme interned afterwards is
+        the same object.
+
+        Parameters
+        ----------
+        scheme : ColorScheme or list
+            a scheme or a color list
+
+        Returns
+        -------
+        ColorScheme
+            the shared scheme with the same colors
+        """
+        scheme = cls.from_colors(scheme)
+        with _interned_schemes_lock:
+            shared = _interned_schemes.get(scheme._data)
+            if shared is None:
+                _interned_schemes[scheme._data] = shared = scheme
+        return shared
+
+    @property
+    def data(self):
+        """the packed colors as bytes"""
+        return self._data
+
+    def to_list(self):
+        """
+        Convert the scheme into a color list.
+
+        Returns
+        -------
+        list
+            a list of RGB integer tuples
+        """
+        data = iter(self._data)
+        return list(zip(data, data, data))
+
+    def _position(self, key):
+        """
+        a helper method that converts an index, a color name or a
+        registry color name into a position in PUTTY_COLOR_ORDER
+        """
+        if isinstance(key, int):
+            if key < 0:
+                key += len(PUTTY_COLOR_ORDER)
+            if not 0 <= key < len(PUTTY_COLOR_ORDER):
+                raise IndexError('Color index out of range: {0}'.format(key))
+            return key
+        return color_position(key)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.to_list()[key]
+        start = self._position(key) * 3
+        return tuple(self._data[start:start + 3])
+
+    def __len__(self):
+        return len(PUTTY_COLOR_ORDER)
+
+    def __iter__(self):
+        return iter(self.to_list())
+
+    def __eq__(self, other):
+        if isinstance(other, ColorScheme):
+            return self._data == other._data
+        return NotImplemented
+
+    def __ne__(self, other):
+        if isinstance(other, ColorScheme):
+            return self._data != other._data
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self._data)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('ColorScheme objects are immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('ColorScheme objects are immutable')
+
+    def __reduce__(self):
+        return (ColorScheme, (self._data,))
+
+    def __repr__(self):
+        return 'ColorScheme({0!r})'.format(self._data.hex())
+
+def read_session_colors(session_name, store=None):
     """
     Read all of the color values for the PuTTY session.
-    
+
     Parameters
     ----------
     session_name : string
         the name of the PuTTY session
-    
+    store : sessionstore.SessionStore, optional
+        the store that holds the session
+
     Returns
     -------
     list
         a list of tuples. Each tuple is a collection of three integers,
         which are the RGB values for that color. The colors are ordered
         as they are in PuTTY (i.e. PUTTY_COLOR_ORDER).
+
+    Raises
+    ------
+    KeyError
+        when the session doesn't exist or is missing a color
+    ValueError
+        when a color is malformed; the message names the session and
+        the ColourN value
     """
-    full_session_name = BASE_PUTTY_PATH + session_name
-    colors_list = []
-    
-    with winreg.OpenKey(winreg.HKEY_CURRENT_USER,
-                        full_session_name) as session:
-        for color_number in range(len(PUTTY_COLOR_ORDER)):
-            reg_color_name = 'Colour{0}'.format(color_number)
-            reg_value = winreg.QueryValueEx(session, reg_color_name)
-            color_from_reg = reg_value[0]
-            colors = unpack_color(color_from_reg)
-            colors_list.append(colors)
-    
-    return colors_list
-
-def write_session_colors(session_name, color_list):
+    if store is None:
+        store = get_session_store()
+
+    reg_values = store.query_values(session_name, REG_COLOR_NAMES)
+    for reg_color_name in REG_COLOR_NAMES:
+        if reg_color_name not in reg_values:
+            raise KeyError('{0} has no value for {1}'.format(
+                session_name, reg_color_name))
+    packed = colorcodec.decode_colors(
+        [reg_values[x][0] for x in REG_COLOR_NAMES], REG_COLOR_NAMES,
+        session_name, registry=True)
+    return [tuple(packed[x:x + 3]) for x in range(0, len(packed), 3)]
+
+def write_session_colors(session_name, color_list, store=None):
     """
     Write a color list to the Windows registry for a single PuTTY
     session.
-    
+
     Parameters
     ----------
     session_name : string
@@ -148,7 +426,9 @@ def write_session_colors(session_name, color_list):
         registry.
     color_list : list
         a list of RGB integer tuples
-    
+    store : sessionstore.SessionStore, optional
+        the store that holds the session
+
     See Also
     --------
     read_session_colors for more information on the color list format
@@ -156,108 +436,994 @@ def write_session_colors(session_name, color_list):
 
     '''Given the name of a session "session_name" and a list of RGB integer
     lists, set color_list as the colors for session_name.'''
-    full_session_name = BASE_PUTTY_PATH + session_name
-    
-    with winreg.OpenKey(winreg.HKEY_CURRENT_USER, full_session_name,
-                        WINDOWS_RESERVED, winreg.KEY_WRITE) as session:
-        for color_number, color_val in enumerate(color_list):
-            reg_color_name = 'Colour{0}'.format(color_number)
-            packed_color = pack_registry_colors(color_val)
-            winreg.SetValueEx(session, reg_color_name, WINDOWS_RESERVED,
-                              PUTTY_REG_COLOR_TYPE, packed_color)
-
-def get_all_session_names():
+    if store is None:
+        store = get_session_store()
+    store.set_values(session_name, build_color_values(color_list))
+
+def get_all_session_names(store=None):
     """
     Get the name of all PuTTY sessions.
-    
+
+    Parameters
+    ----------
+    store : sessionstore.SessionStore, optional
+        the store to read the session names from
+
     Returns
     -------
     list
         a list of PuTTY session names, each in the form of a string
     """
-    session_names = []
-    
-    with winreg.OpenKey(winreg.HKEY_CURRENT_USER, BASE_PUTTY_PATH) as base:
+    if store is None:
+        store = get_session_store()
+    return store.get_session_names()
+
+def read_all_session_colors(store=None, progress=None, cancel_event=None):
+    """
+    Read the colors of every PuTTY session in a single pass over the
+    store.
+
+    Identical color strings are only decoded once, and sessions with
+    identical colors share a single interned ColorScheme (see
+    iter_session_schemes).
+
+    Parameters
+    ----------
+    store : sessionstore.SessionStore, optional
+        the store that holds the sessions
+    progress : callable, optional
+        called as progress(done, None) after each session is read; the
+        total isn't known until the pass is over
+    cancel_event : threading.Event, optional
+        when set, the pass stops and the sessions read so far are
+        returned
+
+    Returns
+    -------
+    tuple
+        a (schemes, problems) pair. schemes maps each session name to
+        its ColorScheme.
+        problems maps the name of each session with missing or
+        malformed colors to a list of messages describing them; these
+        sessions are left out of schemes.
+
+    See Also
+    --------
+    read_session_colors for more information on the color format
+    """
+    if store is None:
+        store = get_session_store()
+    schemes = {}
+    problems = {}
+
+    for done, (session_name, scheme, session_problems) in enumerate(
+            iter_session_schemes(store.iter_session_values(REG_COLOR_NAMES)),
+            1):
+        if cancel_event is not None and cancel_event.is_set():
+            break
+        if session_problems:
+            problems[session_name] = session_problems
+        else:
+            schemes[session_name] = scheme
+        if progress is not None:
+            progress(done, None)
+
+    return schemes, problems
+
+def iter_session_schemes(session_values):
+    """
+    Decode the colors of many sessions, one session at a time.
+
+    Identical color strings are only decoded once, and sessions with
+    identical colors share a single interned ColorScheme.
+
+    Parameters
+    ----------
+    session_values : iterable
+        (session_name, reg_values) pairs, where reg_values maps
+        registry value names to (data, type) tuples, as returned by
+        sessionstore.SessionStore.iter_session_values
+
+    Returns
+    -------
+    generator
+        yields (session_name, scheme, problems) tuples, where scheme is
+        the session's ColorScheme, or None when problems (a list of
+        messages) describes missing or malformed colors
+    """
+    for session_name, packed, session_problems in \
+            colorcodec.iter_decode_sessions(session_values, REG_COLOR_NAMES):
+        if session_problems:
+            yield session_name, None, session_problems
+        else:
+            yield session_name, ColorScheme.intern(ColorScheme(packed)), []
+
+def build_color_values(color_list):
+    """
+    Convert a color list into the registry values that hold it.
+
+    Parameters
+    ----------
+    color_list : list or ColorScheme
+        a list of RGB integer tuples
+
+    Returns
+    -------
+    dict
+        maps registry color names (e.g. Colour0) to (data, type)
+        tuples, as accepted by sessionstore.SessionStore.set_values
+
+    Raises
+    ------
+    ValueError
+        when a color isn't three integers from 0 to 255
+    """
+    if isinstance(color_list, ColorScheme):
+        color_list = color_list.data
+    return {reg_color_name: (color_str, PUTTY_REG_COLOR_TYPE)
+            for reg_color_name, color_str in zip(
+                REG_COLOR_NAMES,
+                colorcodec.encode_colors(color_list, REG_COLOR_NAMES))}
+
+class BulkApplyResult(object):
+    """
+    the outcome of writing values to many PuTTY sessions at once
+
+    Attributes
+    ----------
+    statuses : dict
+        maps each session name to APPLY_CHANGED, APPLY_UNCHANGED or
+        APPLY_FAILED
+    errors : dict
+        maps the name of each failed session to the exception that
+        caused the failure
+    write_count : int
+        the total number of values written across all sessions
+    cancelled : bool
+        True when the write was cancelled before every session was
+        processed; the sessions that were skipped are left out of
+        statuses
+    rolled_back : bool
+        True when the write was part of a transaction (see journal.py)
+        that failed or was cancelled, so no session was left changed
+    """
+
+    def __init__(self):
+        self.statuses = {}
+        self.errors = {}
+        self.write_count = 0
+        self.cancelled = False
+        self.rolled_back = False
+
+    def sessions_with_status(self, status):
+        """
+        Get the sessions that ended up with a particular status.
+
+        Parameters
+        ----------
+        status : string
+            one of APPLY_CHANGED, APPLY_UNCHANGED or APPLY_FAILED
+
+        Returns
+        -------
+        list
+            the matching session names, in the order they were applied
+        """
+        return [session_name for session_name, session_status
+                in self.statuses.items() if session_status == status]
+
+def _apply_session_values(store, session_name, reg_values):
+    """
+    a helper function that writes the values from reg_values that
+    differ from what a single session currently holds
+
+    Returns
+    -------
+    tuple
+        the session name, its status, the number of values written and
+        the exception raised (or None)
+    """
+    try:
+        current = store.query_values(session_name, reg_values)
+        changed = {name: value for name, value in reg_values.items()
+                   if current.get(name) != value}
+        if not changed:
+            return session_name, APPLY_UNCHANGED, 0, None
+        store.set_values(session_name, changed)
+        return session_name, APPLY_CHANGED, len(changed), None
+    except Exception as e:
+        return session_name, APPLY_FAILED, 0, e
+
+def map_session_chunks(func, items, max_workers=DEFAULT_APPLY_WORKERS):
+    """
+    Run a function over chunks of APPLY_CHUNK_SIZE items on a pool of
+    threads. Items are handed out in chunks, since the cost of a future
+    per session outweighs the cost of a memory write.
+
+    Parameters
+    ----------
+    func : callable
+        called with a list of items; it returns a list of outcomes
+    items : list
+        the items to process, e.g. (session_name, reg_values) pairs
+    max_workers : int, optional
+        the number of threads to use; a value of 1 does all the work on
+        the calling thread
+
+    Returns
+    -------
+    iterator
+        the list returned for each chunk, in the order of items
+    """
+    chunks = [items[x:x + APPLY_CHUNK_SIZE]
+              for x in range(0, len(items), APPLY_CHUNK_SIZE)]
+    if max_workers <= 1:
+        for chunk in chunks:
+            yield func(chunk)
+        return
+    # Imported here, since it is slow to import and command line tools
+    # that never write many sessions shouldn't pay for it.
+    import concurrent.futures
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        for outcomes in executor.map(func, chunks):
+            yield outcomes
+
+def write_session_values(session_values, store=None,
+                         max_workers=DEFAULT_APPLY_WORKERS, progress=None,
+                         cancel_event=None):
+    """
+    Write registry values to many PuTTY sessions, only writing the
+    values that differ from those already held by each session.
+
+    Parameters
+    ----------
+    session_values : iterable
+        (session_name, reg_values) pairs, where reg_values is a dict of
+        value names and (data, type) tuples
+    store : sessionstore.SessionStore, optional
+        the store that holds the sessions
+    max_workers : int, optional
+        the number of threads used to read and write sessions; a value
+        of 1 does all the work on the calling thread
+    progress : callable, optional
+        called as progress(done, total) on the calling thread as
+        sessions are processed
+    cancel_event : threading.Event, optional
+        when set, sessions that haven't been started yet are skipped
+
+    Returns
+    -------
+    BulkApplyResult
+        the per-session outcome and total number of writes. A failure
+        in one session doesn't stop the others from being written.
+    """
+    if store is None:
+        store = get_session_store()
+    session_values = list(session_values)
+    total = len(session_values)
+    result = BulkApplyResult()
+
+    def apply_chunk(chunk):
+        outcomes = []
+        for session_name, reg_values in chunk:
+            if cancel_event is not None and cancel_event.is_set():
+                outcomes.append(None)
+            else:
+                outcomes.append(_apply_session_values(store, session_name,
+                                                      reg_values))
+        return outcomes
+
+    def collect(chunk_outcomes):
+        done = 0
+        for outcomes in chunk_outcomes:
+            for outcome in outcomes:
+                done += 1
+                if outcome is None:
+                    result.cancelled = True
+                    continue
+                session_name, status, writes, error = outcome
+                result.statuses[session_name] = status
+                result.write_count += writes
+                if error is not None:
+                    result.errors[session_name] = error
+            if progress is not None:
+                progress(done, total)
+
+    collect(map_session_chunks(apply_chunk, session_values, max_workers))
+    return result
+
+def apply_colors_to_sessions(session_names, color_list, store=None,
+                             max_workers=DEFAULT_APPLY_WORKERS, progress=None,
+                             cancel_event=None):
+    """
+    Write one color list to many PuTTY sessions. Only the ColourN
+    values that differ from a session's current values are written.
+
+    Parameters
+    ----------
+    session_names : iterable
+        the names of the PuTTY sessions as they appear in the registry
+    color_list : list
+        a list of RGB integer tuples
+    store : sessionstore.SessionStore, optional
+        the store that holds the sessions
+    max_workers : int, optional
+        the number of threads used to read and write sessions
+    progress : callable, optional
+        called as progress(done, total) after each session is processed
+    cancel_event : threading.Event, optional
+        when set, sessions that haven't been started yet are skipped
+
+    Returns
+    -------
+    BulkApplyResult
+        the per-session outcome and total number of writes
+
+    See Also
+    --------
+    read_session_colors for more information on the color list format
+    write_session_values for more information on progress and
+    cancellation
+    """
+    reg_values = build_color_values(color_list)
+    return write_session_values(
+        ((session_name, reg_values) for session_name in session_names),
+        store, max_workers, progress, cancel_event)
+
+class SessionColorCache(object):
+    """
+    a cache of PuTTY session names and colors
+
+    Cached entries are revalidated against the store's last write times
+    (see sessionstore.SessionStore.get_last_write_time), which is much
+    cheaper than reading the values again; only sessions that have been
+    written since they were cached are read from the store. At most
+    max_entries color lists are kept, with the least recently used
+    entries evicted first.
+
+    Attributes
+    ----------
+    hits : int
+        the number of lookups answered from the cache
+    misses : int
+        the number of lookups that had to read from the store
+    evictions : int
+        the number of color lists dropped to stay within max_entries
+    """
+
+    def __init__(self, store=None, max_entries=DEFAULT_CACHE_SIZE):
+        """
+        Parameters
+        ----------
+        store : sessionstore.SessionStore, optional
+            the store that holds the sessions
+        max_entries : int, optional
+            the maximum number of session color lists to keep
+        """
+        self.store = store if store is not None else get_session_store()
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._names = None
+        self._names_write_time = None
+        self._colors = collections.OrderedDict()
+
+    def get_session_names(self):
+        """
+        Get the name of all PuTTY sessions, reading them from the store
+        only when a session has been added or removed since the last
+        call.
+
+        Returns
+        -------
+        list
+            a list of PuTTY session names, each in the form of a string
+        """
+        write_time = self.store.get_last_write_time()
+        with self._lock:
+            if self._names is not None and \
+               write_time == self._names_write_time:
+                self.hits += 1
+                return list(self._names)
+
+        names = self.store.get_session_names()
+        with self._lock:
+            self.misses += 1
+            self._names = names
+            self._names_write_time = write_time
+            # Forget the colors of any sessions that are gone.
+            name_set = set(names)
+            for session_name in [x for x in self._colors
+                                 if x not in name_set]:
+                del self._colors[session_name]
+        return list(names)
+
+    def get_colors(self, session_name):
+        """
+        Get the colors of a single PuTTY session, reading them from the
+        store only when the session has been written since they were
+        cached.
+
+        Parameters
+        ----------
+        session_name : string
+            the name of the PuTTY session as it appears in the registry
+
+        Returns
+        -------
+        ColorScheme
+            the session's colors
+
+        Raises
+        ------
+        KeyError
+            when the session doesn't exist or is missing a color
+        ValueError
+            when one of the session's colors is malformed
+
+        See Also
+        --------
+        read_session_colors for more information on the color format
+        """
+        write_time = self.store.get_last_write_time(session_name)
+        with self._lock:
+            entry = self._colors.get(session_name)
+            if entry is not None and entry[0] == write_time:
+                self.hits += 1
+                self._colors.move_to_end(session_name)
+                return entry[1]
+
+        colors = ColorScheme.intern(read_session_colors(session_name,
+                                                        self.store))
+        with self._lock:
+            self.misses += 1
+            self._colors[session_name] = (write_time, colors)
+            self._colors.move_to_end(session_name)
+            while len(self._colors) > self.max_entries:
+                self._colors.popitem(last=False)
+                self.evictions += 1
+        return colors
+
+    def put(self, session_name, write_time, colors):
+        """
+        Add colors that were read elsewhere (e.g. from a snapshot) to
+        the cache. They are still revalidated against the store's last
+        write time before being used.
+
+        Parameters
+        ----------
+        session_name : string
+            the name of the PuTTY session as it appears in the registry
+        write_time : int
+            the session's last write time when the colors were read
+        colors : ColorScheme or list
+            the session's colors
+        """
+        with self._lock:
+            self._colors[session_name] = (write_time,
+                                          ColorScheme.intern(colors))
+            self._colors.move_to_end(session_name)
+            while len(self._colors) > self.max_entries:
+                self._colors.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, session_name=None):
+        """
+        Drop cached data so that it is read from the store next time.
+
+        Parameters
+        ----------
+        session_name : string, optional
+            the session whose colors should be dropped; when omitted,
+            everything is dropped, including the session names
+        """
+        with self._lock:
+            if session_name is None:
+                self._names = None
+                self._names_write_time = None
+                self._colors.clear()
+            else:
+                self._colors.pop(session_name, None)
+
+    def stats(self):
+        """
+        Get the cache counters.
+
+        Returns
+        -------
+        dict
+            the hits, misses and evictions counters, along with the
+            number of color lists currently cached
+        """
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'entries': len(self._colors)}
+
+class SchemeUsageIndex(object):
+    """
+    an index of which PuTTY sessions use which color scheme
+
+    Each distinct ColorScheme maps to the set of sessions that use it,
+    so finding every session with a particular scheme is a single
+    dictionary lookup. The index is built from one bulk read (see
+    SchemeUsageIndex.build) and kept up to date with set_scheme,
+    remove_session and update_from_apply.
+    """
+
+    def __init__(self, schemes=None):
+        """
+        Parameters
+        ----------
+        schemes : dict, optional
+            maps session names to their ColorSchemes (or color lists)
+        """
+        self._lock = threading.Lock()
+        self._sessions_by_scheme = {}
+        self._scheme_by_session = {}
+        for session_name, scheme in (schemes or {}).items():
+            self.set_scheme(session_name, scheme)
+
+    @classmethod
+    def build(cls, store=None, progress=None, cancel_event=None):
+        """
+        Build an index of every session in a store with a single pass
+        over it. Sessions with missing or malformed colors are left
+        out.
+
+        Parameters
+        ----------
+        store : sessionstore.SessionStore, optional
+            the store that holds the sessions
+        progress : callable, optional
+            passed on to read_all_session_colors
+        cancel_event : threading.Event, optional
+            passed on to read_all_session_colors
+
+        Returns
+        -------
+        SchemeUsageIndex
+            the new index
+        """
+        schemes, problems = read_all_session_colors(store, progress,
+                                                    cancel_event)
+        return cls(schemes)
+
+    def set_scheme(self, session_name, scheme):
+        """
+        Record the scheme currently used by a session.
+
+        Parameters
+        ----------
+        session_name : string
+            the name of the PuTTY session as it appears in the registry
+        scheme : ColorScheme or list
+            the session's colors
+        """
+        scheme = ColorScheme.intern(scheme)
+        with self._lock:
+            self._discard(session_name)
+            self._scheme_by_session[session_name] = scheme
+            self._sessions_by_scheme.setdefault(scheme, set()).add(
+                session_name)
+
+    def remove_session(self, session_name):
+        """
+        Forget a session, e.g. because it has been deleted. Sessions
+        that aren't in the index are ignored.
+        """
+        with self._lock:
+            self._discard(session_name)
+
+    def _discard(self, session_name):
+        """
+        a helper method that removes a session from the index; the lock
+        needs to be held by the caller
+        """
+        old_scheme = self._scheme_by_session.pop(session_name, None)
+        if old_scheme is not None:
+            sessions = self._sessions_by_scheme[old_scheme]
+            sessions.discard(session_name)
+            if not sessions:
+                del self._sessions_by_scheme[old_scheme]
+
+    def update_from_apply(self, result, scheme):
+        """
+        Update the index after a color list has been written to many
+        sessions.
+
+        Parameters
+        ----------
+        result : BulkApplyResult
+            the result returned by apply_colors_to_sessions
+        scheme : ColorScheme or list
+            the colors that were applied
+        """
+        for session_name, status in result.statuses.items():
+            if status != APPLY_FAILED:
+                self.set_scheme(session_name, scheme)
+
+    def sessions_using(self, scheme):
+        """
+        Get every session that uses a scheme.
+
+        Parameters
+        ----------
+        scheme : ColorScheme or list
+            the colors to look for
+
+        Returns
+        -------
+        frozenset
+            the names of the sessions using exactly these colors
+        """
+        scheme = ColorScheme.from_colors(scheme)
+        with self._lock:
+            return frozenset(self._sessions_by_scheme.get(scheme, ()))
+
+    def scheme_of(self, session_name):
+        """
+        Get the scheme used by a session, or None if it isn't indexed.
+        """
+        with self._lock:
+            return self._scheme_by_session.get(session_name)
+
+    def usage_counts(self):
+        """
+        Count how many sessions use each distinct scheme.
+
+        Returns
+        -------
+        list
+            (scheme, session count) tuples, most used first
+        """
+        with self._lock:
+            counts = [(scheme, len(sessions)) for scheme, sessions
+                      in self._sessions_by_scheme.items()]
+        return sorted(counts, key=lambda x: -x[1])
+
+    def __len__(self):
+        """the number of distinct schemes in use"""
+        with self._lock:
+            return len(self._sessions_by_scheme)
+
+def _srgb_to_linear(component):
+    """
+    a helper function that converts an sRGB component value (0 to 255)
+    into linear light
+    """
+    value = component / 255.0
+    if value <= 0.04045:
+        return value / 12.92
+    return ((value + 0.055) / 1.055) ** 2.4
+
+# The linear light value of each sRGB component value.
+LINEAR_COMPONENTS = [_srgb_to_linear(x) for x in range(256)]
+
+def _theme_file_key(path):
+    """
+    a helper function that gets the modification time and size of a
+    theme file, or None when it doesn't exist
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+def read_theme_INI(ini_name):
+    """
+    Read the colors a single theme INI file sets, without resolving the
+    theme it extends.
+
+    Parameters
+    ----------
+    ini_name : string
+        the name of the INI file to read
+
+    Returns
+    -------
+    tuple
+        the absolute path of the theme file the file extends (or None),
+        and a dict mapping the positions, in PUTTY_COLOR_ORDER, of the
+        colors the file sets to RGB integer tuples
+
+    Raises
+    ------
+    KeyError
+        when the color INI section name isn't present in the INI file
+    ValueError
+        when a color is malformed; the message names the file and the
+        color
+    """
+    color_config = configparser.ConfigParser(interpolation=None)
+    with profiling.get_profiler().timed('ini.read'):
+        color_config.read(ini_name)
+    color_dict = color_config[COLOR_INI_SECTION_NAME]
+    colors = {}
+
+    for color_number, color_name in enumerate(PUTTY_COLOR_ORDER):
+        reg_color_name = 'Colour{0}'.format(color_number)
+        if reg_color_name not in color_dict:
+            if color_name not in color_dict:
+                continue
+            reg_color_name = color_name
         try:
-            i = 0
-            while True:
-                session_names.append(winreg.EnumKey(base, i))
-                i += 1
-        except WindowsError:
-            pass
-    
-    return session_names
+            colors[color_number] = unpack_color(color_dict[reg_color_name])
+        except ValueError as e:
+            raise ValueError('{0} of {1}: {2}'.format(reg_color_name,
+                                                      ini_name, e))
+
+    base = color_dict.get(THEME_EXTENDS_KEY)
+    if base:
+        base = os.path.abspath(os.path.join(
+            os.path.dirname(os.path.abspath(ini_name)), base.strip()))
+    return base or None, colors
+
+class ThemeResolver(object):
+    """
+    resolves theme INI files that extend other themes
+
+    A theme file may name a base theme with an extends key in its
+    color section, and set only the colors that differ from it. Every
+    theme along a chain is resolved once and cached, along with the
+    modification time and size of its file. Looking a theme up again
+    only checks the files in its chain; when one of them has changed,
+    only the themes that extend it, directly or not, are resolved
+    again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Maps each theme path to (file key, base path, colors set).
+        self._files = {}
+        # Maps each theme path to its resolved, interned ColorScheme.
+        self._resolved = {}
+        # Maps each base theme path to the paths that extend it.
+        self._dependents = {}
+
+    def resolve(self, ini_name):
+        """
+        Get the full colors of a theme file, filling in the colors it
+        doesn't set from the theme it extends.
+
+        Parameters
+        ----------
+        ini_name : string
+            the name of the theme INI file
+
+        Returns
+        -------
+        ColorScheme
+            the theme's colors
+
+        Raises
+        ------
+        KeyError
+            when the file doesn't exist or has no color INI section
+        ValueError
+            when a color is malformed, a color isn't set anywhere along
+            the chain, or the chain loops back on itself
+        """
+        with self._lock:
+            return self._resolve(os.path.abspath(ini_name), [])
+
+    def _resolve(self, path, chain):
+        """
+        a helper method that resolves a theme, where chain lists the
+        themes that led to it
+        """
+        if path in chain:
+            raise ValueError('Theme inheritance cycle: {0}'.format(
+                ' -> '.join(chain[chain.index(path):] + [path])))
+        key = _theme_file_key(path)
+        entry = self._files.get(path)
+        if entry is None or entry[0] != key:
+            self._invalidate(path)
+            base, colors = read_theme_INI(path)
+            if entry is not None and entry[1] != base:
+                self._dependents.get(entry[1], set()).discard(path)
+            if base is not None:
+                self._dependents.setdefault(base, set()).add(path)
+            entry = self._files[path] = (key, base, colors)
+        key, base, colors = entry
+
+        base_scheme = None
+        if base is not None:
+            try:
+                base_scheme = self._resolve(base, chain + [path])
+            except KeyError:
+                raise ValueError('{0} extends {1}, which has no [{2}] '
+                                 'section or does not exist'.format(
+                                     path, base, COLOR_INI_SECTION_NAME))
+        # Resolving the base drops this theme if the base has changed.
+        scheme = self._resolved.get(path)
+        if scheme is not None:
+            return scheme
+
+        color_list = []
+        for color_number, color_name in enumerate(PUTTY_COLOR_ORDER):
+            if color_number in colors:
+                color_list.append(colors[color_number])
+            elif base_scheme is not None:
+                color_list.append(base_scheme[color_number])
+            else:
+                raise ValueError(('No value for Colour{0} ({1}) found in '
+                                  '{2} - using the default value {3}').format(
+                                      color_number, color_name, path,
+                                      PUTTY_DEFAULT_COLORS[color_number]))
+        scheme = self._resolved[path] = ColorScheme.intern(color_list)
+        return scheme
+
+    def chain(self, ini_name):
+        """
+        Get the files a theme's colors come from.
+
+        Returns
+        -------
+        list
+            the absolute path of the theme file, followed by the theme
+            it extends, the theme that one extends, and so on
+        """
+        path = os.path.abspath(ini_name)
+        with self._lock:
+            self._resolve(path, [])
+            paths = [path]
+            while self._files[paths[-1]][1] is not None:
+                paths.append(self._files[paths[-1]][1])
+            return paths
+
+    def dependents(self, ini_name):
+        """
+        Get every known theme that extends a theme, directly or through
+        other themes.
+
+        Returns
+        -------
+        set
+            the absolute paths of the dependent themes
+        """
+        with self._lock:
+            return self._collect_dependents(os.path.abspath(ini_name))
+
+    def _collect_dependents(self, path):
+        """
+        a helper method that finds the transitive dependents of a theme
+        """
+        found = set()
+        pending = [path]
+        while pending:
+            for dependent in self._dependents.get(pending.pop(), ()):
+                if dependent not in found:
+                    found.add(dependent)
+                    pending.append(dependent)
+        return found
+
+    def _invalidate(self, path):
+        """
+        a helper method that drops the resolved schemes of a theme and
+        everything that depends on it, returning their paths
+        """
+        dropped = {path} | self._collect_dependents(path)
+        for dropped_path in dropped:
+            self._resolved.pop(dropped_path, None)
+        return dropped
+
+    def invalidate(self, ini_name=None):
+        """
+        Forget the resolved colors of a theme and every theme that
+        depends on it, or of every theme when ini_name is omitted.
+
+        Returns
+        -------
+        set
+            the absolute paths of the themes that will be resolved again
+        """
+        with self._lock:
+            if ini_name is None:
+                dropped = set(self._resolved)
+                self._resolved.clear()
+                self._files.clear()
+                self._dependents.clear()
+                return dropped
+            path = os.path.abspath(ini_name)
+            self._files.pop(path, None)
+            return self._invalidate(path)
+
+    def refresh(self):
+        """
+        Check every known theme file for changes, forgetting the
+        resolved colors of the changed themes and their dependents.
+
+        Returns
+        -------
+        set
+            the absolute paths of the themes whose colors need to be
+            resolved again
+        """
+        with self._lock:
+            dropped = set()
+            for path, (key, base, colors) in list(self._files.items()):
+                if _theme_file_key(path) != key:
+                    del self._files[path]
+                    dropped |= self._invalidate(path)
+            return dropped
+
+_theme_resolver = ThemeResolver()
+
+def get_theme_resolver():
+    """
+    Get the ThemeResolver used by read_colors_from_INI.
+    """
+    return _theme_resolver
 
 def read_colors_from_INI(ini_name):
     """
     Read PuTTY session colors from an INI file.
-    
+
     The INI file needs to contain at least one section, called Colors
     (defined as COLOR_INI_SECTION_NAME). Each color defined by PuTTY
     needs to be represented in this INI section. The key for a
     particular color can be their registry names (e.g. Colour0,
     Colour1) or their names as shown in the PuTTY dialog (e.g.
     default foreground, default background).
-    
+
+    Alternatively, the section can name another theme file to extend
+    with an extends key (THEME_EXTENDS_KEY), in which case only the
+    colors that differ from that theme need to be given. Resolved
+    themes are cached (see ThemeResolver).
+
     Parameters
     ----------
     ini_name : string
         the name of the INI file to read
-    
+
     Returns
     -------
     list
         a list of RGB integer tuples
-    
+
     Raises
     ------
     ValueError
-        when a color isn't represented the INI section
+        when a color isn't represented the INI section (or in the
+        themes it extends), or the themes it extends loop back on
+        themselves
     KeyError
         when the color INI section name isn't present in the INI file
-    
+
     See Also
     --------
     read_session_colors for more information on the color list format
     """
-    color_config = configparser.SafeConfigParser()
-    color_config.read(ini_name)
-    color_dict = color_config[COLOR_INI_SECTION_NAME]
-    color_list = []
-    
-    for color_number, color_name in enumerate(PUTTY_COLOR_ORDER):
-        reg_color_name = 'Colour{0}'.format(color_number)
-        curr_color = PUTTY_DEFAULT_COLORS[color_number]
-        if reg_color_name in color_dict:
-            curr_color = unpack_color(color_dict[reg_color_name])
-        elif color_name in color_dict:
-            curr_color = unpack_color(color_dict[color_name])
-        else:
-            raise ValueError(('No value for {0} ({1}) found in {2} - using '
-                              'the default value {3}').format(
-                                  reg_color_name, color_name, ini_name,
-                                  curr_color))
-        color_list.append(curr_color)
-    
-    return color_list
+    return _theme_resolver.resolve(ini_name).to_list()
 
-def write_colors_to_INI(ini_name, colors_list, color_names=False):
+def write_colors_to_INI(ini_name, colors_list, color_names=False,
+                        extends=None):
     """
     Write a color list to a file.
-    
+
     Parameters
     ----------
     ini_name : string
         the name of the file to which the color list will be written
-    
+
     colors_list : list
         the list of integer tuples to write to file
-    
+
     color_names : boolean, optional
         If set to True, the name given to the the color by PuTTY (i.e.
         the names in PUTTY_COLOR_ORDER will be used; otherwise, their
         registry names (e.g. Colour0, Colour1) will be used.
-    
+
+    extends : string, optional
+        the name of a theme file for the new file to extend, relative
+        to the new file's directory; only the colors that differ from
+        it are written
+
     Raises
     ------
     IOError
@@ -265,22 +1431,34 @@ def write_colors_to_INI(ini_name, colors_list, color_names=False):
     IndexError
         when there are more integer tuples in the color list than
         necessary
-    
+
     See Also
     --------
     read_session_colors for more information on the color list format
     """
-    color_config = configparser.SafeConfigParser()
+    color_config = configparser.ConfigParser(interpolation=None)
     color_config.add_section(COLOR_INI_SECTION_NAME)
-    
+    base_scheme = None
+    if extends is not None:
+        color_config[COLOR_INI_SECTION_NAME][THEME_EXTENDS_KEY] = extends
+        base_scheme = _theme_resolver.resolve(os.path.join(
+            os.path.dirname(os.path.abspath(ini_name)), extends))
+
     for pos, color_val in enumerate(colors_list):
+        if base_scheme is not None and \
+           tuple(color_val) == base_scheme[pos]:
+            continue
         ini_key = (PUTTY_COLOR_ORDER[pos] if color_names
                    else 'Colour{0}'.format(pos))
         color_str = pack_registry_colors(color_val)
         color_config[COLOR_INI_SECTION_NAME][ini_key] = color_str
-        
-    with open(ini_name, 'w') as config_file:
+
+    with profiling.get_profiler().timed('ini.write'), \
+            open(ini_name, 'w') as config_file:
         color_config.write(config_file)
+    # The file may be rewritten within the file system's timestamp
+    # resolution, so a cached copy can't be told apart by its key.
+    _theme_resolver.invalidate(ini_name)
 
 def main():
     print(read_colors_from_INI('solarized_dark.ini'))
@@ -0,0 +1,430 @@
+import argparse
+import configparser
+import csv
+import fnmatch
+import itertools
+import json
+import os
+import re
+import sys
+
+import colorcodec
+import colorinterface
+import journal
+import sessionstore
+
+"""
+drift.py
+
+This file compares the colors of PuTTY sessions with a desired state,
+which maps session name patterns to theme files, and reports every
+ColourN value that has drifted from its theme. A desired state file is
+an INI file with one pattern per line, checked in order, the first
+match deciding a session's theme:
+
+    [Desired State]
+    prod-* = themes/red-alert.ini
+    * = themes/solarized-dark.ini
+
+The sessions are read in one pass over the store. Theme files are read
+once each, and sessions are compared through their interned
+ColorSchemes, so a session that matches its theme costs a single
+identity check, and the positions that differ between a session's
+scheme and its theme are only worked out once per distinct pair.
+
+The report can be fed straight back into an apply that writes only the
+drifted values (see fix_drift). When theme files change, e.g. a base
+theme that others extend, only the sessions using the affected themes
+need to be checked and fixed again (see reapply_changed_themes).
+"""
+
+DESIRED_STATE_SECTION_NAME = 'Desired State'
+
+class DriftEntry(object):
+    """
+    a single ColourN value that differs from the desired state
+
+    Attributes
+    ----------
+    session_name : string
+        the name of the session
+    theme : string
+        the path of the theme file the session should match
+    color_name : string
+        the registry name of the color, e.g. Colour0
+    actual : string
+        the value held by the session, as it is in the registry, or
+        None when the value is missing
+    expected : string
+        the value from the theme, in registry form
+    """
+
+    __slots__ = ('session_name', 'theme', 'color_name', 'actual', 'expected')
+
+    def __init__(self, session_name, theme, color_name, actual, expected):
+        self.session_name = session_name
+        self.theme = theme
+        self.color_name = color_name
+        self.actual = actual
+        self.expected = expected
+
+    def to_json(self):
+        """
+        Convert the entry into a JSON-compatible dict.
+        """
+        return {'session': self.session_name, 'theme': self.theme,
+                'color': self.color_name, 'actual': self.actual,
+                'expected': self.expected}
+
+class DesiredState(object):
+    """
+    an ordered list of session name patterns and the themes that the
+    matching sessions should use
+
+    Attributes
+    ----------
+    rules : list
+        (pattern, theme path) tuples, in the order they are checked
+    themes : dict
+        maps each theme path to its interned ColorScheme
+    """
+
+    def __init__(self, rules):
+        """
+        Parameters
+        ----------
+        rules : list
+            (pattern, theme path) tuples; patterns are globs matched
+            against both the registry form of a session name and the
+            form with spaces
+
+        Raises
+        ------
+        ValueError
+            when a theme file has no color section or bad colors
+        """
+        self.rules = list(rules)
+        self.themes = {}
+        # The values each theme should have, in registry form.
+        self._theme_values = {}
+        for pattern, theme_path in self.rules:
+            if theme_path not in self.themes:
+                self._load_theme(theme_path)
+        self._patterns = [(re.compile(fnmatch.translate(pattern)), theme_path)
+                          for pattern, theme_path in self.rules]
+
+    def _load_theme(self, theme_path):
+        """
+        a helper method that reads a theme file, returning True when
+        its colors differ from those loaded before
+        """
+        try:
+            colors = colorinterface.read_colors_from_INI(theme_path)
+        except KeyError:
+            raise ValueError('{0} has no [{1}] section.'.format(
+                theme_path, colorinterface.COLOR_INI_SECTION_NAME))
+        scheme = colorinterface.ColorScheme.intern(colors)
+        if self.themes.get(theme_path) is scheme:
+            return False
+        self.themes[theme_path] = scheme
+        self._theme_values[theme_path] = {
+            name: data for name, (data, reg_type)
+            in colorinterface.build_color_values(scheme).items()}
+        return True
+
+    def refresh_themes(self):
+        """
+        Read the theme files again, which only re-resolves the themes
+        whose files, or the files of the themes they extend, have
+        changed (see colorinterface.ThemeResolver).
+
+        Returns
+        -------
+        list
+            the paths of the themes whose colors changed
+        """
+        return [theme_path for theme_path in list(self.themes)
+                if self._load_theme(theme_path)]
+
+    @classmethod
+    def from_file(cls, filename):
+        """
+        Load a desired state file. Theme paths are relative to the
+        directory that holds the file.
+
+        Raises
+        ------
+        ValueError
+            when the file has no [Desired State] section
+        """
+        parser = configparser.ConfigParser(interpolation=None)
+        parser.optionxform = str
+        if not parser.read(filename):
+            raise ValueError('Could not read {0}.'.format(filename))
+        if not parser.has_section(DESIRED_STATE_SECTION_NAME):
+            raise ValueError('{0} has no [{1}] section.'.format(
+                filename, DESIRED_STATE_SECTION_NAME))
+        base_dir = os.path.dirname(os.path.abspath(filename))
+        return cls([(pattern, os.path.join(base_dir, theme_path))
+                    for pattern, theme_path
+                    in parser.items(DESIRED_STATE_SECTION_NAME)])
+
+    def theme_for(self, session_name):
+        """
+        Get the theme a session should use.
+
+        Returns
+        -------
+        string
+            the path of the first matching rule's theme, or None when no
+            rule matches the session
+        """
+        display = session_name.replace('%20', ' ')
+        for pattern, theme_path in self._patterns:
+            if pattern.match(session_name) or pattern.match(display):
+                return theme_path
+        return None
+
+    def theme_values(self, theme_path):
+        """
+        Get the registry strings of a theme's colors, by ColourN name.
+        """
+        return self._theme_values[theme_path]
+
+def iter_drift(desired, store=None, theme_paths=None):
+    """
+    Compare every session in a store with the desired state.
+
+    Parameters
+    ----------
+    desired : DesiredState
+        the themes the sessions should use
+    store : sessionstore.SessionStore, optional
+        the store that holds the sessions
+    theme_paths : iterable, optional
+        when given, only the sessions that should use one of these
+        themes are checked
+
+    Returns
+    -------
+    generator
+        yields a DriftEntry for each color that differs, grouped by
+        session, in the order the store lists the sessions. Sessions
+        that no rule matches are skipped.
+    """
+    if store is None:
+        store = colorinterface.get_session_store()
+    if theme_paths is not None:
+        theme_paths = frozenset(theme_paths)
+    # The session read last, since iter_session_schemes doesn't return
+    # the raw values that are reported for malformed colors.
+    current = [None, None]
+
+    def matched_sessions():
+        for session_name, reg_values in store.iter_session_values(
+                colorinterface.REG_COLOR_NAMES):
+            theme_path = desired.theme_for(session_name)
+            if theme_path is not None and \
+               (theme_paths is None or theme_path in theme_paths):
+                current[:] = theme_path, reg_values
+                yield session_name, reg_values
+
+    # Maps (scheme, theme scheme) pairs to the ColourN names that differ.
+    drifted_names = {}
+    for session_name, scheme, problems in \
+            colorinterface.iter_session_schemes(matched_sessions()):
+        theme_path, reg_values = current
+        target = desired.themes[theme_path]
+        if scheme is target:
+            continue
+        expected = desired.theme_values(theme_path)
+
+        if scheme is None:
+            # Compare what can be decoded, reporting the rest as it is.
+            for color_name in colorinterface.REG_COLOR_NAMES:
+                actual = reg_values.get(color_name, (None,))[0]
+                try:
+                    matches = colorcodec.decode_registry_color(actual) == \
+                        target[color_name]
+                except (ValueError, AttributeError, TypeError):
+                    matches = False
+                if not matches:
+                    yield DriftEntry(session_name, theme_path, color_name,
+                                     actual, expected[color_name])
+            continue
+
+        names = drifted_names.get((scheme, target))
+        if names is None:
+            data = scheme.data
+            target_data = target.data
+            names = drifted_names[(scheme, target)] = [
+                color_name for pos, color_name
+                in enumerate(colorinterface.REG_COLOR_NAMES)
+                if data[pos * 3:pos * 3 + 3] !=
+                target_data[pos * 3:pos * 3 + 3]]
+        for color_name in names:
+            yield DriftEntry(session_name, theme_path, color_name,
+                             reg_values[color_name][0], expected[color_name])
+
+def write_report(entries, out, report_format='csv'):
+    """
+    Write drift entries out one at a time.
+
+    Parameters
+    ----------
+    entries : iterable
+        the DriftEntries, as returned by iter_drift
+    out : file
+        the text file to write to
+    report_format : string, optional
+        'csv' for a CSV file with a header row, or 'json' for one JSON
+        object per line
+
+    Returns
+    -------
+    int
+        the number of entries written
+    """
+    count = 0
+    if report_format == 'csv':
+        writer = csv.writer(out, lineterminator='\n')
+        writer.writerow(['session', 'theme', 'color', 'actual', 'expected'])
+        for entry in entries:
+            writer.writerow([entry.session_name, entry.theme,
+                             entry.color_name, entry.actual, entry.expected])
+            count += 1
+    elif report_format == 'json':
+        for entry in entries:
+            out.write(json.dumps(entry.to_json()) + '\n')
+            count += 1
+    else:
+        raise ValueError('Unknown report format: {0}'.format(report_format))
+    return count
+
+def drift_values(entries):
+    """
+    Group drift entries into the values that would fix them.
+
+    Parameters
+    ----------
+    entries : iterable
+        DriftEntries, grouped by session, as returned by iter_drift
+
+    Returns
+    -------
+    generator
+        yields (session_name, reg_values) pairs holding only the
+        drifted colors, as accepted by
+        colorinterface.write_session_values
+    """
+    for session_name, session_entries in itertools.groupby(
+            entries, lambda entry: entry.session_name):
+        yield session_name, {
+            entry.color_name: (entry.expected,
+                               colorinterface.PUTTY_REG_COLOR_TYPE)
+            for entry in session_entries}
+
+def fix_drift(entries, store=None, history=None,
+              max_workers=colorinterface.DEFAULT_APPLY_WORKERS,
+              progress=None, cancel_event=None):
+    """
+    Write the theme colors back to the values that have drifted,
+    leaving every other value alone.
+
+    Parameters
+    ----------
+    entries : iterable
+        DriftEntries, grouped by session, as returned by iter_drift
+    store : sessionstore.SessionStore, optional
+        the store that holds the sessions
+    history : journal.ApplyHistory, optional
+        when given, the fix is written as a single transaction through
+        it instead, so it can be undone; its store is used in place of
+        store
+
+    Returns
+    -------
+    colorinterface.BulkApplyResult
+        the outcome of the write
+    """
+    session_values = drift_values(entries)
+    if history is not None:
+        return history.apply(session_values, max_workers, progress,
+                             cancel_event)
+    return colorinterface.write_session_values(
+        session_values, store, max_workers, progress, cancel_event)
+
+def reapply_changed_themes(desired, store=None, history=None,
+                           max_workers=colorinterface.DEFAULT_APPLY_WORKERS,
+                           progress=None, cancel_event=None):
+    """
+    Pick up changes to the theme files of a desired state and write the
+    new colors to only the sessions that use the changed themes.
+
+    Returns
+    -------
+    tuple
+        the paths of the themes that changed, and the
+        colorinterface.BulkApplyResult of the fix (None when no theme
+        changed)
+    """
+    changed = desired.refresh_themes()
+    if not changed:
+        return changed, None
+    entries = iter_drift(desired, store if history is None
+                         else history.store, changed)
+    return changed, fix_drift(entries, store, history, max_workers, progress,
+                              cancel_event)
+
+def main(argv=None):
+    """
+    Report (and with --fix, repair) drift from a desired state file on
+    the command line. The report is written to standard output.
+    """
+    parser = argparse.ArgumentParser(
+        description='Report PuTTY session colors that differ from their '
+                    'themes.')
+    parser.add_argument('desired', metavar='DESIRED_STATE',
+                        help='the desired state INI file')
+    parser.add_argument('--reg-file', metavar='FILE',
+                        help='check the sessions in a .reg export instead '
+                             'of the registry')
+    parser.add_argument('--format', choices=['csv', 'json'], default='csv')
+    parser.add_argument('--fix', action='store_true',
+                        help='write the drifted values back, as one '
+                             'transaction that can be undone')
+    args = parser.parse_args(argv)
+
+    try:
+        desired = DesiredState.from_file(args.desired)
+        if args.reg_file:
+            store = sessionstore.RegFileSessionStore(args.reg_file)
+        else:
+            store = colorinterface.get_session_store()
+        entries = iter_drift(desired, store)
+        if not args.fix:
+            return 1 if write_report(entries, sys.stdout, args.format) else 0
+
+        fixes = list(entries)
+        write_report(fixes, sys.stdout, args.format)
+        history_journal = None
+        if store.location is not None:
+            history_journal = journal.Journal(
+                journal.default_journal_path())
+        history = journal.ApplyHistory(store, history_journal)
+        history.recover()
+        result = fix_drift(fixes, history=history)
+    except (OSError, ValueError) as e:
+        sys.stderr.write('{0}: {1}\n'.format(parser.prog, e))
+        return 2
+
+    for session_name, error in sorted(result.errors.items()):
+        sys.stderr.write('Could not fix {0}: {1}\n'.format(session_name,
+                                                          error))
+    sys.stderr.write('Fixed {0} values in {1} sessions.\n'.format(
+        result.write_count,
+        len(result.sessions_with_status(colorinterface.APPLY_CHANGED))))
+    return 1 if result.errors or result.rolled_back else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
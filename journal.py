@@ -0,0 +1,887 @@
+import collections
+import os
+import struct
+import threading
+import zlib
+
+import colorinterface
+import regfile
+import snapshot
+
+"""
+journal.py
+
+This file makes bulk writes to PuTTY sessions transactional. Before a
+transaction writes anything, the prior value of every registry value it
+is about to change is appended to a write-ahead journal file, which is
+flushed to disk. When a write fails or is cancelled, the prior values
+are written back straight away; when the process dies part way
+through, ApplyHistory.recover does the same from the journal the next
+time the application starts.
+
+Finished transactions are kept in an ApplyHistory, which undoes and
+redoes them by replaying only the values they changed, so undoing an
+apply costs about as much as the apply did.
+
+The journal is shared by every process of the user (e.g. the GUI and
+the command line tool). Each process locks the journal's lock file while
+it touches the journal, and allocates transaction ids from the file
+itself under that lock, so ids are never handed out twice. Each BEGIN
+record names the process that owns the transaction, and recovery leaves
+alone the transactions of processes that are still running.
+
+The journal file starts with JOURNAL_MAGIC, followed by records. Each
+record is a header (kind, transaction id, payload length and CRC-32 of
+the payload) followed by its payload:
+
+    BEGIN       the id of the owning process (in decimal), a NUL
+                character and the location of the session store
+                (UTF-8)
+    CHANGE      a session name, then the name, prior value and new
+                value of every value that changes, separated by NUL
+                characters; values are written as in a .reg file, and
+                an empty string stands for a missing value
+    COMMIT      empty; the transaction finished
+    ABORT       empty; the transaction was rolled back
+    HIGH_WATER  empty; written first when the journal is compacted,
+                with the highest transaction id handed out so far, so
+                that ids keep increasing
+
+Compacting the journal drops every finished transaction, keeping the
+records of unfinished ones (of any store and any process) as they are.
+"""
+
+JOURNAL_MAGIC = b'PCMJRNL1'
+JOURNAL_FILE_NAME = 'journal.bin'
+# Appended to the journal's file name to get the name of its lock file.
+LOCK_FILE_SUFFIX = '.lock'
+# The number of transactions that ApplyHistory can undo by default.
+DEFAULT_HISTORY_SIZE = 20
+# Once the journal is larger than this many bytes, it is compacted the
+# next time a transaction commits.
+CHECKPOINT_SIZE = 1024 * 1024
+# The kinds of journal record.
+BEGIN = 1
+CHANGE = 2
+COMMIT = 3
+ABORT = 4
+HIGH_WATER = 5
+
+_RECORD = struct.Struct('<BQII')
+# Used with OpenProcess and GetExitCodeProcess to check on a process on
+# Windows.
+PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+STILL_ACTIVE = 259
+
+def default_journal_path():
+    """
+    Get the per-user location of the journal file, which is kept next
+    to the snapshot file (see snapshot.default_snapshot_path).
+    """
+    return os.path.join(os.path.dirname(snapshot.default_snapshot_path()),
+                        JOURNAL_FILE_NAME)
+
+def process_running(pid):
+    """
+    Check whether a process is still running.
+
+    Parameters
+    ----------
+    pid : int
+        the id of the process
+
+    Returns
+    -------
+    bool
+        True when a process with that id exists
+    """
+    if pid == os.getpid():
+        return True
+    if os.name == 'nt':
+        # os.kill would terminate the process on Windows.
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION,
+                                      False, pid)
+        if not handle:
+            # Access is denied to processes that exist but belong to
+            # someone else.
+            return ctypes.GetLastError() == 5
+        try:
+            exit_code = ctypes.c_ulong()
+            if not kernel32.GetExitCodeProcess(handle,
+                                               ctypes.byref(exit_code)):
+                return True
+            return exit_code.value == STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class _FileLock(object):
+    """
+    an exclusive lock on a file, held across processes while in a with
+    block
+
+    The platform's locking module (msvcrt or fcntl) is only imported
+    when the lock is taken, as with winreg in sessionstore.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)),
+                    exist_ok=True)
+        self._file = open(self.path, 'a+b')
+        try:
+            if os.name == 'nt':
+                import msvcrt
+                self._file.seek(0)
+                while True:
+                    try:
+                        # This gives up after about ten seconds.
+                        msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK,
+                                       1)
+                        break
+                    except OSError:
+                        continue
+            else:
+                import fcntl
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        except BaseException:
+            self._file.close()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if os.name == 'nt':
+                import msvcrt
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        finally:
+            self._file.close()
+            self._file = None
+
+def _encode_value(value, encoded):
+    """
+    a helper function that converts a (data, type) tuple, or None for a
+    missing value, into journal text; encoded caches the text of values
+    that have already been converted
+    """
+    if value is None:
+        return ''
+    try:
+        text = encoded.get(value)
+    except TypeError:
+        # REG_MULTI_SZ data is a list, which can't be a dict key.
+        return regfile.format_value_data(*value)
+    if text is None:
+        text = encoded[value] = regfile.format_value_data(*value)
+    return text
+
+def _decode_value(text, decoded):
+    """
+    a helper function that reverses _encode_value
+    """
+    if not text:
+        return None
+    value = decoded.get(text)
+    if value is None:
+        value = decoded[text] = regfile.parse_value_data(text)
+    return value
+
+def reverse_changes(changes):
+    """
+    Swap the prior and new values of a set of changes, so that writing
+    them undoes the original changes.
+
+    Parameters
+    ----------
+    changes : dict
+        maps session names to tuples of (value_name, prior, new)
+        tuples, where prior and new are (data, type) tuples, or None
+        for a value that is missing
+
+    Returns
+    -------
+    dict
+        the reversed changes, in the same format
+    """
+    return {session_name: tuple((name, new, prior)
+                                for name, prior, new in session_changes)
+            for session_name, session_changes in changes.items()}
+
+class Journal(object):
+    """
+    an append-only write-ahead journal file
+
+    Several processes may use the same file; see the module docstring.
+
+    Attributes
+    ----------
+    path : string
+        the name of the journal file; it is created on the first write
+    """
+
+    def __init__(self, path):
+        """
+        Parameters
+        ----------
+        path : string
+            the name of the journal file
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._file_lock = _FileLock(path + LOCK_FILE_SUFFIX)
+        # The transactions begun through this object that haven't
+        # finished yet.
+        self._active = set()
+
+    def _read_records(self):
+        """
+        a helper method that yields the (kind, transaction_id, payload)
+        of each record in the file, stopping at the first damaged or
+        incomplete record (e.g. one cut short by a crash)
+        """
+        try:
+            with open(self.path, 'rb') as journal_file:
+                data = journal_file.read()
+        except OSError:
+            return
+        if not data.startswith(JOURNAL_MAGIC):
+            return
+
+        offset = len(JOURNAL_MAGIC)
+        while offset + _RECORD.size <= len(data):
+            kind, transaction_id, length, checksum = \
+                _RECORD.unpack_from(data, offset)
+            offset += _RECORD.size
+            payload = data[offset:offset + length]
+            if len(payload) != length or zlib.crc32(payload) != checksum:
+                return
+            offset += length
+            yield kind, transaction_id, payload
+
+    def _write_records(self, journal_file, records):
+        """
+        a helper method that writes (kind, transaction_id, payload)
+        records to an open file and waits for them to reach the disk
+        """
+        journal_file.write(b''.join(
+            _RECORD.pack(kind, transaction_id, len(payload),
+                         zlib.crc32(payload)) + payload
+            for kind, transaction_id, payload in records))
+        journal_file.flush()
+        os.fsync(journal_file.fileno())
+
+    def _append(self, records):
+        """
+        a helper method that appends (kind, transaction_id, payload)
+        records to the file and waits for them to reach the disk
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)),
+                    exist_ok=True)
+        with open(self.path, 'ab') as journal_file:
+            if journal_file.tell() == 0:
+                journal_file.write(JOURNAL_MAGIC)
+            self._write_records(journal_file, records)
+
+    def begin(self, source, changes):
+        """
+        Record the start of a transaction. Nothing may be written to the
+        store until this returns.
+
+        Parameters
+        ----------
+        source : string
+            the location of the store being written (see
+            sessionstore.SessionStore.location)
+        changes : dict
+            the changes the transaction will make, in the format
+            described in reverse_changes
+
+        Returns
+        -------
+        int
+            the id of the transaction, to pass to commit or abort
+        """
+        encoded = {}
+        with self._lock, self._file_lock:
+            # Other processes may have added transactions since this one
+            # last looked, so the next id comes from the file itself.
+            transaction_id = 1 + max(
+                [transaction_id for kind, transaction_id, payload
+                 in self._read_records()], default=0)
+            records = [(BEGIN, transaction_id, '{0}\0{1}'.format(
+                os.getpid(), source).encode('utf-8'))]
+            for session_name, session_changes in changes.items():
+                fields = [session_name]
+                for name, prior, new in session_changes:
+                    fields.append(name)
+                    fields.append(_encode_value(prior, encoded))
+                    fields.append(_encode_value(new, encoded))
+                records.append((CHANGE, transaction_id,
+                                '\0'.join(fields).encode('utf-8')))
+            self._append(records)
+            self._active.add(transaction_id)
+        return transaction_id
+
+    def commit(self, transaction_id):
+        """
+        Record that a transaction finished successfully.
+        """
+        with self._lock, self._file_lock:
+            self._append([(COMMIT, transaction_id, b'')])
+            self._active.discard(transaction_id)
+
+    def abort(self, transaction_id):
+        """
+        Record that a transaction has been rolled back.
+        """
+        with self._lock, self._file_lock:
+            self._append([(ABORT, transaction_id, b'')])
+            self._active.discard(transaction_id)
+
+    def release(self, transaction_id):
+        """
+        Hand a transaction that couldn't be finished over to recovery:
+        it stays unfinished in the journal, and pending reports it from
+        now on, even in this process.
+        """
+        with self._lock:
+            self._active.discard(transaction_id)
+
+    def pending(self, source):
+        """
+        Find the transactions on a store that began but never finished,
+        leaving out those that are still in progress, either through
+        this object or in another process that is still running.
+
+        Parameters
+        ----------
+        source : string
+            the location of the store
+
+        Returns
+        -------
+        list
+            (transaction_id, changes) tuples, oldest first, where
+            changes is in the format described in reverse_changes
+
+        Raises
+        ------
+        ValueError
+            when a change record can't be decoded
+        """
+        with self._lock, self._file_lock:
+            return self._pending(source, include_running=False)
+
+    def _pending(self, source, include_running=True):
+        """
+        a helper method for pending that expects the locks to be held;
+        a source of None matches every store
+        """
+        sources = {}
+        owners = {}
+        changes = collections.OrderedDict()
+        decoded = {}
+        for kind, transaction_id, payload in self._read_records():
+            if kind == BEGIN:
+                owner, separator, source_text = \
+                    payload.decode('utf-8').partition('\0')
+                if separator:
+                    owners[transaction_id] = int(owner)
+                else:
+                    # Written before owners were recorded.
+                    source_text = owner
+                sources[transaction_id] = source_text
+                changes[transaction_id] = {}
+            elif kind == CHANGE and transaction_id in changes:
+                fields = payload.decode('utf-8').split('\0')
+                changes[transaction_id][fields[0]] = tuple(
+                    (fields[x], _decode_value(fields[x + 1], decoded),
+                     _decode_value(fields[x + 2], decoded))
+                    for x in range(1, len(fields), 3))
+            elif kind in (COMMIT, ABORT):
+                changes.pop(transaction_id, None)
+        if not include_running:
+            for transaction_id in list(changes):
+                owner = owners.get(transaction_id)
+                if transaction_id in self._active or (
+                        owner is not None and owner != os.getpid() and
+                        process_running(owner)):
+                    del changes[transaction_id]
+        return [(transaction_id, transaction_changes)
+                for transaction_id, transaction_changes in changes.items()
+                if source is None or sources[transaction_id] == source]
+
+    def checkpoint(self):
+        """
+        Compact the journal if it has grown past CHECKPOINT_SIZE,
+        dropping the records of finished transactions. Unfinished
+        transactions, including those still in progress in any process,
+        are kept.
+        """
+        with self._lock, self._file_lock:
+            try:
+                size = os.path.getsize(self.path)
+            except OSError:
+                return
+            if size <= CHECKPOINT_SIZE:
+                return
+
+            high_water = 0
+            unfinished = collections.OrderedDict()
+            for record in self._read_records():
+                kind, transaction_id, payload = record
+                high_water = max(high_water, transaction_id)
+                if kind in (BEGIN, CHANGE):
+                    unfinished.setdefault(transaction_id, []).append(record)
+                elif kind in (COMMIT, ABORT):
+                    unfinished.pop(transaction_id, None)
+
+            # The compacted journal replaces the old one in a single
+            # step, so a crash leaves one or the other.
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'wb') as journal_file:
+                journal_file.write(JOURNAL_MAGIC)
+                self._write_records(
+                    journal_file,
+                    [(HIGH_WATER, high_water, b'')] +
+                    [record for records in unfinished.values()
+                     for record in records])
+            os.replace(temp_path, self.path)
+
+def plan_changes(session_values, store=None,
+                 max_workers=colorinterface.DEFAULT_APPLY_WORKERS,
+                 progress=None, cancel_event=None):
+    """
+    Work out which values a write would change, and what they hold
+    now, without writing anything.
+
+    Parameters
+    ----------
+    session_values : iterable
+        (session_name, reg_values) pairs, as accepted by
+        colorinterface.write_session_values
+    store : sessionstore.SessionStore, optional
+        the store that holds the sessions
+    max_workers : int, optional
+        the number of threads used to read sessions
+    progress : callable, optional
+        called as progress(done, total) as sessions are read
+    cancel_event : threading.Event, optional
+        when set, sessions that haven't been read yet are skipped
+
+    Returns
+    -------
+    tuple
+        the changes, in the format described in reverse_changes, and a
+        colorinterface.BulkApplyResult in which every session is marked
+        as unchanged, or as failed when it couldn't be read; its
+        write_count is the number of values that would be written
+    """
+    if store is None:
+        store = colorinterface.get_session_store()
+    session_values = list(session_values)
+    result = colorinterface.BulkApplyResult()
+    changes = {}
+
+    def plan_chunk(chunk):
+        outcomes = []
+        for session_name, reg_values in chunk:
+            if cancel_event is not None and cancel_event.is_set():
+                outcomes.append(None)
+                continue
+            try:
+                current = store.query_values(session_name, reg_values)
+                outcomes.append((session_name, tuple(
+                    (name, current.get(name), value)
+                    for name, value in reg_values.items()
+                    if current.get(name) != value), None))
+            except Exception as e:
+                outcomes.append((session_name, None, e))
+        return outcomes
+
+    done = 0
+    for outcomes in colorinterface.map_session_chunks(
+            plan_chunk, session_values, max_workers):
+        for outcome in outcomes:
+            done += 1
+            if outcome is None:
+                result.cancelled = True
+                continue
+            session_name, session_changes, error = outcome
+            if error is not None:
+                result.statuses[session_name] = colorinterface.APPLY_FAILED
+                result.errors[session_name] = error
+                continue
+            result.statuses[session_name] = colorinterface.APPLY_UNCHANGED
+            if session_changes:
+                changes[session_name] = session_changes
+                result.write_count += len(session_changes)
+        if progress is not None:
+            progress(done, len(session_values))
+    return changes, result
+
+def write_changes(changes, store=None,
+                  max_workers=colorinterface.DEFAULT_APPLY_WORKERS,
+                  progress=None, cancel_event=None):
+    """
+    Write the new values of a set of changes, removing the values whose
+    new value is None. This is not transactional on its own; see
+    ApplyHistory.
+
+    Parameters
+    ----------
+    changes : dict
+        the changes, in the format described in reverse_changes
+    store : sessionstore.SessionStore, optional
+        the store that holds the sessions
+    max_workers : int, optional
+        the number of threads used to write sessions
+    progress : callable, optional
+        called as progress(done, total) as sessions are written
+    cancel_event : threading.Event, optional
+        when set, sessions that haven't been written yet are skipped
+
+    Returns
+    -------
+    colorinterface.BulkApplyResult
+        the per-session outcome and total number of writes
+    """
+    if store is None:
+        store = colorinterface.get_session_store()
+    session_changes = list(changes.items())
+    result = colorinterface.BulkApplyResult()
+
+    def write_chunk(chunk):
+        outcomes = []
+        for session_name, values in chunk:
+            if cancel_event is not None and cancel_event.is_set():
+                outcomes.append(None)
+                continue
+            try:
+                new_values = {name: new for name, prior, new in values
+                              if new is not None}
+                removed = [name for name, prior, new in values if new is None]
+                if new_values:
+                    store.set_values(session_name, new_values)
+                if removed:
+                    store.delete_values(session_name, removed)
+                outcomes.append((session_name, len(values), None))
+            except Exception as e:
+                outcomes.append((session_name, 0, e))
+        return outcomes
+
+    done = 0
+    for outcomes in colorinterface.map_session_chunks(
+            write_chunk, session_changes, max_workers):
+        for outcome in outcomes:
+            done += 1
+            if outcome is None:
+                result.cancelled = True
+                continue
+            session_name, writes, error = outcome
+            result.write_count += writes
+            if error is None:
+                result.statuses[session_name] = colorinterface.APPLY_CHANGED
+            else:
+                result.statuses[session_name] = colorinterface.APPLY_FAILED
+                result.errors[session_name] = error
+        if progress is not None:
+            progress(done, len(session_changes))
+    return result
+
+def restore_changes(changes, store=None,
+                    max_workers=colorinterface.DEFAULT_APPLY_WORKERS):
+    """
+    Write back the prior values of a set of changes, e.g. to roll back
+    a transaction. Values that already hold their prior value are left
+    alone, so sessions that were never written (or were only partly
+    written) are handled too.
+
+    Parameters
+    ----------
+    changes : dict
+        the changes to undo, in the format described in
+        reverse_changes
+    store : sessionstore.SessionStore, optional
+        the store that holds the sessions
+    max_workers : int, optional
+        the number of threads used to read and write sessions
+
+    Returns
+    -------
+    colorinterface.BulkApplyResult
+        the per-session outcome of the restore
+    """
+    restores, result = plan_changes(
+        ((session_name, {name: prior for name, prior, new in values})
+         for session_name, values in changes.items()),
+        store, max_workers)
+    write_result = write_changes(restores, store, max_workers)
+    result.statuses.update(write_result.statuses)
+    result.errors.update(write_result.errors)
+    result.write_count = write_result.write_count
+    return result
+
+def _restore_failures(result):
+    """
+    a helper function that picks out the sessions that a restore
+    couldn't write back; sessions that have since been deleted have
+    nothing left to restore, so aren't counted
+    """
+    return {session_name: error for session_name, error
+            in result.errors.items() if not isinstance(error, KeyError)}
+
+class ApplyHistory(object):
+    """
+    transactional bulk writes to a session store, with undo and redo
+
+    Each write either changes every session it was asked to, or, when
+    any session fails or the write is cancelled, none of them. Only one
+    transaction runs at a time.
+    """
+
+    def __init__(self, store=None, journal=None,
+                 max_entries=DEFAULT_HISTORY_SIZE):
+        """
+        Parameters
+        ----------
+        store : sessionstore.SessionStore, optional
+            the store that holds the sessions
+        journal : Journal, optional
+            the write-ahead journal; without one, failed writes are
+            still rolled back, but a crash part way through a write
+            can't be recovered from
+        max_entries : int, optional
+            the number of transactions that can be undone
+        """
+        if store is None:
+            store = colorinterface.get_session_store()
+        self.store = store
+        self.journal = journal
+        self._source = store.location or ''
+        self._lock = threading.Lock()
+        self._undo = collections.deque(maxlen=max_entries)
+        self._redo = collections.deque(maxlen=max_entries)
+
+    def can_undo(self):
+        """
+        Check whether there is a transaction to undo.
+        """
+        return bool(self._undo)
+
+    def can_redo(self):
+        """
+        Check whether there is an undone transaction to redo.
+        """
+        return bool(self._redo)
+
+    def _run(self, changes, max_workers, progress, cancel_event):
+        """
+        a helper method that writes changes as a single transaction,
+        rolling every session back when any of them fails or the write
+        is cancelled; the lock needs to be held
+        """
+        transaction_id = None
+        if self.journal is not None:
+            transaction_id = self.journal.begin(self._source, changes)
+
+        finished = False
+        try:
+            result = write_changes(changes, self.store, max_workers,
+                                   progress, cancel_event)
+            if result.errors or result.cancelled:
+                # Failed sessions may have been partly written, so they
+                # are rolled back along with the ones that succeeded.
+                rollback = restore_changes(
+                    {session_name: changes[session_name]
+                     for session_name in result.statuses},
+                    self.store, max_workers)
+                self.store.flush()
+                if not _restore_failures(rollback):
+                    result.rolled_back = True
+                    if transaction_id is not None:
+                        self.journal.abort(transaction_id)
+                        finished = True
+                return result
+
+            self.store.flush()
+            if transaction_id is not None:
+                self.journal.commit(transaction_id)
+                finished = True
+                self.journal.checkpoint()
+            return result
+        finally:
+            # When the rollback fails too, or anything above raises,
+            # the transaction is left unfinished in the journal, for
+            # recover to retry.
+            if transaction_id is not None and not finished:
+                self.journal.release(transaction_id)
+
+    def apply(self, session_values,
+              max_workers=colorinterface.DEFAULT_APPLY_WORKERS,
+              progress=None, cancel_event=None):
+        """
+        Write registry values to many PuTTY sessions as one transaction,
+        only writing the values that differ from those already held by
+        each session. When any session can't be read or written, or the
+        write is cancelled, nothing is changed.
+
+        Parameters
+        ----------
+        session_values : iterable
+            (session_name, reg_values) pairs, as accepted by
+            colorinterface.write_session_values
+        max_workers : int, optional
+            the number of threads used to read and write sessions
+        progress : callable, optional
+            called as progress(done, total) as sessions are read and
+            then written
+        cancel_event : threading.Event, optional
+            when set, the transaction is abandoned and rolled back
+
+        Returns
+        -------
+        colorinterface.BulkApplyResult
+            the per-session outcome and total number of writes; when
+            rolled_back is set, or the sessions couldn't all be read,
+            nothing was changed
+        """
+        session_values = list(session_values)
+        total = 2 * len(session_values)
+        read_progress = write_progress = None
+        if progress is not None:
+            read_progress = lambda done, count: progress(done, total)
+            write_progress = lambda done, count: progress(
+                total - count + done, total)
+
+        with self._lock:
+            changes, result = plan_changes(session_values, self.store,
+                                           max_workers, read_progress,
+                                           cancel_event)
+            if result.errors or result.cancelled or not changes:
+                result.write_count = 0
+                result.rolled_back = bool(result.errors or result.cancelled)
+                return result
+
+            write_result = self._run(changes, max_workers, write_progress,
+                                     cancel_event)
+            result.statuses.update(write_result.statuses)
+            result.errors = write_result.errors
+            result.write_count = write_result.write_count
+            result.cancelled = write_result.cancelled
+            result.rolled_back = write_result.rolled_back
+            if not write_result.errors and not write_result.cancelled:
+                self._undo.append(changes)
+                self._redo.clear()
+            return result
+
+    def apply_colors(self, session_names, color_list,
+                     max_workers=colorinterface.DEFAULT_APPLY_WORKERS,
+                     progress=None, cancel_event=None):
+        """
+        Write one color list to many PuTTY sessions as one transaction.
+
+        See Also
+        --------
+        apply for more information on the parameters and return value
+        colorinterface.apply_colors_to_sessions for the
+        non-transactional version
+        """
+        reg_values = colorinterface.build_color_values(color_list)
+        return self.apply(((session_name, reg_values)
+                           for session_name in session_names),
+                          max_workers, progress, cancel_event)
+
+    def _replay(self, from_stack, to_stack, reverse, max_workers, progress,
+                cancel_event):
+        """
+        a helper method that undoes or redoes the most recent
+        transaction on from_stack, moving it to to_stack when it
+        succeeds
+        """
+        with self._lock:
+            if not from_stack:
+                return None
+            changes = from_stack[-1]
+            result = self._run(reverse_changes(changes) if reverse
+                               else changes,
+                               max_workers, progress, cancel_event)
+            if not result.errors and not result.cancelled:
+                to_stack.append(from_stack.pop())
+            return result
+
+    def undo(self, max_workers=colorinterface.DEFAULT_APPLY_WORKERS,
+             progress=None, cancel_event=None):
+        """
+        Restore the values changed by the most recent transaction. Like
+        any other transaction, this either succeeds for every session
+        or changes nothing.
+
+        Returns
+        -------
+        colorinterface.BulkApplyResult
+            the outcome, or None when there is nothing to undo
+        """
+        return self._replay(self._undo, self._redo, True, max_workers,
+                            progress, cancel_event)
+
+    def redo(self, max_workers=colorinterface.DEFAULT_APPLY_WORKERS,
+             progress=None, cancel_event=None):
+        """
+        Write the values of the most recently undone transaction again.
+
+        Returns
+        -------
+        colorinterface.BulkApplyResult
+            the outcome, or None when there is nothing to redo
+        """
+        return self._replay(self._redo, self._undo, False, max_workers,
+                            progress, cancel_event)
+
+    def recover(self):
+        """
+        Roll back any transactions on this store that were left
+        unfinished in the journal, e.g. by a crash. Transactions that
+        another running process (such as the GUI) is still in the middle
+        of are left alone.
+
+        Returns
+        -------
+        tuple
+            the number of sessions restored, and a dict mapping each
+            session that couldn't be restored to the exception raised;
+            transactions with such sessions stay in the journal, to be
+            tried again next time. Sessions that no longer exist are
+            skipped.
+        """
+        if self.journal is None:
+            return 0, {}
+        restored = 0
+        errors = {}
+        with self._lock:
+            for transaction_id, changes in reversed(
+                    self.journal.pending(self._source)):
+                result = restore_changes(changes, self.store)
+                self.store.flush()
+                failed = _restore_failures(result)
+                restored += len(result.sessions_with_status(
+                    colorinterface.APPLY_CHANGED))
+                errors.update(failed)
+                if not failed:
+                    self.journal.abort(transaction_id)
+        return restored, errors
@@ -0,0 +1,353 @@
+import collections
+import queue
+import threading
+
+import colorinterface
+
+"""
+preview.py
+
+This file draws small preview thumbnails of color schemes: a sample
+terminal with a shell prompt, colored `ls -l` output, the bold and
+normal ANSI colors and the cursor, drawn the way PuTTY would draw them
+(bold text in the bold colors, the cursor as a block). Each character
+is drawn as a bar of its color rather than as a glyph, so thumbnails can
+be drawn without a font, on any thread.
+
+Thumbnails are cached by scheme (ThumbnailCache), so any number of
+sessions or theme files with the same colors share a single thumbnail,
+and drawn on a background thread (ThumbnailRenderer), so that the GUI
+stays responsive while browsing thousands of themes.
+"""
+
+# The size, in pixels, of one character of a thumbnail.
+CELL_WIDTH = 3
+CELL_HEIGHT = 6
+# The number of thumbnails kept by ThumbnailCache by default.
+DEFAULT_THUMBNAIL_CACHE_SIZE = 1024
+# The most requests ThumbnailRenderer keeps waiting; older requests are
+# dropped first, as they are for whatever was browsed past.
+MAX_PENDING_PREVIEWS = 256
+
+# The color of a span that is drawn as the cursor.
+CURSOR = 'cursor'
+_PROMPT = [('user@host', 2, True), (':', None, False), ('~/src', 4, True),
+           ('$ ', None, False)]
+# The sample terminal, as lines of (text, color, bold) spans, where color
+# is an ANSI color number (0 to 7 for the normal colors, 8 to 15 for the
+# bright ones), None for the default foreground, or CURSOR.
+SAMPLE_LINES = [
+    _PROMPT + [('ls -l', None, False)],
+    [('drwxr-xr-x ', None, False), ('docs', 4, True), (' ', None, False),
+     ('src', 4, True)],
+    [('-rwxr-xr-x ', None, False), ('build.sh', 2, True)],
+    [('lrwxrwxrwx ', None, False), ('latest', 6, True),
+     (' -> ', None, False), ('gone', 1, True)],
+    [('-rw-r--r-- ', None, False), ('logo.png', 5, True), (' ', None, False),
+     ('notes.txt', None, False)],
+    [('-rw-r--r-- ', None, False), ('dump.tgz', 1, True), (' ', None, False),
+     ('pipe', 3, False)],
+    [('Bold', None, True), (' text and ', None, False), ('plain', None, False),
+     (' text', None, False)],
+    [('## ', x, False) for x in range(8)],
+    [('## ', x, True) for x in range(8)],
+    [('## ', x, False) for x in range(8, 16)],
+    _PROMPT + [('vi', None, False), (' ', CURSOR, False)],
+]
+SAMPLE_COLUMNS = max(sum(len(text) for text, _, _ in line)
+                     for line in SAMPLE_LINES) + 2
+
+_TALL = frozenset('ABCDEFGHIJKLMNOPQRSTUVWXYZbdfhiklt0123456789/#@|-')
+_DESCENDING = frozenset('gjpqy')
+
+def _color_position(color, bold):
+    """
+    a helper function that finds the position in PUTTY_COLOR_ORDER of
+    the color used for text of a span
+    """
+    if color is None:
+        return 1 if bold else 0
+    if color >= 8:
+        return 7 + 2 * (color - 8)
+    return 6 + 2 * color + (1 if bold else 0)
+
+def _glyph_rows(char):
+    """
+    a helper function that gives the first and last pixel rows of a
+    character's bar, or None for a space
+    """
+    if char == ' ':
+        return None
+    top = 1 if char in _TALL else 2
+    bottom = CELL_HEIGHT - 1 if char in _DESCENDING else CELL_HEIGHT - 2
+    return top, bottom
+
+def thumbnail_size():
+    """
+    Get the size of every thumbnail.
+
+    Returns
+    -------
+    tuple
+        the width and height in pixels
+    """
+    return (SAMPLE_COLUMNS * CELL_WIDTH,
+            (len(SAMPLE_LINES) + 1) * CELL_HEIGHT)
+
+def render_thumbnail(colors):
+    """
+    Draw the sample terminal in a scheme's colors.
+
+    Parameters
+    ----------
+    colors : colorinterface.ColorScheme or list
+        the scheme to draw
+
+    Returns
+    -------
+    bytes
+        the thumbnail as a binary PPM image, which tkinter.PhotoImage
+        accepts as its data
+
+    Raises
+    ------
+    ValueError
+        when colors isn't a valid color list
+    """
+    scheme = colorinterface.ColorScheme.from_colors(colors)
+    data = scheme.data
+    palette = [data[x:x + 3] for x in range(0, len(data), 3)]
+    background = palette[2]
+    blank_cell = background * CELL_WIDTH
+    width, height = thumbnail_size()
+    blank_row = blank_cell * SAMPLE_COLUMNS
+
+    rows = [blank_row] * (CELL_HEIGHT // 2)
+    for line in SAMPLE_LINES:
+        # Each cell is (character, text color, cell color, bar width).
+        cells = [(' ', None, background, 0)]
+        for text, color, bold in line:
+            if color == CURSOR:
+                cells.extend((x, palette[4], palette[5], CELL_WIDTH - 1)
+                             for x in text)
+                continue
+            foreground = palette[_color_position(color, bold)]
+            bar_width = CELL_WIDTH if bold else CELL_WIDTH - 1
+            cells.extend((x, foreground, background, bar_width)
+                         for x in text)
+        cells.extend([(' ', None, background, 0)] *
+                     (SAMPLE_COLUMNS - len(cells)))
+
+        glyphs = [_glyph_rows(x[0]) for x in cells]
+        for y in range(CELL_HEIGHT):
+            row = []
+            for (char, foreground, cell_color, bar_width), glyph in \
+                    zip(cells, glyphs):
+                if glyph is not None and glyph[0] <= y <= glyph[1]:
+                    row.append(foreground * bar_width +
+                               cell_color * (CELL_WIDTH - bar_width))
+                elif cell_color is background:
+                    row.append(blank_cell)
+                else:
+                    row.append(cell_color * CELL_WIDTH)
+            rows.append(b''.join(row))
+    rows.extend([blank_row] * (height - len(rows)))
+
+    header = 'P6 {0} {1} 255\n'.format(width, height).encode('ascii')
+    return header + b''.join(rows)
+
+class ThumbnailCache(object):
+    """
+    a cache of thumbnails, keyed by color scheme
+
+    Schemes hash and compare by their colors, so every session or theme
+    with the same colors shares one entry. At most max_entries
+    thumbnails are kept, with the least recently used evicted first. It
+    is safe to use from several threads.
+
+    Attributes
+    ----------
+    hits : int
+        the number of thumbnails found in the cache
+    misses : int
+        the number of thumbnails that had to be drawn
+    evictions : int
+        the number of thumbnails dropped to stay within max_entries
+    """
+
+    def __init__(self, max_entries=DEFAULT_THUMBNAIL_CACHE_SIZE):
+        """
+        Parameters
+        ----------
+        max_entries : int, optional
+            the maximum number of thumbnails to keep
+        """
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._thumbnails = collections.OrderedDict()
+
+    def get(self, scheme):
+        """
+        Get the thumbnail of a scheme, drawing it if it isn't cached.
+
+        Parameters
+        ----------
+        scheme : colorinterface.ColorScheme
+            the scheme to draw
+
+        Returns
+        -------
+        bytes
+            the thumbnail, as returned by render_thumbnail
+        """
+        with self._lock:
+            data = self._thumbnails.get(scheme)
+            if data is not None:
+                self.hits += 1
+                self._thumbnails.move_to_end(scheme)
+                return data
+
+        data = render_thumbnail(scheme)
+        with self._lock:
+            self.misses += 1
+            self._thumbnails[scheme] = data
+            self._thumbnails.move_to_end(scheme)
+            while len(self._thumbnails) > self.max_entries:
+                self._thumbnails.popitem(last=False)
+                self.evictions += 1
+        return data
+
+    def __contains__(self, scheme):
+        with self._lock:
+            return scheme in self._thumbnails
+
+    def __len__(self):
+        with self._lock:
+            return len(self._thumbnails)
+
+    def clear(self):
+        """Drop every thumbnail."""
+        with self._lock:
+            self._thumbnails.clear()
+
+    def stats(self):
+        """
+        Get the cache's counters.
+
+        Returns
+        -------
+        dict
+            the hits, misses, evictions and current number of
+            thumbnails
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions,
+                    'entries': len(self._thumbnails)}
+
+class ThumbnailRenderer(object):
+    """
+    a background thread that draws thumbnails on request
+
+    Each request has a key, which names what the thumbnail is for (e.g.
+    the widget that will show it); a new request with the same key
+    replaces one that hasn't been drawn yet. The newest requests are
+    drawn first, since they are for whatever the user is looking at,
+    and only MAX_PENDING_PREVIEWS requests are kept waiting.
+
+    Finished thumbnails are collected with poll, which is meant to be
+    called periodically from the GUI thread.
+    """
+
+    def __init__(self, cache=None, max_pending=MAX_PENDING_PREVIEWS):
+        """
+        Parameters
+        ----------
+        cache : ThumbnailCache, optional
+            the cache to draw into; a new one is made by default
+        max_pending : int, optional
+            the most requests to keep waiting
+        """
+        self.cache = cache if cache is not None else ThumbnailCache()
+        self.max_pending = max_pending
+        self._pending = collections.OrderedDict()
+        self._condition = threading.Condition()
+        self._results = queue.Queue()
+        self._thread = None
+        self._stopped = False
+
+    def request(self, key, get_scheme):
+        """
+        Ask for a thumbnail to be drawn.
+
+        Parameters
+        ----------
+        key : hashable
+            identifies the request in the results of poll
+        get_scheme : callable
+            called with no arguments on the renderer's thread to get the
+            colorinterface.ColorScheme to draw, so it may do slow work
+            such as reading a session from the store
+        """
+        with self._condition:
+            if self._stopped:
+                return
+            self._pending.pop(key, None)
+            self._pending[key] = get_scheme
+            while len(self._pending) > self.max_pending:
+                self._pending.popitem(last=False)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+            self._condition.notify()
+
+    def _run(self):
+        """
+        a helper method that draws the newest request until the
+        renderer is stopped
+        """
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                key, get_scheme = self._pending.popitem(last=True)
+            try:
+                scheme = colorinterface.ColorScheme.intern(get_scheme())
+                self._results.put((key, scheme, self.cache.get(scheme), None))
+            except Exception as e:
+                self._results.put((key, None, None, e))
+
+    def poll(self):
+        """
+        Collect the requests that have been drawn since the last call.
+
+        Returns
+        -------
+        list
+            (key, scheme, data, error) tuples, where data is the
+            thumbnail as returned by render_thumbnail, or None when
+            get_scheme failed, in which case error is the exception it
+            raised
+        """
+        results = []
+        try:
+            while True:
+                results.append(self._results.get_nowait())
+        except queue.Empty:
+            pass
+        return results
+
+    def stop(self):
+        """
+        Stop the renderer's thread. Waiting requests are dropped.
+        """
+        with self._condition:
+            self._stopped = True
+            self._pending.clear()
+            self._condition.notify()
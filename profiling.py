@@ -0,0 +1,201 @@
+import bisect
+import json
+import threading
+import time
+
+"""
+profiling.py
+
+This file counts and times the operations that get slower as the number
+of PuTTY sessions grows (session store calls, registry calls, INI file
+access and GUI updates), keeping a latency histogram for each one. A
+single shared Profiler is used throughout the application; it is off by
+default, and costs next to nothing until it is turned on (e.g. with
+the GUI's --profile option).
+"""
+
+# The upper bounds, in seconds, of the latency histogram buckets kept by
+# Profiler; a last bucket holds everything slower.
+PROFILE_BUCKETS = [1e-05, 3e-05, 0.0001, 0.0003, 0.001, 0.003, 0.01, 0.03,
+                   0.1, 0.3, 1.0]
+
+class _NullTimer(object):
+    """
+    a helper class that stands in for _Timer when profiling is off
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class _Timer(object):
+    """
+    a helper class that times a with block and records it in a Profiler
+    """
+
+    def __init__(self, profiler, operation):
+        self.profiler = profiler
+        self.operation = operation
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.record(self.operation,
+                             time.perf_counter() - self.start)
+        return False
+
+class Profiler(object):
+    """
+    counts and times operations by name, keeping a latency histogram
+    for each one
+
+    Nothing is recorded while the profiler is disabled, and the checks
+    on the hot paths are a single attribute lookup, so leaving the
+    instrumentation in place costs next to nothing.
+
+    Attributes
+    ----------
+    enabled : bool
+        whether operations are being recorded; this can be changed at
+        any time
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        # Maps each operation to [count, total, max, bucket counts].
+        self._stats = {}
+
+    def record(self, operation, seconds):
+        """
+        Record one call of an operation.
+
+        Parameters
+        ----------
+        operation : string
+            the name of the operation, e.g. store.query_values
+        seconds : float
+            how long the call took
+        """
+        bucket = bisect.bisect_left(PROFILE_BUCKETS, seconds)
+        with self._lock:
+            stats = self._stats.get(operation)
+            if stats is None:
+                stats = self._stats[operation] = \
+                    [0, 0.0, 0.0, [0] * (len(PROFILE_BUCKETS) + 1)]
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+            stats[3][bucket] += 1
+
+    def timed(self, operation):
+        """
+        Time a with block as one call of an operation.
+
+        Returns
+        -------
+        object
+            a context manager; it does nothing when the profiler is
+            disabled
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, operation)
+
+    def reset(self):
+        """
+        Forget everything recorded so far.
+        """
+        with self._lock:
+            self._stats = {}
+
+    def stats(self):
+        """
+        Get what has been recorded so far.
+
+        Returns
+        -------
+        dict
+            maps each operation to a dict holding its count, total,
+            mean and max times in seconds, and a histogram: a list of
+            [upper bound in seconds, count] pairs for the latency
+            buckets that have any calls, fastest first, where the bound
+            of the last bucket is None
+        """
+        bounds = PROFILE_BUCKETS + [None]
+        with self._lock:
+            return {operation: {
+                'count': count,
+                'total': total,
+                'mean': total / count,
+                'max': longest,
+                'histogram': [[bound, calls] for bound, calls
+                              in zip(bounds, buckets) if calls],
+            } for operation, (count, total, longest, buckets)
+                    in self._stats.items()}
+
+    def to_json(self):
+        """
+        Get what has been recorded so far as a JSON document.
+        """
+        return json.dumps(self.stats(), indent=2, sort_keys=True)
+
+    def summary(self, since=None, limit=3):
+        """
+        Describe, in one line, where the time went.
+
+        Parameters
+        ----------
+        since : dict, optional
+            an earlier return value of stats; only the calls made since
+            then are described
+        limit : int, optional
+            the number of operations to name, slowest in total first
+
+        Returns
+        -------
+        string
+            e.g. '10022 calls in 0.41s: store.set_values 10000 in
+            0.39s, ...'
+        """
+        totals = []
+        for operation, stats in self.stats().items():
+            count, total = stats['count'], stats['total']
+            if since is not None and operation in since:
+                count -= since[operation]['count']
+                total -= since[operation]['total']
+            if count:
+                totals.append((total, count, operation))
+        totals.sort(reverse=True)
+        parts = ['{0} {1} in {2:.3f}s'.format(operation, count, total)
+                 for total, count, operation in totals[:limit]]
+        return '{0} calls in {1:.3f}s: {2}'.format(
+            sum(x[1] for x in totals), sum(x[0] for x in totals),
+            ', '.join(parts) or 'nothing recorded')
+
+_profiler = Profiler()
+
+def get_profiler():
+    """
+    Get the shared profiler, which the functions in colorinterface, the
+    session store returned by colorinterface.get_session_store and the
+    GUI report to.
+
+    Returns
+    -------
+    Profiler
+        the shared profiler
+    """
+    return _profiler
+
+def enable_profiling(enabled=True):
+    """
+    Turn the shared profiler on or off.
+    """
+    _profiler.enabled = enabled
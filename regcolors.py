@@ -0,0 +1,331 @@
+import argparse
+import csv
+import sys
+
+import colorinterface
+import regfile
+import sessionstore
+
+"""
+regcolors.py
+
+This file extracts, compares and rewrites the colors of PuTTY sessions
+in registry export (.reg) files without loading the files into memory.
+Everything works one session key at a time, so an export of the whole
+session tree, with tens of thousands of sessions, costs no more memory
+than one with a handful:
+
+    extract     write a .reg file holding only the ColourN values of
+                each session, which regedit merges into existing
+                sessions without touching their other settings
+    diff        list the colors that differ between two exports, as CSV
+
+Session names are kept exactly as they appear in the key paths, i.e. in
+the escaped form PuTTY uses in the registry (e.g. %20 for spaces).
+"""
+
+# The key prefix of the sessions in a full export of the session tree.
+SESSION_KEY_PREFIX = sessionstore.REG_FILE_ROOT + '\\' + \
+    sessionstore.BASE_PUTTY_PATH
+_COLOR_NAMES = frozenset(colorinterface.REG_COLOR_NAMES)
+
+def session_name_from_key(key_path, key_prefix=SESSION_KEY_PREFIX):
+    """
+    Get the name of the session that a key holds.
+
+    Returns
+    -------
+    string
+        the session name, or None when the key is not a direct subkey
+        of key_prefix (or is a deleted key)
+    """
+    if key_path is None or \
+       key_path[:len(key_prefix)].lower() != key_prefix.lower():
+        return None
+    session_name = key_path[len(key_prefix):]
+    if not session_name or '\\' in session_name:
+        return None
+    return session_name
+
+def iter_session_colors(filename, key_prefix=SESSION_KEY_PREFIX):
+    """
+    Read the color values of every session in a .reg file, one session
+    at a time. No other values are decoded.
+
+    Returns
+    -------
+    generator
+        yields (session_name, reg_values) tuples, where reg_values maps
+        the ColourN names present in the session to (data, type) tuples
+    """
+    for key_path, values in regfile.iter_reg_file(filename, key_prefix,
+                                                  _COLOR_NAMES):
+        session_name = session_name_from_key(key_path, key_prefix)
+        if session_name is not None:
+            yield session_name, values
+
+def iter_session_schemes(filename, key_prefix=SESSION_KEY_PREFIX):
+    """
+    Read the color schemes of every session in a .reg file, one session
+    at a time.
+
+    Returns
+    -------
+    generator
+        yields (session_name, scheme, problems) tuples, as
+        colorinterface.iter_session_schemes does
+    """
+    return colorinterface.iter_session_schemes(
+        iter_session_colors(filename, key_prefix))
+
+def write_session_colors(filename, session_colors,
+                         key_prefix=SESSION_KEY_PREFIX):
+    """
+    Write a .reg file holding only the color values of sessions.
+
+    Parameters
+    ----------
+    filename : string
+        the name of the file to write
+    session_colors : iterable
+        (session_name, colors) tuples, where colors is a ColorScheme or
+        a list of RGB tuples; a generator may be used
+
+    Returns
+    -------
+    int
+        the number of sessions written
+    """
+    count = 0
+    # Sessions commonly share schemes, so the last few formatted
+    # schemes are kept to avoid formatting the same one repeatedly.
+    formatted = {}
+
+    def keys():
+        nonlocal count
+        for session_name, colors in session_colors:
+            scheme = colorinterface.ColorScheme.from_colors(colors)
+            values = formatted.get(scheme)
+            if values is None:
+                if len(formatted) >= 64:
+                    formatted.clear()
+                values = formatted[scheme] = \
+                    colorinterface.build_color_values(scheme)
+            count += 1
+            yield key_prefix + session_name, values
+
+    regfile.write_reg_file(filename, keys())
+    return count
+
+def rewrite_session_colors(source, destination, recolor,
+                           key_prefix=SESSION_KEY_PREFIX):
+    """
+    Copy a .reg file, changing the colors of the sessions in it.
+
+    Only the ColourN lines of the sessions that recolor changes are
+    replaced; every other line, including other keys, comments and
+    the file's header and encoding, is copied as it is.
+
+    Parameters
+    ----------
+    source : string
+        the .reg file to read
+    destination : string
+        the .reg file to write; it must not be the same file as source
+    recolor : callable
+        called as recolor(session_name, scheme) for each session, where
+        scheme is the session's ColorScheme, or None when its colors
+        are missing or malformed; it returns the new colors (a
+        ColorScheme or a list of RGB tuples), or None to leave the
+        session as it is
+
+    Returns
+    -------
+    tuple
+        the number of sessions read and the number that were changed
+
+    Raises
+    ------
+    ValueError
+        when a color line of a session can't be parsed
+    """
+    blocks = regfile.iter_key_blocks(source)
+    header_path, header_lines = next(blocks)
+    header = header_lines[0].strip()
+    session_count = 0
+    changed_count = 0
+
+    with regfile.open_reg_file(destination, header) as out:
+        for line in header_lines[1:]:
+            out.write(line + '\n')
+        for key_path, lines in blocks:
+            session_name = session_name_from_key(key_path, key_prefix)
+            if session_name is not None:
+                session_count += 1
+                new_lines = _recolor_block(session_name, lines, recolor)
+                if new_lines is not None:
+                    changed_count += 1
+                    lines = new_lines
+            for line in lines:
+                out.write(line + '\n')
+    return session_count, changed_count
+
+def _recolor_block(session_name, lines, recolor):
+    """
+    a helper function that replaces the color lines in the lines of one
+    session key, returning None when recolor leaves it unchanged
+    """
+    reg_values = {}
+    color_lines = {}
+    for pos, line in enumerate(lines[1:], 1):
+        try:
+            parsed = regfile.parse_value_line(line)
+        except ValueError:
+            continue
+        if parsed is not None and parsed[0] in _COLOR_NAMES and \
+           parsed[1] != '-':
+            color_lines[parsed[0]] = pos
+            try:
+                reg_values[parsed[0]] = regfile.parse_value_data(parsed[1])
+            except ValueError as e:
+                raise ValueError('{0} of {1}: {2}'.format(
+                    parsed[0], session_name, e))
+
+    _, scheme, _ = next(colorinterface.iter_session_schemes(
+        [(session_name, reg_values)]))
+    new_colors = recolor(session_name, scheme)
+    if new_colors is None:
+        return None
+    new_values = colorinterface.build_color_values(new_colors)
+    if all(reg_values.get(name) == value
+           for name, value in new_values.items()):
+        return None
+
+    lines = list(lines)
+    missing = []
+    for name, (data, reg_type) in new_values.items():
+        line = regfile.format_value_line(name, data, reg_type)
+        if name in color_lines:
+            lines[color_lines[name]] = line
+        else:
+            missing.append(line)
+    # New values go after the last value line, before trailing blank
+    # lines and comments.
+    end = len(lines)
+    while end > 1 and regfile.parse_value_line(lines[end - 1]) is None:
+        end -= 1
+    lines[end:end] = missing
+    return lines
+
+def diff_session_colors(old_filename, new_filename,
+                        key_prefix=SESSION_KEY_PREFIX):
+    """
+    Compare the session colors in two .reg files, holding only one
+    session from each file in memory at a time.
+
+    Both files must list their sessions in registry order, i.e. sorted
+    by sessionstore.session_sort_key, which is how regedit exports them
+    and how RegFileSessionStore writes them.
+
+    Returns
+    -------
+    generator
+        yields (session_name, color_name, old_data, new_data) tuples
+        for each ColourN value that differs, where the data is the
+        registry string (e.g. '255,255,255'), or None when the value or
+        session is missing from that file
+
+    Raises
+    ------
+    ValueError
+        when either file is not in registry order
+    """
+    def sorted_sessions(filename):
+        last = None
+        for session_name, values in iter_session_colors(filename,
+                                                        key_prefix):
+            key = sessionstore.session_sort_key(session_name)
+            if last is not None and key < last:
+                raise ValueError('{0} is not in registry order: {1} is out '
+                                 'of order'.format(filename, session_name))
+            last = key
+            yield key, session_name, values
+
+    def differences(session_name, old_values, new_values):
+        for color_name in colorinterface.REG_COLOR_NAMES:
+            old_data = old_values.get(color_name, (None,))[0]
+            new_data = new_values.get(color_name, (None,))[0]
+            if old_data != new_data:
+                yield session_name, color_name, old_data, new_data
+
+    old_sessions = sorted_sessions(old_filename)
+    new_sessions = sorted_sessions(new_filename)
+    old = next(old_sessions, None)
+    new = next(new_sessions, None)
+    while old is not None or new is not None:
+        if new is None or (old is not None and old[0] < new[0]):
+            for difference in differences(old[1], old[2], {}):
+                yield difference
+            old = next(old_sessions, None)
+        elif old is None or new[0] < old[0]:
+            for difference in differences(new[1], {}, new[2]):
+                yield difference
+            new = next(new_sessions, None)
+        else:
+            for difference in differences(old[1], old[2], new[2]):
+                yield difference
+            old = next(old_sessions, None)
+            new = next(new_sessions, None)
+
+def main(argv=None):
+    """
+    Extract or compare session colors in .reg files from the command
+    line.
+    """
+    parser = argparse.ArgumentParser(
+        description='Extract and compare PuTTY session colors in .reg '
+                    'files.')
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND')
+    commands.required = True
+    extract = commands.add_parser('extract', help='write a colors-only '
+                                                  '.reg file')
+    extract.add_argument('source', metavar='EXPORT')
+    extract.add_argument('destination', metavar='OUTPUT')
+    diff = commands.add_parser('diff', help='list the colors that differ '
+                                            'between two exports, as CSV')
+    diff.add_argument('old', metavar='OLD')
+    diff.add_argument('new', metavar='NEW')
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'extract':
+            problems = []
+
+            def readable():
+                for session_name, scheme, messages in \
+                        iter_session_schemes(args.source):
+                    if scheme is None:
+                        problems.append(session_name)
+                        sys.stderr.write('Skipped {0}: {1}\n'.format(
+                            session_name, '; '.join(messages)))
+                    else:
+                        yield session_name, scheme
+
+            count = write_session_colors(args.destination, readable())
+            sys.stderr.write('Extracted the colors of {0} sessions.\n'.format(
+                count))
+            return 1 if problems else 0
+
+        writer = csv.writer(sys.stdout, lineterminator='\n')
+        writer.writerow(['session', 'color', 'old', 'new'])
+        found = False
+        for row in diff_session_colors(args.old, args.new):
+            writer.writerow(row)
+            found = True
+        return 1 if found else 0
+    except (OSError, ValueError) as e:
+        sys.stderr.write('{0}: {1}\n'.format(parser.prog, e))
+        return 2
+
+if __name__ == '__main__':
+    sys.exit(main())
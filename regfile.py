@@ -0,0 +1,399 @@
+import codecs
+import re
+
+"""
+regfile.py
+
+This file reads and writes registry export (.reg) files, as produced by
+regedit. Files are processed one key at a time, so exports of any size
+can be read without holding the whole file in memory.
+"""
+
+REG_FILE_HEADER = 'Windows Registry Editor Version 5.00'
+REG_FILE_HEADER_V4 = 'REGEDIT4'
+# The registry value types understood by the .reg format. The numbers
+# match the constants defined by winreg.
+REG_SZ = 1
+REG_EXPAND_SZ = 2
+REG_BINARY = 3
+REG_DWORD = 4
+REG_MULTI_SZ = 7
+REG_QWORD = 11
+
+_VALUE_LINE = re.compile(r'^(@|"(?:[^"\\]|\\.)*")=(.*)$')
+_HEX_PREFIX = re.compile(r'^hex(?:\(([0-9a-fA-F]+)\))?:(.*)$')
+_ESCAPE = re.compile(r'\\(.)')
+
+def _detect_encoding(filename):
+    """
+    a helper function that determines the text encoding of a .reg file
+    from its byte order mark
+
+    regedit writes version 5 files as UTF-16 and REGEDIT4 files in the
+    ANSI code page, which is read as Latin-1 here.
+    """
+    with open(filename, 'rb') as reg_file:
+        start = reg_file.read(3)
+    if start.startswith(codecs.BOM_UTF16_LE) or \
+       start.startswith(codecs.BOM_UTF16_BE):
+        return 'utf-16'
+    if start.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    return 'latin-1'
+
+def unescape_string(text):
+    """
+    Undo the escaping applied to names and string data in .reg files.
+
+    Parameters
+    ----------
+    text : string
+        the text between the quotes, as it appears in the file
+
+    Returns
+    -------
+    string
+        the text with \\\\ and \\" replaced by \\ and "
+    """
+    if '\\' not in text:
+        return text
+    return _ESCAPE.sub(r'\1', text)
+
+def escape_string(text):
+    """
+    Escape a name or string value for writing to a .reg file.
+
+    Parameters
+    ----------
+    text : string
+        the unescaped text
+
+    Returns
+    -------
+    string
+        the text with backslashes and double quotes escaped
+    """
+    return text.replace('\\', '\\\\').replace('"', '\\"')
+
+def parse_value_data(data_text):
+    """
+    Convert the right hand side of a value line into Python data.
+
+    Parameters
+    ----------
+    data_text : string
+        everything after the = sign, with any line continuations
+        already joined
+
+    Returns
+    -------
+    tuple
+        the data and its registry type, in the same form that
+        winreg.QueryValueEx returns them
+
+    Raises
+    ------
+    ValueError
+        when the data isn't in a recognized format
+    """
+    if data_text.startswith('"'):
+        if not data_text.endswith('"') or len(data_text) < 2:
+            raise ValueError('Unterminated string: {0}'.format(data_text))
+        return (unescape_string(data_text[1:-1]), REG_SZ)
+    if data_text.lower().startswith('dword:'):
+        return (int(data_text[6:], 16), REG_DWORD)
+
+    hex_match = _HEX_PREFIX.match(data_text)
+    if not hex_match:
+        raise ValueError('Unrecognized value data: {0}'.format(data_text))
+    reg_type = int(hex_match.group(1), 16) if hex_match.group(1) \
+        else REG_BINARY
+    hex_digits = hex_match.group(2).replace(',', '').replace(' ', '')
+    raw = bytes.fromhex(hex_digits)
+
+    if reg_type in (REG_SZ, REG_EXPAND_SZ):
+        return (raw.decode('utf-16-le').rstrip('\0'), reg_type)
+    if reg_type == REG_MULTI_SZ:
+        strings = raw.decode('utf-16-le').rstrip('\0')
+        return (strings.split('\0') if strings else [], reg_type)
+    if reg_type in (REG_DWORD, REG_QWORD):
+        return (int.from_bytes(raw, 'little'), reg_type)
+    return (raw, reg_type)
+
+def format_value_data(data, reg_type):
+    """
+    Convert Python data into the right hand side of a value line.
+
+    Parameters
+    ----------
+    data : object
+        the value data, in the form winreg.QueryValueEx returns it
+    reg_type : int
+        the registry type of the value
+
+    Returns
+    -------
+    string
+        the text to write after the = sign
+    """
+    if reg_type == REG_SZ:
+        return '"{0}"'.format(escape_string(data))
+    if reg_type == REG_DWORD:
+        return 'dword:{0:08x}'.format(data)
+
+    if reg_type == REG_EXPAND_SZ:
+        raw = (data + '\0').encode('utf-16-le')
+    elif reg_type == REG_MULTI_SZ:
+        raw = ''.join(s + '\0' for s in data).encode('utf-16-le') + b'\0\0'
+    elif reg_type == REG_QWORD:
+        raw = data.to_bytes(8, 'little')
+    else:
+        raw = bytes(data)
+    hex_text = ','.join('{0:02x}'.format(b) for b in raw)
+    if reg_type == REG_BINARY:
+        return 'hex:' + hex_text
+    return 'hex({0:x}):{1}'.format(reg_type, hex_text)
+
+def _iter_logical_lines(reg_file):
+    """
+    a helper generator that joins lines ending in a backslash with the
+    lines that follow them, as regedit does for long hex values
+    """
+    pending = ''
+    for line in reg_file:
+        line = line.rstrip('\r\n')
+        if pending:
+            line = pending + line.lstrip()
+            pending = ''
+        if line.endswith('\\'):
+            pending = line[:-1]
+            continue
+        yield line
+    if pending:
+        yield pending
+
+def parse_value_line(line):
+    """
+    Split a value line into its name and the text of its data.
+
+    Parameters
+    ----------
+    line : string
+        a logical line from a key block, with any line continuations
+        already joined
+
+    Returns
+    -------
+    tuple
+        the unescaped value name (the empty string for the default
+        value) and the text after the = sign, or None when the line is
+        blank or a comment
+
+    Raises
+    ------
+    ValueError
+        when the line isn't a value line
+    """
+    stripped = line.strip()
+    if not stripped or stripped.startswith(';'):
+        return None
+    value_match = _VALUE_LINE.match(stripped)
+    if not value_match:
+        raise ValueError('Malformed value line: {0}'.format(stripped))
+    raw_name, data_text = value_match.groups()
+    name = '' if raw_name == '@' else unescape_string(raw_name[1:-1])
+    return name, data_text
+
+def format_value_line(name, data, reg_type):
+    """
+    Format a single value as a line of .reg file text, without a line
+    ending.
+    """
+    quoted_name = '@' if name == '' else '"{0}"'.format(escape_string(name))
+    return '{0}={1}'.format(quoted_name, format_value_data(data, reg_type))
+
+def iter_reg_file(filename, key_prefix=None, value_names=None):
+    """
+    Read the keys in a .reg file one at a time.
+
+    Parameters
+    ----------
+    filename : string
+        the name of the .reg file to read
+    key_prefix : string, optional
+        when given, only keys whose full path starts with this prefix
+        (compared case-insensitively) are returned
+    value_names : iterable, optional
+        when given, only these values are parsed and returned; the
+        data of any other value is never decoded
+
+    Returns
+    -------
+    generator
+        yields (key_path, values) tuples, where values is a dict
+        mapping each value name to a (data, type) tuple. The default
+        value of a key is stored under the empty string. Deleted keys
+        and values ("[-...]" and "name"=-) are skipped.
+
+    Raises
+    ------
+    ValueError
+        when the file doesn't start with a .reg header, or a value
+        can't be parsed
+    """
+    prefix = key_prefix.lower() if key_prefix else None
+    wanted = frozenset(value_names) if value_names is not None else None
+    with open(filename, 'r', encoding=_detect_encoding(filename),
+              newline='') as reg_file:
+        lines = _iter_logical_lines(reg_file)
+        header = next(lines, '').strip()
+        if header not in (REG_FILE_HEADER, REG_FILE_HEADER_V4):
+            raise ValueError('{0} is not a registry export file'.format(
+                filename))
+
+        key_path = None
+        values = None
+        for line in lines:
+            stripped = line.strip()
+            if not stripped or stripped.startswith(';'):
+                continue
+            if stripped.startswith('[') and stripped.endswith(']'):
+                if values is not None:
+                    yield key_path, values
+                key_path = stripped[1:-1]
+                values = None
+                if not key_path.startswith('-') and \
+                   (prefix is None or key_path.lower().startswith(prefix)):
+                    values = {}
+                continue
+            if values is None:
+                continue
+            value_match = _VALUE_LINE.match(stripped)
+            if not value_match:
+                raise ValueError('Malformed line under [{0}]: {1}'.format(
+                    key_path, stripped))
+            raw_name, data_text = value_match.groups()
+            if data_text == '-':
+                continue
+            name = '' if raw_name == '@' else unescape_string(raw_name[1:-1])
+            if wanted is None or name in wanted:
+                values[name] = parse_value_data(data_text)
+
+        if values is not None:
+            yield key_path, values
+
+def iter_key_blocks(filename):
+    """
+    Read a .reg file one key at a time, keeping every line exactly as
+    it is, so that a file can be rewritten with only some of its values
+    changed.
+
+    Parameters
+    ----------
+    filename : string
+        the name of the .reg file to read
+
+    Returns
+    -------
+    generator
+        first yields (None, lines) for the header and anything before
+        the first key, then (key_path, lines) for each key, where lines
+        are the logical lines of the key, starting with its [key_path]
+        line and including any blank lines and comments after it.
+        Deleted keys are yielded too, with key paths starting with -.
+
+    Raises
+    ------
+    ValueError
+        when the file doesn't start with a .reg header
+    """
+    with open(filename, 'r', encoding=_detect_encoding(filename),
+              newline='') as reg_file:
+        lines = _iter_logical_lines(reg_file)
+        header = next(lines, '')
+        if header.strip() not in (REG_FILE_HEADER, REG_FILE_HEADER_V4):
+            raise ValueError('{0} is not a registry export file'.format(
+                filename))
+
+        key_path = None
+        block = [header]
+        for line in lines:
+            stripped = line.strip()
+            if stripped.startswith('[') and stripped.endswith(']'):
+                yield key_path, block
+                key_path = stripped[1:-1]
+                block = []
+            block.append(line)
+        yield key_path, block
+
+def open_reg_file(filename, header=REG_FILE_HEADER):
+    """
+    Create a .reg file for writing, in the encoding regedit uses for the
+    given header, and write the header line.
+
+    Parameters
+    ----------
+    filename : string
+        the name of the file to write
+    header : string, optional
+        REG_FILE_HEADER for a UTF-16 file, or REG_FILE_HEADER_V4 for a
+        REGEDIT4 file, which is written as Latin-1
+
+    Returns
+    -------
+    file
+        the open text file; lines written to it should end in \\n,
+        which is written as \\r\\n
+    """
+    if header == REG_FILE_HEADER_V4:
+        reg_file = open(filename, 'w', encoding='latin-1', newline='\r\n')
+        reg_file.write(header + '\n')
+    else:
+        reg_file = open(filename, 'w', encoding='utf-16-le',
+                        newline='\r\n')
+        reg_file.write('\ufeff' + header + '\n')
+    return reg_file
+
+def write_reg_file(filename, keys):
+    """
+    Write keys to a .reg file in the format regedit exports.
+
+    Parameters
+    ----------
+    filename : string
+        the name of the file to write
+    keys : iterable
+        (key_path, values) tuples, as returned by iter_reg_file. The
+        keys are written as they are produced, so a generator can be
+        used to write files of any size.
+
+    Raises
+    ------
+    IOError
+        when the file is not writable
+    """
+    with open_reg_file(filename) as reg_file:
+        reg_file.write('\n')
+        for key_path, values in keys:
+            reg_file.write(format_key(key_path, values))
+
+def format_key(key_path, values):
+    """
+    Format a single key and its values as a block of .reg file text.
+
+    Parameters
+    ----------
+    key_path : string
+        the full path of the key, including the root key name
+    values : dict
+        a mapping of value names to (data, type) tuples
+
+    Returns
+    -------
+    string
+        the key block, including its trailing blank line
+    """
+    lines = ['[{0}]'.format(key_path)]
+    for name, (data, reg_type) in values.items():
+        lines.append(format_value_line(name, data, reg_type))
+    return '\n'.join(lines) + '\n\n'
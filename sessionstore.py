@@ -0,0 +1,793 @@
+import itertools
+import os
+import threading
+import time
+
+import profiling
+import regfile
+
+"""
+sessionstore.py
+
+This file contains the backends that hold PuTTY session settings. The
+Windows registry is the real home of PuTTY's sessions
+(WinRegSessionStore), but sessions can also be held in memory
+(MemorySessionStore) or read from a registry export file
+(RegFileSessionStore), which allows the rest of the application to run
+on hosts without a Windows registry.
+
+Every store works in terms of session names as they appear in the
+registry (i.e. with spaces written as %20) and value data as
+(data, type) tuples, which is the form winreg.QueryValueEx returns.
+"""
+
+BASE_PUTTY_PATH = 'Software\\SimonTatham\\PuTTY\\Sessions\\'
+# The root key name used for BASE_PUTTY_PATH in registry export files.
+REG_FILE_ROOT = 'HKEY_CURRENT_USER'
+# Used in Windows Registry API calls, where the calls have reserved
+# parameters that are always set to zero.
+WINDOWS_RESERVED = 0
+# The filter passed to RegNotifyChangeKeyValue: subkeys being added or
+# removed (REG_NOTIFY_CHANGE_NAME) and values being written
+# (REG_NOTIFY_CHANGE_LAST_SET).
+REG_NOTIFY_FILTER = 0x00000001 | 0x00000004
+WAIT_OBJECT_0 = 0
+# The registry value types used for PuTTY settings; these have the same
+# values as the constants in winreg.
+REG_SZ = regfile.REG_SZ
+REG_DWORD = regfile.REG_DWORD
+
+def session_sort_key(session_name):
+    """
+    Get the key that orders session names the way the registry
+    enumerates them and regedit exports them: case-insensitively, by
+    comparing the names in upper case (so that, e.g., "a_b" comes after
+    "aab").
+    """
+    return session_name.upper()
+
+class SessionStore(object):
+    """
+    the interface shared by all session stores
+
+    Subclasses need to implement get_session_names, query_values,
+    set_values, delete_values and get_last_write_time. Missing sessions
+    are reported by raising KeyError.
+
+    Attributes
+    ----------
+    location : string
+        a description of where the sessions are kept that stays the
+        same between runs, or None for stores that don't outlive the
+        process
+    """
+
+    location = None
+
+    def get_session_names(self):
+        """
+        Get the name of all PuTTY sessions held in this store.
+
+        Returns
+        -------
+        list
+            a list of PuTTY session names, each in the form of a string
+        """
+        raise NotImplementedError
+
+    def query_values(self, session_name, value_names=None):
+        """
+        Read values from a single PuTTY session.
+
+        Parameters
+        ----------
+        session_name : string
+            the name of the PuTTY session as it appears in the registry
+        value_names : iterable, optional
+            the names of the values to read; when omitted, every value
+            of the session is read
+
+        Returns
+        -------
+        dict
+            a mapping of value names to (data, type) tuples. Requested
+            values that don't exist in the session are left out.
+
+        Raises
+        ------
+        KeyError
+            when the session doesn't exist
+        """
+        raise NotImplementedError
+
+    def query_value(self, session_name, value_name):
+        """
+        Read a single value from a PuTTY session.
+
+        Returns
+        -------
+        tuple
+            the (data, type) tuple for the value
+
+        Raises
+        ------
+        KeyError
+            when the session or the value doesn't exist
+        """
+        values = self.query_values(session_name, [value_name])
+        if value_name not in values:
+            raise KeyError('{0} has no value named {1}'.format(
+                session_name, value_name))
+        return values[value_name]
+
+    def iter_session_values(self, value_names=None):
+        """
+        Read values from every PuTTY session in a single pass over the
+        store.
+        
+        Parameters
+        ----------
+        value_names : iterable, optional
+            the names of the values to read from each session; when
+            omitted, every value is read
+        
+        Returns
+        -------
+        generator
+            yields (session_name, values) tuples, where values is a
+            dict like the one returned by query_values. Sessions that
+            disappear during the pass are skipped.
+        """
+        for session_name in self.get_session_names():
+            try:
+                yield session_name, self.query_values(session_name,
+                                                      value_names)
+            except KeyError:
+                pass
+
+    def set_values(self, session_name, values):
+        """
+        Write values to a single PuTTY session.
+
+        Parameters
+        ----------
+        session_name : string
+            the name of the PuTTY session as it appears in the registry
+        values : dict
+            a mapping of value names to (data, type) tuples
+
+        Raises
+        ------
+        KeyError
+            when the session doesn't exist
+        """
+        raise NotImplementedError
+
+    def delete_values(self, session_name, value_names):
+        """
+        Remove values from a single PuTTY session. Values that the
+        session doesn't hold are ignored.
+
+        Parameters
+        ----------
+        session_name : string
+            the name of the PuTTY session as it appears in the registry
+        value_names : iterable
+            the names of the values to remove
+
+        Raises
+        ------
+        KeyError
+            when the session doesn't exist
+        """
+        raise NotImplementedError
+
+    def get_last_write_time(self, session_name=None):
+        """
+        Get the time at which a session was last modified.
+
+        Parameters
+        ----------
+        session_name : string, optional
+            the name of the PuTTY session as it appears in the
+            registry; when omitted, the time returned is for the key
+            that holds the sessions, which changes whenever a session
+            is added or removed
+
+        Returns
+        -------
+        int
+            an opaque timestamp that increases every time the session
+            is written; it is only meaningful when compared with other
+            timestamps from the same store
+
+        Raises
+        ------
+        KeyError
+            when the session doesn't exist
+        """
+        raise NotImplementedError
+
+    def flush(self):
+        """
+        Make sure that all writes have reached permanent storage. This
+        does nothing for stores that write through immediately.
+        """
+        pass
+
+    def wait_for_change(self, timeout):
+        """
+        Wait until the sessions may have been changed by something
+        other than this store, e.g. PuTTY itself or a script. Which
+        sessions changed is found by comparing last write times
+        afterwards.
+
+        By default, this simply waits for the timeout, so that callers
+        poll the write times; stores that can be notified of changes
+        return as soon as one happens.
+
+        Parameters
+        ----------
+        timeout : float
+            the longest time to wait, in seconds
+
+        Returns
+        -------
+        bool
+            False when nothing can have changed, True when something
+            may have
+        """
+        time.sleep(timeout)
+        return True
+
+class WinRegSessionStore(SessionStore):
+    """
+    a session store backed by the Windows registry
+
+    This is where PuTTY itself keeps its sessions. winreg is only
+    imported when an instance is created, so this module can still be
+    imported on other platforms.
+
+    Attributes
+    ----------
+    winreg : module
+        the module that registry calls are made through; it can be
+        replaced by an object with the same functions, e.g. to time
+        each call
+    """
+
+    def __init__(self, base_path=BASE_PUTTY_PATH):
+        """
+        Parameters
+        ----------
+        base_path : string, optional
+            the path under HKEY_CURRENT_USER that holds one subkey per
+            session, ending in a backslash
+        """
+        import winreg
+        self.winreg = winreg
+        self.base_path = base_path
+        self.location = REG_FILE_ROOT + '\\' + base_path
+        # The key and event used by wait_for_change, and whether a
+        # notification is still registered on them.
+        self._notify_key = None
+        self._notify_event = None
+        self._notify_armed = False
+
+    def _open_session(self, session_name, access=None):
+        """
+        a helper method that opens the registry key for a session,
+        converting a missing key into a KeyError
+        """
+        winreg = self.winreg
+        if access is None:
+            access = winreg.KEY_READ
+        try:
+            return winreg.OpenKey(winreg.HKEY_CURRENT_USER,
+                                  self.base_path + session_name,
+                                  WINDOWS_RESERVED, access)
+        except FileNotFoundError:
+            raise KeyError('No PuTTY session named {0}'.format(session_name))
+
+    def get_session_names(self):
+        session_names = []
+        winreg = self.winreg
+
+        with winreg.OpenKey(winreg.HKEY_CURRENT_USER, self.base_path) as base:
+            try:
+                i = 0
+                while True:
+                    session_names.append(winreg.EnumKey(base, i))
+                    i += 1
+            except OSError:
+                pass
+
+        return session_names
+
+    def query_values(self, session_name, value_names=None):
+        winreg = self.winreg
+        values = {}
+
+        with self._open_session(session_name) as session:
+            if value_names is None:
+                values = self._enum_values(session)
+            else:
+                for name in value_names:
+                    try:
+                        values[name] = winreg.QueryValueEx(session, name)
+                    except FileNotFoundError:
+                        pass
+
+        return values
+
+    def _enum_values(self, key, wanted=None):
+        """
+        a helper method that reads the values of an open key with
+        EnumValue, keeping only the names in wanted when it is given
+        """
+        winreg = self.winreg
+        values = {}
+        try:
+            i = 0
+            while True:
+                name, data, reg_type = winreg.EnumValue(key, i)
+                if wanted is None or name in wanted:
+                    values[name] = (data, reg_type)
+                i += 1
+        except OSError:
+            pass
+        return values
+
+    def iter_session_values(self, value_names=None):
+        # Open the base key once and open each session relative to it,
+        # reading all of its values in one enumeration instead of one
+        # QueryValueEx call per value.
+        winreg = self.winreg
+        wanted = None if value_names is None else frozenset(value_names)
+
+        with winreg.OpenKey(winreg.HKEY_CURRENT_USER, self.base_path) as base:
+            i = 0
+            while True:
+                try:
+                    session_name = winreg.EnumKey(base, i)
+                except OSError:
+                    break
+                i += 1
+                try:
+                    with winreg.OpenKey(base, session_name) as session:
+                        values = self._enum_values(session, wanted)
+                except FileNotFoundError:
+                    continue
+                yield session_name, values
+
+    def set_values(self, session_name, values):
+        winreg = self.winreg
+
+        with self._open_session(session_name, winreg.KEY_WRITE) as session:
+            for name, (data, reg_type) in values.items():
+                winreg.SetValueEx(session, name, WINDOWS_RESERVED, reg_type,
+                                  data)
+
+    def delete_values(self, session_name, value_names):
+        winreg = self.winreg
+
+        with self._open_session(session_name, winreg.KEY_WRITE) as session:
+            for name in value_names:
+                try:
+                    winreg.DeleteValue(session, name)
+                except FileNotFoundError:
+                    pass
+
+    def get_last_write_time(self, session_name=None):
+        winreg = self.winreg
+        if session_name is None:
+            with winreg.OpenKey(winreg.HKEY_CURRENT_USER,
+                                self.base_path) as base:
+                return winreg.QueryInfoKey(base)[2]
+        with self._open_session(session_name) as session:
+            return winreg.QueryInfoKey(session)[2]
+
+    def wait_for_change(self, timeout):
+        # RegNotifyChangeKeyValue signals an event when anything under
+        # the sessions key changes. A notification only fires once, so
+        # it is registered again after each one. It has to be called
+        # from the thread that waits, since the registration ends when
+        # that thread exits.
+        import ctypes
+        advapi32 = ctypes.windll.advapi32
+        kernel32 = ctypes.windll.kernel32
+        if self._notify_key is None:
+            self._notify_key = self.winreg.OpenKey(
+                self.winreg.HKEY_CURRENT_USER, self.base_path,
+                WINDOWS_RESERVED, self.winreg.KEY_NOTIFY)
+            self._notify_event = kernel32.CreateEventW(None, False, False,
+                                                       None)
+        if not self._notify_armed:
+            error = advapi32.RegNotifyChangeKeyValue(
+                ctypes.c_void_p(int(self._notify_key)), True,
+                REG_NOTIFY_FILTER, ctypes.c_void_p(self._notify_event), True)
+            if error:
+                raise OSError(error, 'RegNotifyChangeKeyValue failed')
+            self._notify_armed = True
+        if kernel32.WaitForSingleObject(ctypes.c_void_p(self._notify_event),
+                                        int(timeout * 1000)) != WAIT_OBJECT_0:
+            return False
+        self._notify_armed = False
+        return True
+
+class MemorySessionStore(SessionStore):
+    """
+    a session store that keeps every session in a dictionary
+
+    It is safe to use from multiple threads. Its timestamps come from a
+    counter rather than a clock, so every write gets a distinct time.
+    """
+
+    def __init__(self, sessions=None):
+        """
+        Parameters
+        ----------
+        sessions : dict, optional
+            the initial sessions, as a mapping of session names to
+            dicts of value names and (data, type) tuples
+        """
+        self._lock = threading.Lock()
+        self._clock = itertools.count(1)
+        self._sessions = {}
+        self._write_times = {}
+        self._base_write_time = next(self._clock)
+        for session_name, values in (sessions or {}).items():
+            self.add_session(session_name, values)
+
+    def add_session(self, session_name, values=None):
+        """
+        Create a new session, replacing any existing session with the
+        same name.
+
+        Parameters
+        ----------
+        session_name : string
+            the name of the PuTTY session as it appears in the registry
+        values : dict, optional
+            a mapping of value names to (data, type) tuples
+        """
+        with self._lock:
+            self._sessions[session_name] = dict(values or {})
+            self._write_times[session_name] = next(self._clock)
+            self._base_write_time = self._write_times[session_name]
+
+    def delete_session(self, session_name):
+        """
+        Remove a session from the store.
+
+        Raises
+        ------
+        KeyError
+            when the session doesn't exist
+        """
+        with self._lock:
+            del self._sessions[session_name]
+            del self._write_times[session_name]
+            self._base_write_time = next(self._clock)
+
+    def _get_session(self, session_name):
+        """
+        a helper method that looks up a session's values, raising a
+        KeyError with a readable message when it is missing
+        """
+        try:
+            return self._sessions[session_name]
+        except KeyError:
+            raise KeyError('No PuTTY session named {0}'.format(session_name))
+
+    def get_session_names(self):
+        # The registry enumerates subkeys in sorted order.
+        with self._lock:
+            return sorted(self._sessions, key=session_sort_key)
+
+    def query_values(self, session_name, value_names=None):
+        with self._lock:
+            session = self._get_session(session_name)
+            if value_names is None:
+                return dict(session)
+            return {name: session[name] for name in value_names
+                    if name in session}
+
+    def iter_session_values(self, value_names=None):
+        with self._lock:
+            session_names = sorted(self._sessions, key=session_sort_key)
+        for session_name in session_names:
+            with self._lock:
+                session = self._sessions.get(session_name)
+                if session is None:
+                    continue
+                if value_names is None:
+                    values = dict(session)
+                else:
+                    values = {name: session[name] for name in value_names
+                              if name in session}
+            yield session_name, values
+
+    def set_values(self, session_name, values):
+        with self._lock:
+            self._get_session(session_name).update(values)
+            self._write_times[session_name] = next(self._clock)
+
+    def delete_values(self, session_name, value_names):
+        with self._lock:
+            session = self._get_session(session_name)
+            for name in value_names:
+                session.pop(name, None)
+            self._write_times[session_name] = next(self._clock)
+
+    def get_last_write_time(self, session_name=None):
+        with self._lock:
+            if session_name is None:
+                return self._base_write_time
+            self._get_session(session_name)
+            return self._write_times[session_name]
+
+class RegFileSessionStore(MemorySessionStore):
+    """
+    a session store backed by a registry export (.reg) file
+
+    The PuTTY sessions in the file are loaded into memory when the
+    store is created. Writes are kept in memory until flush is called,
+    which rewrites the file. Changes made to the file by something else
+    are picked up by reload.
+    """
+
+    def __init__(self, filename, base_path=BASE_PUTTY_PATH):
+        """
+        Parameters
+        ----------
+        filename : string
+            the name of the .reg file; it may not exist yet, in which
+            case the store starts empty
+        base_path : string, optional
+            the path under HKEY_CURRENT_USER that holds one subkey per
+            session, ending in a backslash
+        """
+        MemorySessionStore.__init__(self)
+        self.filename = filename
+        self.location = os.path.abspath(filename)
+        self.key_prefix = REG_FILE_ROOT + '\\' + base_path
+        self._dirty = False
+
+        sessions, file_time = self._load()
+        for session_name, values in sessions.items():
+            self.add_session(session_name, values)
+        self._dirty = False
+        self._file_time = file_time
+
+        # Every loaded session takes the file's modification time, so
+        # that the timestamps stay comparable between runs and change
+        # when the file is changed by something else.
+        self._clock = itertools.count(file_time + 1)
+        self._base_write_time = file_time
+        for session_name in self._write_times:
+            self._write_times[session_name] = file_time
+
+    def _load(self):
+        """
+        a helper method that reads the sessions from the file, returning
+        them along with the file's modification time (0 when it doesn't
+        exist)
+        """
+        try:
+            keys = list(regfile.iter_reg_file(self.filename, self.key_prefix))
+            file_time = os.stat(self.filename).st_mtime_ns
+        except FileNotFoundError:
+            return {}, 0
+        sessions = {}
+        for key_path, values in keys:
+            session_name = key_path[len(self.key_prefix):]
+            # Only direct subkeys of the base path are sessions.
+            if session_name and '\\' not in session_name:
+                sessions[session_name] = values
+        return sessions, file_time
+
+    def _file_changed(self):
+        """
+        a helper method that checks whether the file has been written
+        since it was loaded or last flushed
+        """
+        try:
+            return os.stat(self.filename).st_mtime_ns != self._file_time
+        except FileNotFoundError:
+            return self._file_time != 0
+
+    def reload(self):
+        """
+        Read the file again if something else has written it since it
+        was loaded or last flushed. Only the sessions whose values
+        differ get new last write times, and the store's own time only
+        changes when sessions were added or removed. Nothing is reloaded
+        while there are writes that haven't been flushed, so they can't
+        be lost.
+
+        Returns
+        -------
+        bool
+            True when the file was read again
+        """
+        if self._dirty or not self._file_changed():
+            return False
+        sessions, file_time = self._load()
+        with self._lock:
+            if set(sessions) != set(self._sessions):
+                self._base_write_time = next(self._clock)
+            for session_name in list(self._sessions):
+                if session_name not in sessions:
+                    del self._sessions[session_name]
+                    del self._write_times[session_name]
+            for session_name, values in sessions.items():
+                if self._sessions.get(session_name) != values:
+                    self._sessions[session_name] = values
+                    self._write_times[session_name] = next(self._clock)
+            self._file_time = file_time
+        return True
+
+    def wait_for_change(self, timeout):
+        # Polls the file's modification time, which costs a single stat.
+        time.sleep(timeout)
+        return self.reload()
+
+    def add_session(self, session_name, values=None):
+        MemorySessionStore.add_session(self, session_name, values)
+        self._dirty = True
+
+    def delete_session(self, session_name):
+        MemorySessionStore.delete_session(self, session_name)
+        self._dirty = True
+
+    def set_values(self, session_name, values):
+        MemorySessionStore.set_values(self, session_name, values)
+        self._dirty = True
+
+    def delete_values(self, session_name, value_names):
+        MemorySessionStore.delete_values(self, session_name, value_names)
+        self._dirty = True
+
+    def flush(self):
+        """
+        Rewrite the .reg file with the current contents of the store,
+        if anything has changed since it was loaded or last flushed.
+        """
+        if not self._dirty:
+            return
+        with self._lock:
+            keys = [(self.key_prefix + name, dict(self._sessions[name]))
+                    for name in sorted(self._sessions,
+                                       key=session_sort_key)]
+        regfile.write_reg_file(self.filename, keys)
+        self._dirty = False
+        self._file_time = os.stat(self.filename).st_mtime_ns
+
+class _ProfiledModule(object):
+    """
+    a helper class that wraps a module, such as winreg, timing each
+    call to its functions as 'module.function'
+    """
+
+    def __init__(self, module, profiler):
+        self._module = module
+        self._profiler = profiler
+        self._prefix = module.__name__ + '.'
+
+    def __getattr__(self, name):
+        attribute = getattr(self._module, name)
+        if not callable(attribute) or isinstance(attribute, type):
+            return attribute
+        profiler = self._profiler
+        operation = self._prefix + name
+
+        def call(*args, **kwargs):
+            if not profiler.enabled:
+                return attribute(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return attribute(*args, **kwargs)
+            finally:
+                profiler.record(operation, time.perf_counter() - start)
+
+        # Cache the wrapper, so __getattr__ only runs once per name.
+        setattr(self, name, call)
+        return call
+
+class ProfiledSessionStore(SessionStore):
+    """
+    a session store that passes every call on to another store, timing
+    each one as 'store.method' while its profiler is enabled
+
+    For a WinRegSessionStore, the registry calls it makes
+    (OpenKey, QueryValueEx, SetValueEx and so on) are timed as well, as
+    'winreg.function'. Attributes that aren't part of the SessionStore
+    interface are looked up on the wrapped store.
+
+    Attributes
+    ----------
+    store : SessionStore
+        the wrapped store
+    profiler : profiling.Profiler
+        where the timings are recorded
+    """
+
+    def __init__(self, store, profiler=None):
+        """
+        Parameters
+        ----------
+        store : SessionStore
+            the store to wrap
+        profiler : profiling.Profiler, optional
+            by default, the profiler returned by profiling.get_profiler
+        """
+        self.store = store
+        self.profiler = (profiler if profiler is not None
+                         else profiling.get_profiler())
+        self.location = store.location
+        if isinstance(store, WinRegSessionStore):
+            store.winreg = _ProfiledModule(store.winreg, self.profiler)
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+    def _call(self, operation, method, *args):
+        """
+        a helper method that calls a method of the wrapped store,
+        timing it when the profiler is enabled
+        """
+        if not self.profiler.enabled:
+            return method(*args)
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self.profiler.record(operation, time.perf_counter() - start)
+
+    def get_session_names(self):
+        return self._call('store.get_session_names',
+                          self.store.get_session_names)
+
+    def query_values(self, session_name, value_names=None):
+        return self._call('store.query_values', self.store.query_values,
+                          session_name, value_names)
+
+    def iter_session_values(self, value_names=None):
+        # Each session read counts as one call.
+        sessions = self.store.iter_session_values(value_names)
+        while True:
+            try:
+                yield self._call('store.iter_session_values', next, sessions)
+            except StopIteration:
+                return
+
+    def set_values(self, session_name, values):
+        return self._call('store.set_values', self.store.set_values,
+                          session_name, values)
+
+    def delete_values(self, session_name, value_names):
+        return self._call('store.delete_values', self.store.delete_values,
+                          session_name, value_names)
+
+    def get_last_write_time(self, session_name=None):
+        return self._call('store.get_last_write_time',
+                          self.store.get_last_write_time, session_name)
+
+    def flush(self):
+        return self._call('store.flush', self.store.flush)
+
+def default_store():
+    """
+    Create the session store for the current platform.
+
+    Returns
+    -------
+    SessionStore
+        a WinRegSessionStore on Windows; elsewhere, an empty
+        MemorySessionStore
+    """
+    try:
+        return WinRegSessionStore()
+    except ImportError:
+        return MemorySessionStore()
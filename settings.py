@@ -0,0 +1,156 @@
+import fnmatch
+
+import colorinterface
+
+"""
+settings.py
+
+This file reads and copies any PuTTY session settings, not just colors,
+e.g. to roll font, keepalive or scrollback settings out to thousands
+of sessions. Settings are handled as the registry values that hold
+them, as (data, type) tuples, so their types are kept as they are.
+
+Writes go through colorinterface.write_session_values (or a
+journal.ApplyHistory), so they are batched, spread over a pool of
+threads, and only write the values that actually differ.
+"""
+
+# Named groups of PuTTY settings, by the registry values that hold
+# them. A group name can be used anywhere a list of value names is
+# expected.
+SETTING_GROUPS = {
+    'colours': colorinterface.REG_COLOR_NAMES,
+    'fonts': ['Font', 'FontIsBold', 'FontCharSet', 'FontHeight',
+              'FontQuality', 'FontVTMode'],
+    'keepalives': ['PingInterval', 'PingIntervalSecs', 'TCPKeepalives'],
+    'scrollback': ['ScrollbackLines', 'ScrollOnKey', 'ScrollOnDisp',
+                   'EraseToScrollback'],
+    'terminal-type': ['TerminalType', 'TerminalSpeed', 'TerminalModes'],
+}
+
+def expand_setting_names(names):
+    """
+    Expand group names (see SETTING_GROUPS) into the value names they
+    stand for.
+
+    Parameters
+    ----------
+    names : iterable
+        group names and registry value names, in any mix
+
+    Returns
+    -------
+    list
+        the registry value names, without duplicates, in the order
+        given
+    """
+    value_names = []
+    for name in names:
+        group = SETTING_GROUPS.get(name)
+        value_names.extend(group if group is not None else [name])
+    return list(dict.fromkeys(value_names))
+
+def match_session_names(session_names, patterns):
+    """
+    Find the sessions whose names match any of a list of glob patterns.
+    Each pattern is matched against both the registry form of a name
+    and the form with spaces.
+
+    Returns
+    -------
+    list
+        the matching names, in the order of session_names
+    """
+    return [session_name for session_name in session_names
+            if any(fnmatch.fnmatchcase(session_name, pattern) or
+                   fnmatch.fnmatchcase(session_name.replace('%20', ' '),
+                                       pattern)
+                   for pattern in patterns)]
+
+def read_session_settings(session_name, value_names, store=None):
+    """
+    Read named values from a single PuTTY session.
+
+    Parameters
+    ----------
+    session_name : string
+        the name of the PuTTY session as it appears in the registry
+    value_names : iterable
+        the registry value names or group names to read
+    store : sessionstore.SessionStore, optional
+        the store that holds the session
+
+    Returns
+    -------
+    dict
+        maps each value name to a (data, type) tuple
+
+    Raises
+    ------
+    KeyError
+        when the session doesn't exist or is missing any of the values
+    """
+    if store is None:
+        store = colorinterface.get_session_store()
+    value_names = expand_setting_names(value_names)
+    values = store.query_values(session_name, value_names)
+    missing = [name for name in value_names if name not in values]
+    if missing:
+        raise KeyError('{0} has no value for {1}'.format(
+            session_name, ', '.join(missing)))
+    return values
+
+def copy_settings(source_session, value_names, target_sessions, store=None,
+                  history=None,
+                  max_workers=colorinterface.DEFAULT_APPLY_WORKERS,
+                  progress=None, cancel_event=None):
+    """
+    Copy named values from one PuTTY session to many others, keeping
+    their registry types.
+
+    Parameters
+    ----------
+    source_session : string
+        the session to copy the values from
+    value_names : iterable
+        the registry value names or group names to copy
+    target_sessions : iterable
+        the sessions to copy the values to; the source session is
+        skipped if it is among them
+    store : sessionstore.SessionStore, optional
+        the store that holds the sessions
+    history : journal.ApplyHistory, optional
+        when given, the values are written as a single transaction
+        through it instead, so they can be undone; its store is used in
+        place of store
+    max_workers : int, optional
+        the number of threads used to read and write sessions
+    progress : callable, optional
+        called as progress(done, total) as sessions are written
+    cancel_event : threading.Event, optional
+        when set, sessions that haven't been written yet are skipped
+
+    Returns
+    -------
+    colorinterface.BulkApplyResult
+        the per-session outcome and total number of writes
+
+    Raises
+    ------
+    KeyError
+        when the source session doesn't exist or is missing any of the
+        values
+    """
+    if history is not None:
+        store = history.store
+    elif store is None:
+        store = colorinterface.get_session_store()
+    values = read_session_settings(source_session, value_names, store)
+    session_values = ((session_name, values)
+                      for session_name in target_sessions
+                      if session_name != source_session)
+    if history is not None:
+        return history.apply(session_values, max_workers, progress,
+                             cancel_event)
+    return colorinterface.write_session_values(
+        session_values, store, max_workers, progress, cancel_event)
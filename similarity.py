@@ -0,0 +1,200 @@
+import heapq
+
+import colorinterface
+
+"""
+similarity.py
+
+This file finds the themes that look the most like a color scheme.
+Colors are compared in CIELAB, where the distance between two colors
+approximates how different they look, and schemes by the average
+difference between their matching colors. ThemeSimilarityIndex arranges
+a theme library in a vantage-point tree, so that finding the closest
+themes only compares against a small part of the library.
+"""
+
+# The D65 reference white used by CIELAB.
+_D65_WHITE = (0.95047, 1.0, 1.08883)
+
+def _lab_f(t):
+    """a helper function for the CIELAB conversion"""
+    if t > 216.0 / 24389.0:
+        return t ** (1.0 / 3.0)
+    return (24389.0 / 27.0 * t + 16.0) / 116.0
+
+def color_to_lab(color):
+    """
+    Convert a color into CIELAB (D65), in which the distance between
+    two colors approximates how different they look.
+
+    Parameters
+    ----------
+    color : tuple
+        the RGB integer values of the color
+
+    Returns
+    -------
+    tuple
+        the L*, a* and b* values of the color
+    """
+    linear = colorinterface.LINEAR_COMPONENTS
+    r, g, b = [linear[x] for x in color]
+    x = (0.4124 * r + 0.3576 * g + 0.1805 * b) / _D65_WHITE[0]
+    y = (0.2126 * r + 0.7152 * g + 0.0722 * b) / _D65_WHITE[1]
+    z = (0.0193 * r + 0.1192 * g + 0.9505 * b) / _D65_WHITE[2]
+    fx, fy, fz = _lab_f(x), _lab_f(y), _lab_f(z)
+    return (116.0 * fy - 16.0, 500.0 * (fx - fy), 200.0 * (fy - fz))
+
+def scheme_to_lab(scheme, lab_cache=None):
+    """
+    Convert every color of a scheme to CIELAB.
+
+    Parameters
+    ----------
+    scheme : colorinterface.ColorScheme or list
+        the colors to convert
+    lab_cache : dict, optional
+        maps RGB tuples to the CIELAB colors already converted, so that
+        each distinct color is converted only once across many schemes
+
+    Returns
+    -------
+    list
+        the L*, a* and b* values of each color, in PUTTY_COLOR_ORDER
+        order
+    """
+    if lab_cache is None:
+        lab_cache = {}
+    labs = []
+    for color in colorinterface.ColorScheme.from_colors(scheme):
+        lab = lab_cache.get(color)
+        if lab is None:
+            lab = lab_cache[color] = color_to_lab(color)
+        labs.append(lab)
+    return labs
+
+def scheme_distance(lab1, lab2):
+    """
+    Get the perceptual distance between two schemes: the CIE76 color
+    difference (delta E) between each pair of matching colors, averaged
+    over all of the colors.
+
+    Parameters
+    ----------
+    lab1, lab2 : list
+        the schemes' colors in CIELAB, as returned by scheme_to_lab
+
+    Returns
+    -------
+    float
+        the average delta E; a value below about 2.3 is generally too
+        small to notice
+    """
+    total = 0.0
+    for (l1, a1, b1), (l2, a2, b2) in zip(lab1, lab2):
+        total += ((l1 - l2) ** 2 + (a1 - a2) ** 2 + (b1 - b2) ** 2) ** 0.5
+    return total / len(lab1)
+
+class ThemeSimilarityIndex(object):
+    """
+    an index for finding the themes closest to a color scheme
+
+    Every theme is converted to CIELAB once, when the index is built,
+    and the themes are arranged in a vantage-point tree. The average
+    delta E used by scheme_distance is a true distance (it obeys the
+    triangle inequality), so a k-nearest search only has to visit the
+    parts of the tree that could hold a closer theme, rather than
+    comparing against every theme in the library.
+
+    Attributes
+    ----------
+    themes : dict
+        the themes the index was built from
+    names : list
+        the names of the themes
+    """
+
+    def __init__(self, themes):
+        """
+        Parameters
+        ----------
+        themes : dict
+            maps theme names (e.g. file paths) to
+            colorinterface.ColorSchemes or color lists
+        """
+        self.themes = themes
+        lab_cache = {}
+        self.names = list(themes)
+        self._labs = [scheme_to_lab(themes[name], lab_cache)
+                      for name in self.names]
+        self._root = self._build(list(range(len(self.names))))
+
+    def _build(self, indexes):
+        """
+        a helper method that builds the vantage-point tree for a list of
+        theme indexes
+
+        Each node is a (vantage index, radius, inside, outside) tuple,
+        where inside holds the themes closer to the vantage point than
+        the radius and outside holds the rest.
+        """
+        if not indexes:
+            return None
+        vantage = indexes[0]
+        others = indexes[1:]
+        if not others:
+            return (vantage, 0.0, None, None)
+        vantage_lab = self._labs[vantage]
+        distances = sorted((scheme_distance(vantage_lab, self._labs[x]), x)
+                           for x in others)
+        middle = len(distances) // 2
+        radius = distances[middle][0]
+        return (vantage, radius,
+                self._build([x for d, x in distances[:middle]]),
+                self._build([x for d, x in distances[middle:]]))
+
+    def nearest(self, scheme, k=1):
+        """
+        Find the themes closest to a scheme.
+
+        Parameters
+        ----------
+        scheme : colorinterface.ColorScheme or list
+            the colors to compare against
+        k : int, optional
+            the number of themes to return
+
+        Returns
+        -------
+        list
+            up to k (theme name, distance) tuples, closest first; see
+            scheme_distance for the meaning of the distance
+        """
+        target = scheme_to_lab(scheme)
+        # A max-heap (by negated distance) of the best matches so far.
+        best = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            vantage, radius, inside, outside = node
+            distance = scheme_distance(target, self._labs[vantage])
+            if len(best) < k:
+                heapq.heappush(best, (-distance, vantage))
+            elif distance < -best[0][0]:
+                heapq.heapreplace(best, (-distance, vantage))
+
+            limit = -best[0][0] if len(best) == k else float('inf')
+            # Visit the more promising side last, so it is searched
+            # first, which tightens the limit for the other side.
+            if distance < radius:
+                if distance + limit >= radius:
+                    stack.append(outside)
+                stack.append(inside)
+            else:
+                if distance - limit <= radius:
+                    stack.append(inside)
+                stack.append(outside)
+
+        return [(self.names[x], -d) for d, x in sorted(best, reverse=True)]
@@ -0,0 +1,216 @@
+import os
+import struct
+
+import colorinterface
+
+"""
+snapshot.py
+
+This file saves and loads snapshots of PuTTY session names and colors,
+so that the GUI can show the session list straight away on startup
+while the live session store is checked in the background.
+
+A snapshot is a small binary file. Each distinct color scheme is stored
+once as 66 bytes (22 colors of three bytes each), and each session is
+stored as its last write time, the index of its scheme and its name:
+
+    header       magic, source length, scheme count, session count
+    source       the location of the store the snapshot was taken from
+    schemes      scheme count * 66 bytes
+    sessions     write time, scheme index, name length, name (UTF-8)
+"""
+
+SNAPSHOT_MAGIC = b'PCMSNAP1'
+SNAPSHOT_FILE_NAME = 'snapshot.bin'
+# The number of bytes used to store one color scheme.
+SCHEME_SIZE = colorinterface.SCHEME_SIZE
+# The scheme index used for sessions whose colors couldn't be read.
+NO_SCHEME = 0xFFFFFFFF
+
+_HEADER = struct.Struct('<8sHII')
+_SESSION = struct.Struct('<QIH')
+
+def default_snapshot_path():
+    """
+    Get the per-user location of the snapshot file.
+
+    Returns
+    -------
+    string
+        a path under %LOCALAPPDATA% on Windows, or under
+        $XDG_CACHE_HOME (~/.cache by default) elsewhere
+    """
+    base_dir = os.environ.get('LOCALAPPDATA') or \
+        os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base_dir, 'puttycolormanager', SNAPSHOT_FILE_NAME)
+
+def save_snapshot(path, entries, source):
+    """
+    Write a snapshot to file. The file is replaced atomically, so a
+    failed write leaves any previous snapshot intact.
+
+    Parameters
+    ----------
+    path : string
+        the name of the snapshot file
+    entries : dict
+        maps each session name to a (write_time, scheme) tuple, where
+        scheme is a colorinterface.ColorScheme (or color list), or None
+        when the session's colors couldn't be read
+    source : string
+        the location of the store the entries were read from (see
+        sessionstore.SessionStore.location)
+
+    Raises
+    ------
+    IOError
+        when the file is not writable
+    """
+    scheme_indexes = {}
+    scheme_blobs = []
+    session_records = []
+
+    for session_name, (write_time, scheme) in entries.items():
+        if scheme is None:
+            scheme_index = NO_SCHEME
+        else:
+            blob = colorinterface.ColorScheme.from_colors(scheme).data
+            scheme_index = scheme_indexes.get(blob)
+            if scheme_index is None:
+                scheme_index = scheme_indexes[blob] = len(scheme_blobs)
+                scheme_blobs.append(blob)
+        encoded_name = session_name.encode('utf-8')
+        session_records.append(
+            _SESSION.pack(write_time, scheme_index, len(encoded_name)))
+        session_records.append(encoded_name)
+
+    encoded_source = source.encode('utf-8')
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as snapshot_file:
+        snapshot_file.write(_HEADER.pack(SNAPSHOT_MAGIC, len(encoded_source),
+                                         len(scheme_blobs), len(entries)))
+        snapshot_file.write(encoded_source)
+        snapshot_file.write(b''.join(scheme_blobs))
+        snapshot_file.write(b''.join(session_records))
+    os.replace(temp_path, path)
+
+def load_snapshot(path, source):
+    """
+    Read a snapshot from file.
+
+    Parameters
+    ----------
+    path : string
+        the name of the snapshot file
+    source : string
+        the location of the store that the snapshot needs to have been
+        taken from
+
+    Returns
+    -------
+    dict
+        the entries, in the format accepted by save_snapshot, with each
+        scheme as an interned colorinterface.ColorScheme. None is
+        returned when the file doesn't exist, is damaged, or was taken
+        from another store.
+    """
+    try:
+        with open(path, 'rb') as snapshot_file:
+            data = snapshot_file.read()
+    except OSError:
+        return None
+
+    try:
+        magic, source_len, scheme_count, session_count = \
+            _HEADER.unpack_from(data, 0)
+        if magic != SNAPSHOT_MAGIC:
+            return None
+        offset = _HEADER.size
+        if data[offset:offset + source_len].decode('utf-8') != source:
+            return None
+        offset += source_len
+
+        schemes = []
+        for _ in range(scheme_count):
+            schemes.append(colorinterface.ColorScheme.intern(
+                colorinterface.ColorScheme(data[offset:offset + SCHEME_SIZE])))
+            offset += SCHEME_SIZE
+
+        entries = {}
+        for _ in range(session_count):
+            write_time, scheme_index, name_len = \
+                _SESSION.unpack_from(data, offset)
+            offset += _SESSION.size
+            session_name = data[offset:offset + name_len].decode('utf-8')
+            offset += name_len
+            scheme = None if scheme_index == NO_SCHEME \
+                else schemes[scheme_index]
+            entries[session_name] = (write_time, scheme)
+    except (struct.error, UnicodeDecodeError, IndexError):
+        return None
+
+    return entries
+
+def reconcile_snapshot(entries, store=None, progress=None, cancel_event=None):
+    """
+    Bring snapshot entries up to date with a session store. Only the
+    sessions whose last write time differs from the one in the
+    snapshot have their colors read again.
+
+    Parameters
+    ----------
+    entries : dict
+        the snapshot entries, as returned by load_snapshot; an empty
+        dict reads every session
+    store : sessionstore.SessionStore, optional
+        the store that holds the sessions
+    progress : callable, optional
+        called as progress(done, total) as each session is checked
+    cancel_event : threading.Event, optional
+        when set, the check stops early; the entries for the sessions
+        that weren't checked are returned unchanged
+
+    Returns
+    -------
+    tuple
+        (updated_entries, changed, removed), where updated_entries has
+        the same format as entries, changed is a list of the sessions
+        that were added or whose colors differ from the snapshot, and
+        removed is a list of the sessions that no longer exist
+    """
+    if store is None:
+        store = colorinterface.get_session_store()
+    updated_entries = {}
+    changed = []
+
+    session_names = store.get_session_names()
+    for done, session_name in enumerate(session_names, 1):
+        if cancel_event is not None and cancel_event.is_set():
+            for session_name in session_names[done - 1:]:
+                if session_name in entries:
+                    updated_entries[session_name] = entries[session_name]
+            break
+        if progress is not None:
+            progress(done, len(session_names))
+        try:
+            write_time = store.get_last_write_time(session_name)
+        except KeyError:
+            continue
+        cached = entries.get(session_name)
+        if cached is not None and cached[0] == write_time:
+            updated_entries[session_name] = cached
+            continue
+        try:
+            scheme = colorinterface.ColorScheme.intern(
+                colorinterface.read_session_colors(session_name, store))
+        except (KeyError, ValueError):
+            scheme = None
+        updated_entries[session_name] = (write_time, scheme)
+        if cached is None or cached[1] != scheme:
+            changed.append(session_name)
+
+    removed = [session_name for session_name in entries
+               if session_name not in updated_entries]
+    return updated_entries, changed, removed
@@ -0,0 +1,676 @@
+import argparse
+import codecs
+import concurrent.futures
+import json
+import os
+import re
+import sys
+import time
+import xml.etree.ElementTree as ElementTree
+
+import colorcodec
+import colorinterface
+
+"""
+themeimport.py
+
+This file converts terminal themes from other applications into PuTTY
+color schemes and theme INI files. The supported formats are:
+
+    itermcolors      iTerm2 color presets (XML property lists)
+    xresources       X resources (*.color0, *.foreground, ...), with
+                     #define macros
+    windowsterminal  Windows Terminal color schemes (JSON), either a
+                     single scheme, a list of schemes or a settings
+                     file with a "schemes" list
+    base16           base16 scheme YAML files; a file may hold several
+                     schemes as separate YAML documents
+
+Every format is read with a streaming parser, one theme at a time, so a
+bundle holding thousands of themes never has to fit in memory. Each
+theme is first read into a palette (foreground, background, cursor and
+the 16 ANSI colors), which is then mapped onto PUTTY_COLOR_ORDER.
+
+Whole directories are converted in a pool of worker processes, and the
+number of themes converted per second is reported along with the files
+that couldn't be converted.
+"""
+
+# The extensions of each format's files; files with other extensions
+# are recognized by their content.
+FORMAT_EXTENSIONS = {
+    '.itermcolors': 'itermcolors',
+    '.xresources': 'xresources',
+    '.xdefaults': 'xresources',
+    '.json': 'windowsterminal',
+    '.yaml': 'base16',
+    '.yml': 'base16',
+}
+# The formats whose files can hold more than one theme.
+BUNDLE_FORMATS = frozenset(['windowsterminal', 'base16'])
+# Below this many files, converting in the calling process is quicker
+# than starting a process pool.
+PROCESS_POOL_THRESHOLD = 16
+# The number of characters read from a file at a time.
+READ_SIZE = 65536
+# The palette keys for the 16 ANSI colors, in order: the normal colors
+# 0 to 7, then their bright versions 8 to 15.
+ANSI_KEYS = ['ansi{0}'.format(x) for x in range(16)]
+
+def parse_hex_color(text):
+    """
+    Convert a color written as #rrggbb (the # is optional, as in base16
+    files), optionally in quotes, into an RGB tuple. Anything else
+    colorcodec.decode_color accepts, such as an X11 rgb:r/g/b
+    specification, is accepted as well.
+
+    Raises
+    ------
+    ValueError
+        when the text isn't a color
+    """
+    text = text.strip().strip('"\'')
+    if len(text) == 6 and ',' not in text and ':' not in text:
+        text = '#' + text
+    return colorcodec.decode_color(text)
+
+def palette_to_scheme(palette):
+    """
+    Map a palette onto PUTTY_COLOR_ORDER.
+
+    Parameters
+    ----------
+    palette : dict
+        maps 'foreground', 'background', the ANSI_KEYS and optionally
+        'bold', 'cursor' and 'cursor_text' to RGB tuples. The bold
+        foreground defaults to the foreground, the cursor to the
+        foreground and the cursor text to the background; the bold
+        background is always the background.
+
+    Returns
+    -------
+    colorinterface.ColorScheme
+        the interned scheme
+
+    Raises
+    ------
+    ValueError
+        when a required color is missing or out of range
+    """
+    missing = [key for key in ['foreground', 'background'] + ANSI_KEYS
+               if key not in palette]
+    if missing:
+        raise ValueError('Missing colors: {0}'.format(', '.join(missing)))
+    foreground = palette['foreground']
+    background = palette['background']
+    colors = [foreground,
+              palette.get('bold', foreground),
+              background,
+              background,
+              palette.get('cursor_text', background),
+              palette.get('cursor', foreground)]
+    for x in range(8):
+        colors.append(palette[ANSI_KEYS[x]])
+        colors.append(palette[ANSI_KEYS[x + 8]])
+    return colorinterface.ColorScheme.intern(
+        [tuple(color) for color in colors])
+
+def _read_chunks(path):
+    """
+    a helper generator that reads a text file in chunks, detecting a
+    UTF-8 or UTF-16 byte order mark
+    """
+    with open(path, 'rb') as theme_file:
+        start = theme_file.read(4)
+    encoding = 'utf-8'
+    if start.startswith(codecs.BOM_UTF16_LE) or \
+       start.startswith(codecs.BOM_UTF16_BE):
+        encoding = 'utf-16'
+    elif start.startswith(codecs.BOM_UTF8):
+        encoding = 'utf-8-sig'
+    with open(path, 'r', encoding=encoding) as theme_file:
+        while True:
+            chunk = theme_file.read(READ_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+def _default_name(path):
+    """
+    a helper function that names a theme after its file
+    """
+    return os.path.splitext(os.path.basename(path))[0]
+
+# iTerm2 names its colors like this; the ANSI colors are "Ansi 0 Color"
+# to "Ansi 15 Color".
+_ITERM_KEYS = {
+    'Foreground Color': 'foreground',
+    'Background Color': 'background',
+    'Bold Color': 'bold',
+    'Cursor Color': 'cursor',
+    'Cursor Text Color': 'cursor_text',
+}
+_ITERM_KEYS.update(('Ansi {0} Color'.format(x), ANSI_KEYS[x])
+                   for x in range(16))
+_ITERM_COMPONENTS = {'Red Component': 0, 'Green Component': 1,
+                     'Blue Component': 2}
+
+def iter_itermcolors(path):
+    """
+    Read an iTerm2 .itermcolors file.
+
+    Returns
+    -------
+    generator
+        yields a single (name, palette) tuple
+    """
+    palette = {}
+    # The keys of the dicts that enclose the current element.
+    keys = []
+    pending_key = None
+    components = None
+    for event, element in ElementTree.iterparse(path, ('start', 'end')):
+        if event == 'start':
+            if element.tag == 'dict':
+                keys.append(pending_key)
+                pending_key = None
+                if len(keys) == 2:
+                    components = [0.0, 0.0, 0.0]
+            continue
+        if element.tag == 'key':
+            pending_key = element.text
+        elif element.tag == 'dict':
+            color_key = keys.pop()
+            if len(keys) == 1 and color_key in _ITERM_KEYS:
+                palette[_ITERM_KEYS[color_key]] = tuple(
+                    max(0, min(255, int(round(x * 255))))
+                    for x in components)
+        elif element.tag in ('real', 'integer'):
+            if len(keys) == 2 and pending_key in _ITERM_COMPONENTS:
+                components[_ITERM_COMPONENTS[pending_key]] = \
+                    float(element.text)
+            pending_key = None
+        else:
+            pending_key = None
+        element.clear()
+    yield _default_name(path), palette
+
+_XRESOURCE_LINE = re.compile(r'^\s*[\w.*-]*?[.*]?(\w+)\s*:\s*(.+?)\s*$')
+_XRESOURCE_KEYS = {
+    'foreground': 'foreground',
+    'background': 'background',
+    'colorBD': 'bold',
+    'cursorColor': 'cursor',
+    'cursorColor2': 'cursor_text',
+}
+_XRESOURCE_KEYS.update(('color{0}'.format(x), ANSI_KEYS[x])
+                       for x in range(16))
+
+def iter_xresources(path):
+    """
+    Read an X resources file, one line at a time. Colors may be given
+    directly or through #define macros.
+
+    Returns
+    -------
+    generator
+        yields a single (name, palette) tuple
+    """
+    palette = {}
+    defines = {}
+    with open(path, 'r', encoding='utf-8', errors='replace') as theme_file:
+        for line in theme_file:
+            line = line.strip()
+            if line.startswith('#define'):
+                parts = line.split(None, 2)
+                if len(parts) == 3:
+                    defines[parts[1]] = parts[2].strip()
+                continue
+            if not line or line.startswith('!') or line.startswith('#'):
+                continue
+            match = _XRESOURCE_LINE.match(line)
+            if match and match.group(1) in _XRESOURCE_KEYS:
+                value = match.group(2)
+                palette[_XRESOURCE_KEYS[match.group(1)]] = parse_hex_color(
+                    defines.get(value, value))
+    yield _default_name(path), palette
+
+_WINDOWS_TERMINAL_KEYS = {
+    'foreground': 'foreground',
+    'background': 'background',
+    'cursorColor': 'cursor',
+}
+_WINDOWS_TERMINAL_KEYS.update(zip(
+    ['black', 'red', 'green', 'yellow', 'blue', 'purple', 'cyan', 'white',
+     'brightBlack', 'brightRed', 'brightGreen', 'brightYellow',
+     'brightBlue', 'brightPurple', 'brightCyan', 'brightWhite'],
+    ANSI_KEYS))
+
+def _windows_terminal_palette(scheme):
+    """
+    a helper function that converts one Windows Terminal scheme object
+    into a (name, palette) tuple
+    """
+    palette = {}
+    for key, palette_key in _WINDOWS_TERMINAL_KEYS.items():
+        if key in scheme:
+            palette[palette_key] = parse_hex_color(scheme[key])
+    return scheme.get('name'), palette
+
+def _iter_json_array(chunks, text, pos):
+    """
+    a helper generator that decodes the elements of a JSON array one at
+    a time, where text[pos] is the array's opening bracket and more
+    text comes from chunks
+    """
+    decoder = json.JSONDecoder()
+    pos += 1
+    while True:
+        # Skip whitespace and commas, reading more text as needed.
+        while True:
+            while pos < len(text) and text[pos] in ' \t\r\n,':
+                pos += 1
+            if pos < len(text):
+                break
+            text = next(chunks, None)
+            if text is None:
+                raise ValueError('Unterminated JSON array')
+            pos = 0
+        if text[pos] == ']':
+            return
+        while True:
+            try:
+                element, end = decoder.raw_decode(text, pos)
+                break
+            except ValueError:
+                more = next(chunks, None)
+                if more is None:
+                    raise
+                text = text[pos:] + more
+                pos = 0
+        yield element
+        text = text[end:]
+        pos = 0
+
+def iter_windows_terminal(path):
+    """
+    Read Windows Terminal color schemes from a JSON file. The file can
+    hold a single scheme object, a list of schemes, or an object with a
+    "schemes" list (like settings.json). Lists are decoded one scheme
+    at a time.
+
+    Returns
+    -------
+    generator
+        yields (name, palette) tuples
+    """
+    chunks = _read_chunks(path)
+    text = ''
+    # Find the start of the list of schemes, or the single scheme.
+    schemes_key = re.compile(r'"schemes"\s*:\s*\[')
+    while True:
+        more = next(chunks, None)
+        if more is not None:
+            text += more
+        stripped = text.lstrip()
+        if stripped.startswith('['):
+            schemes = _iter_json_array(chunks, text,
+                                          len(text) - len(stripped))
+            break
+        match = schemes_key.search(text)
+        if match:
+            schemes = _iter_json_array(chunks, text, match.end() - 1)
+            break
+        if more is None:
+            # A single scheme; it is small enough to decode whole.
+            scheme = json.loads(text)
+            if not isinstance(scheme, dict):
+                raise ValueError('No color schemes found')
+            schemes = [scheme]
+            break
+
+    for number, scheme in enumerate(schemes, 1):
+        name, palette = _windows_terminal_palette(scheme)
+        yield name or '{0}-{1}'.format(_default_name(path), number), palette
+
+# The base16 colors used for each palette entry, as in base16-shell.
+_BASE16_KEYS = {
+    'foreground': 'base05',
+    'background': 'base00',
+    'cursor': 'base05',
+    'cursor_text': 'base00',
+}
+_BASE16_KEYS.update(zip(ANSI_KEYS, [
+    'base00', 'base08', 'base0B', 'base0A', 'base0D', 'base0E', 'base0C',
+    'base05', 'base03', 'base08', 'base0B', 'base0A', 'base0D', 'base0E',
+    'base0C', 'base07']))
+_YAML_LINE = re.compile(r'^\s*([\w-]+)\s*:\s*(.*?)\s*(?:#.*)?$')
+
+def iter_base16(path):
+    """
+    Read base16 schemes from a YAML file, one line at a time. Only the
+    flat "key: value" form used by base16 scheme files is understood;
+    schemes are separated by --- document markers.
+
+    Returns
+    -------
+    generator
+        yields (name, palette) tuples
+    """
+    values = {}
+    number = 0
+
+    def palette():
+        return {key: parse_hex_color(values[base])
+                for key, base in _BASE16_KEYS.items() if base in values}
+
+    with open(path, 'r', encoding='utf-8-sig') as theme_file:
+        for line in theme_file:
+            if line.startswith('---'):
+                if values:
+                    number += 1
+                    yield values.get('scheme') or '{0}-{1}'.format(
+                        _default_name(path), number), palette()
+                values = {}
+                continue
+            match = _YAML_LINE.match(line)
+            if match:
+                values[match.group(1)] = match.group(2).strip('"\'')
+    if values:
+        number += 1
+        name = values.get('scheme')
+        if not name:
+            name = _default_name(path) if number == 1 else '{0}-{1}'.format(
+                _default_name(path), number)
+        yield name, palette()
+
+FORMAT_READERS = {
+    'itermcolors': iter_itermcolors,
+    'xresources': iter_xresources,
+    'windowsterminal': iter_windows_terminal,
+    'base16': iter_base16,
+}
+
+def detect_format(path):
+    """
+    Work out the format of a theme file, from its extension or, failing
+    that, its first few hundred characters.
+
+    Returns
+    -------
+    string
+        a key of FORMAT_READERS, or None when the format isn't
+        recognized
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension in FORMAT_EXTENSIONS:
+        return FORMAT_EXTENSIONS[extension]
+    if os.path.basename(path).lower().startswith(('.xresources',
+                                                  'xresources')):
+        return 'xresources'
+    try:
+        start = next(_read_chunks(path), '')[:512]
+    except (OSError, UnicodeDecodeError):
+        return None
+    stripped = start.lstrip()
+    if stripped.startswith('<?xml') or stripped.startswith('<plist'):
+        return 'itermcolors' if 'Ansi 0 Color' in start or \
+            '<plist' in start else None
+    if stripped.startswith(('{', '[')):
+        return 'windowsterminal'
+    if re.search(r'^\s*base0[0-9A-Fa-f]\s*:', start, re.MULTILINE):
+        return 'base16'
+    if re.search(r'^\s*[\w.*-]*[.*](color\d+|foreground|background)\s*:',
+                 start, re.MULTILINE):
+        return 'xresources'
+    return None
+
+def iter_theme_file(path, theme_format=None):
+    """
+    Read the themes in a file of any supported format.
+
+    Parameters
+    ----------
+    path : string
+        the theme file
+    theme_format : string, optional
+        a key of FORMAT_READERS; by default, it is detected
+
+    Returns
+    -------
+    generator
+        yields (name, scheme, error) tuples, where scheme is a
+        colorinterface.ColorScheme, or None when the theme couldn't be
+        converted, in which case error explains why
+
+    Raises
+    ------
+    ValueError
+        when the format isn't recognized or the file can't be parsed
+    """
+    if theme_format is None:
+        theme_format = detect_format(path)
+    if theme_format not in FORMAT_READERS:
+        raise ValueError('Unrecognized theme format')
+    for name, palette in FORMAT_READERS[theme_format](path):
+        try:
+            yield name, palette_to_scheme(palette), None
+        except ValueError as e:
+            yield name, None, str(e)
+
+def _output_name(name):
+    """
+    a helper function that turns a theme name into a file name
+    """
+    return re.sub(r'[^\w.+-]+', '_', name).strip('._') or 'theme'
+
+def _convert_file(job):
+    """
+    a helper function, run in the worker processes, that converts one
+    theme file, writing an INI file per theme when an output directory
+    is given
+
+    Returns
+    -------
+    tuple
+        the path, a list of (name, packed scheme data or output path)
+        tuples, a list of (name, error) tuples for the themes that
+        couldn't be converted, and the number of bytes read
+    """
+    path, theme_format, output_dir, color_names = job
+    converted = []
+    failed = []
+    try:
+        size = os.path.getsize(path)
+        themes = iter_theme_file(path, theme_format)
+        used = set()
+        for name, scheme, error in themes:
+            if scheme is None:
+                failed.append((name, error))
+                continue
+            if output_dir is None:
+                converted.append((name, scheme.data))
+                continue
+            file_name = _output_name(name)
+            unique = file_name
+            count = 1
+            while unique in used:
+                count += 1
+                unique = '{0}-{1}'.format(file_name, count)
+            used.add(unique)
+            output_path = os.path.join(output_dir, unique + '.ini')
+            colorinterface.write_colors_to_INI(output_path, scheme,
+                                               color_names)
+            converted.append((name, output_path))
+    except Exception as e:
+        failed.append((None, str(e) or type(e).__name__))
+        size = 0
+    return path, converted, failed, size
+
+class ImportReport(object):
+    """
+    the outcome of converting a directory of themes
+
+    Attributes
+    ----------
+    themes : dict
+        maps theme names (prefixed with their file's path, relative to
+        the source directory) to ColorSchemes, or to the INI files they
+        were written to when an output directory was given
+    failures : dict
+        maps each file (or file: theme) that couldn't be converted to
+        an error message
+    file_count : int
+        the number of files read
+    byte_count : int
+        the number of bytes read
+    elapsed : float
+        the time taken, in seconds
+    """
+
+    def __init__(self):
+        self.themes = {}
+        self.failures = {}
+        self.file_count = 0
+        self.byte_count = 0
+        self.elapsed = 0.0
+
+    def throughput(self):
+        """
+        Get the conversion rate.
+
+        Returns
+        -------
+        tuple
+            the themes converted per second and the megabytes read per
+            second
+        """
+        if not self.elapsed:
+            return 0.0, 0.0
+        return (len(self.themes) / self.elapsed,
+                self.byte_count / 1e6 / self.elapsed)
+
+    def summary(self):
+        """
+        Describe the conversion in one line.
+        """
+        themes_per_second, megabytes_per_second = self.throughput()
+        return ('Converted {0} themes from {1} files in {2:.2f}s '
+                '({3:.0f} themes/s, {4:.1f} MB/s); {5} failures').format(
+                    len(self.themes), self.file_count, self.elapsed,
+                    themes_per_second, megabytes_per_second,
+                    len(self.failures))
+
+def convert_directory(source_dir, output_dir=None, max_workers=None,
+                      color_names=False, progress=None, cancel_event=None):
+    """
+    Convert every theme file in a directory (and its subdirectories).
+
+    Parameters
+    ----------
+    source_dir : string
+        the directory to read
+    output_dir : string, optional
+        when given, each theme is written to an INI file here, in the
+        same subdirectory as its source file (and in a subdirectory
+        named after the file for files holding several themes)
+    max_workers : int, optional
+        the number of worker processes; by default, one per CPU
+    color_names : bool, optional
+        write color names instead of registry names to the INI files
+    progress : callable, optional
+        called as progress(done, total) as files are converted
+    cancel_event : threading.Event, optional
+        when set, files that haven't been converted yet are skipped
+
+    Returns
+    -------
+    ImportReport
+        the converted themes, failures and throughput
+    """
+    start = time.perf_counter()
+    jobs = []
+    for dir_path, dir_names, file_names in os.walk(source_dir):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            path = os.path.join(dir_path, file_name)
+            theme_format = detect_format(path)
+            if theme_format is None:
+                continue
+            theme_dir = None
+            if output_dir is not None:
+                theme_dir = os.path.join(
+                    output_dir, os.path.relpath(dir_path, source_dir))
+                if theme_format in BUNDLE_FORMATS:
+                    # Files that can hold several themes get a directory
+                    # of their own.
+                    theme_dir = os.path.join(
+                        theme_dir, _output_name(_default_name(path)))
+                os.makedirs(theme_dir, exist_ok=True)
+            jobs.append((path, theme_format, theme_dir, color_names))
+
+    report = ImportReport()
+    total = len(jobs)
+
+    def collect(outcomes):
+        for done, (path, converted, failed, size) in enumerate(outcomes, 1):
+            label = os.path.relpath(path, source_dir)
+            report.file_count += 1
+            report.byte_count += size
+            for name, result in converted:
+                key = '{0}: {1}'.format(label, name)
+                if output_dir is None:
+                    result = colorinterface.ColorScheme.intern(
+                        colorinterface.ColorScheme(result))
+                report.themes[key] = result
+            for name, error in failed:
+                key = label if name is None else '{0}: {1}'.format(label,
+                                                                    name)
+                report.failures[key] = error
+            if progress is not None:
+                progress(done, total)
+            if cancel_event is not None and cancel_event.is_set():
+                break
+
+    if total < PROCESS_POOL_THRESHOLD:
+        collect(map(_convert_file, jobs))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers) as executor:
+            try:
+                collect(executor.map(_convert_file, jobs))
+            finally:
+                if cancel_event is not None and cancel_event.is_set():
+                    executor.shutdown(wait=True, cancel_futures=True)
+    report.elapsed = time.perf_counter() - start
+    return report
+
+def main(argv=None):
+    """
+    Convert a directory of themes from the command line, printing the
+    throughput and any failures to standard error.
+    """
+    parser = argparse.ArgumentParser(
+        description='Convert iTerm2, X resources, Windows Terminal and '
+                    'base16 themes into PuTTY theme INI files.')
+    parser.add_argument('source', metavar='SOURCE_DIR')
+    parser.add_argument('output', metavar='OUTPUT_DIR')
+    parser.add_argument('--workers', type=int,
+                        help='the number of worker processes')
+    parser.add_argument('--color-names', action='store_true',
+                        help='write color names instead of registry names')
+    args = parser.parse_args(argv)
+
+    try:
+        report = convert_directory(args.source, args.output, args.workers,
+                                   args.color_names)
+    except OSError as e:
+        sys.stderr.write('{0}: {1}\n'.format(parser.prog, e))
+        return 2
+    for name in sorted(report.failures):
+        sys.stderr.write('Could not convert {0}: {1}\n'.format(
+            name, report.failures[name]))
+    sys.stderr.write(report.summary() + '\n')
+    return 1 if report.failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
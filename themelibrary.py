@@ -0,0 +1,210 @@
+import concurrent.futures
+import fnmatch
+import os
+import threading
+
+import colorinterface
+
+"""
+themelibrary.py
+
+This file loads whole directories of color theme INI files (see
+colorinterface.read_colors_from_INI). Files are parsed in a pool of
+worker processes, and parsed themes are cached by path, modification
+time and size, so rescanning a directory only parses the files that
+have changed. Themes that extend other themes (see
+colorinterface.ThemeResolver) are parsed again when any file they
+inherit from changes, even if their own file hasn't.
+"""
+
+THEME_FILE_PATTERN = '*.ini'
+# Below this many files, parsing in the calling process is quicker than
+# starting a process pool.
+PROCESS_POOL_THRESHOLD = 64
+# The number of files handed to a worker process at a time.
+PARSE_CHUNK_SIZE = 32
+
+def _parse_theme_file(path):
+    """
+    a helper function, run in the worker processes, that parses one
+    theme file
+
+    Returns
+    -------
+    tuple
+        the path, the packed ColorScheme data (or None), an error
+        message (or None) and the paths of the themes it extends
+    """
+    resolver = colorinterface.get_theme_resolver()
+    try:
+        scheme = resolver.resolve(path)
+        return path, scheme.data, None, resolver.chain(path)[1:]
+    except KeyError:
+        return path, None, 'no [{0}] section'.format(
+            colorinterface.COLOR_INI_SECTION_NAME), []
+    except Exception as e:
+        return path, None, str(e), []
+
+class ThemeLibrary(object):
+    """
+    the color themes found in a directory of INI files
+
+    Attributes
+    ----------
+    directory : string
+        the directory that was last scanned
+    themes : dict
+        maps the path of each theme file that was read successfully to
+        its colorinterface.ColorScheme
+    errors : dict
+        maps the path of each theme file that couldn't be read to a
+        message explaining why
+    parsed_count : int
+        the number of files actually parsed by the last scan; the rest
+        came from the cache
+    """
+
+    def __init__(self, max_workers=None):
+        """
+        Parameters
+        ----------
+        max_workers : int, optional
+            the number of worker processes used to parse files; by
+            default, one per CPU
+        """
+        self.max_workers = max_workers
+        self.directory = None
+        self.themes = {}
+        self.errors = {}
+        self.parsed_count = 0
+        self._lock = threading.Lock()
+        # Maps each path to ((mtime, size), scheme, error, bases), where
+        # bases holds ((mtime, size), path) for each theme it extends.
+        self._cache = {}
+
+    def scan(self, directory, pattern=THEME_FILE_PATTERN, progress=None,
+             cancel_event=None):
+        """
+        Read every theme file in a directory (and its subdirectories).
+        Files that haven't changed since they were last read are taken
+        from the cache.
+
+        Parameters
+        ----------
+        directory : string
+            the directory to scan
+        pattern : string, optional
+            a glob pattern that theme file names need to match
+        progress : callable, optional
+            called as progress(done, total) as files are parsed
+        cancel_event : threading.Event, optional
+            when set, files that haven't been parsed yet are skipped
+
+        Returns
+        -------
+        ThemeLibrary
+            this library, for convenience
+        """
+        file_keys = {}
+        for dir_path, dir_names, file_names in os.walk(directory):
+            dir_names.sort()
+            for file_name in sorted(file_names):
+                if not fnmatch.fnmatch(file_name.lower(), pattern.lower()):
+                    continue
+                path = os.path.join(dir_path, file_name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                file_keys[path] = (stat.st_mtime_ns, stat.st_size)
+
+        def base_key(path):
+            if path in file_keys:
+                return file_keys[path]
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return None
+            return (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            stale = []
+            for path, key in file_keys.items():
+                cached = self._cache.get(path)
+                if cached is None or cached[0] != key or \
+                   any(base_key(base) != base_file_key
+                       for base_file_key, base in cached[3]):
+                    stale.append(path)
+        parsed_count = self._parse(stale, file_keys, progress, cancel_event,
+                                   base_key)
+
+        themes = {}
+        errors = {}
+        with self._lock:
+            # Forget files that have been deleted.
+            for path in [x for x in self._cache if x not in file_keys]:
+                del self._cache[path]
+            for path in file_keys:
+                if path not in self._cache:
+                    continue
+                key, scheme, error, bases = self._cache[path]
+                if scheme is not None:
+                    themes[path] = scheme
+                else:
+                    errors[path] = error
+            self.directory = directory
+            self.themes = themes
+            self.errors = errors
+            self.parsed_count = parsed_count
+        return self
+
+    def _parse(self, paths, file_keys, progress, cancel_event, base_key):
+        """
+        a helper method that parses theme files, in worker processes
+        when there are enough of them, and adds them to the cache;
+        returns the number of files parsed, which is less than the
+        number of paths when the scan is cancelled
+        """
+        total = len(paths)
+
+        def collect(outcomes):
+            done = 0
+            for path, data, error, bases in outcomes:
+                done += 1
+                scheme = None
+                if data is not None:
+                    scheme = colorinterface.ColorScheme.intern(
+                        colorinterface.ColorScheme(data))
+                bases = tuple((base_key(base), base) for base in bases)
+                with self._lock:
+                    self._cache[path] = (file_keys[path], scheme, error,
+                                         bases)
+                if progress is not None:
+                    progress(done, total)
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+            return done
+
+        if total < PROCESS_POOL_THRESHOLD:
+            return collect(map(_parse_theme_file, paths))
+        with concurrent.futures.ProcessPoolExecutor(self.max_workers) \
+             as executor:
+            try:
+                return collect(executor.map(_parse_theme_file, paths,
+                                            chunksize=PARSE_CHUNK_SIZE))
+            finally:
+                if cancel_event is not None and cancel_event.is_set():
+                    executor.shutdown(wait=True, cancel_futures=True)
+
+    def theme_names(self):
+        """
+        Get the themes in the library, named by their paths relative to
+        the scanned directory.
+
+        Returns
+        -------
+        list
+            (name, path) tuples, sorted by name
+        """
+        return sorted((os.path.relpath(path, self.directory), path)
+                      for path in self.themes)
@@ -0,0 +1,364 @@
+import colorsys
+
+import colorinterface
+
+"""
+transforms.py
+
+This file contains color transforms (brightness, contrast, gamma, hue,
+saturation and lightness shifts, blending and inversion) that can be
+applied to the color schemes of many PuTTY sessions at once.
+
+Transforms work on a buffer holding many packed ColorSchemes back to
+back. Transforms that treat each color component on its own are done
+with 256-entry lookup tables and bytes.translate, applied to the whole
+buffer, or to a strided slice of it when only some colors are affected,
+so their cost barely depends on the number of schemes. Before any work
+is done, identical schemes are merged, so a transform only ever sees
+each distinct scheme once.
+"""
+
+# Groups of colors that transforms are commonly limited to.
+COLOR_GROUPS = {
+    'All Colors': None,
+    'Foregrounds': ['Default Foreground', 'Default Bold Foreground'],
+    'Backgrounds': ['Default Background', 'Default Bold Background'],
+    'Cursor': ['Cursor Text', 'Cursor Color'],
+    'ANSI Colors': colorinterface.PUTTY_COLOR_ORDER[6:],
+}
+
+def _clamp(value):
+    """
+    a helper function that rounds a component value and clamps it to
+    the range 0 to 255
+    """
+    return max(0, min(255, int(round(value))))
+
+def _color_positions(colors):
+    """
+    a helper function that converts color names (or registry color
+    names) into their positions in PUTTY_COLOR_ORDER, or None for all
+    colors
+    """
+    if colors is None:
+        return None
+    return sorted(set(colorinterface.color_position(x) for x in colors))
+
+class ColorTransform(object):
+    """
+    the base class for transforms
+
+    Attributes
+    ----------
+    positions : list
+        the positions, in PUTTY_COLOR_ORDER, of the colors that the
+        transform changes, or None when it changes all of them
+    """
+
+    def __init__(self, colors=None):
+        """
+        Parameters
+        ----------
+        colors : list, optional
+            the names of the colors to change, either as in
+            PUTTY_COLOR_ORDER or as registry names (e.g. Colour0); by
+            default, all colors are changed
+        """
+        self.positions = _color_positions(colors)
+
+    def _byte_offsets(self):
+        """
+        a helper method that lists the offsets, within a packed scheme,
+        of every component the transform changes
+        """
+        positions = self.positions
+        if positions is None:
+            positions = range(len(colorinterface.PUTTY_COLOR_ORDER))
+        return [pos * 3 + channel for pos in positions for channel in range(3)]
+
+    def apply(self, buffer):
+        """
+        Transform packed schemes.
+
+        Parameters
+        ----------
+        buffer : bytes
+            any number of packed ColorSchemes, back to back
+
+        Returns
+        -------
+        bytes
+            the transformed schemes, in the same layout
+        """
+        raise NotImplementedError
+
+class LookupTransform(ColorTransform):
+    """
+    a transform that maps each color component through a table of 256
+    values, independently of the other components
+    """
+
+    def __init__(self, table, colors=None):
+        """
+        Parameters
+        ----------
+        table : bytes
+            the new value for each of the 256 component values
+        colors : list, optional
+            the names of the colors to change
+        """
+        ColorTransform.__init__(self, colors)
+        self.table = bytes(table)
+
+    def apply(self, buffer):
+        if self.positions is None:
+            return bytes(buffer).translate(self.table)
+        size = colorinterface.SCHEME_SIZE
+        result = bytearray(buffer)
+        for offset in self._byte_offsets():
+            result[offset::size] = buffer[offset::size].translate(self.table)
+        return bytes(result)
+
+class BlendTransform(ColorTransform):
+    """
+    a transform that moves every color part of the way towards the
+    matching color of a target scheme
+    """
+
+    def __init__(self, target, amount, colors=None):
+        """
+        Parameters
+        ----------
+        target : colorinterface.ColorScheme or list
+            the scheme to blend towards
+        amount : float
+            how far to move, from 0 (not at all) to 1 (all the way)
+        colors : list, optional
+            the names of the colors to change
+        """
+        ColorTransform.__init__(self, colors)
+        target = colorinterface.ColorScheme.from_colors(target).data
+        # One table per component, since each has its own target value.
+        self.tables = {
+            offset: bytes(_clamp(x + (target[offset] - x) * amount)
+                          for x in range(256))
+            for offset in self._byte_offsets()}
+
+    def apply(self, buffer):
+        size = colorinterface.SCHEME_SIZE
+        result = bytearray(buffer)
+        for offset, table in self.tables.items():
+            result[offset::size] = buffer[offset::size].translate(table)
+        return bytes(result)
+
+class HSLTransform(ColorTransform):
+    """
+    a transform that shifts the hue, saturation and lightness of colors
+
+    Unlike the other transforms, this needs all three components of a
+    color at once, so it is done one color at a time; each distinct
+    color is only converted once.
+    """
+
+    def __init__(self, hue=0.0, saturation=0.0, lightness=0.0, colors=None):
+        """
+        Parameters
+        ----------
+        hue : float, optional
+            the number of degrees to rotate the hue by
+        saturation : float, optional
+            the amount to add to the saturation, from -1 to 1
+        lightness : float, optional
+            the amount to add to the lightness, from -1 to 1
+        colors : list, optional
+            the names of the colors to change
+        """
+        ColorTransform.__init__(self, colors)
+        self.hue = hue / 360.0
+        self.saturation = saturation
+        self.lightness = lightness
+        self._converted = {}
+
+    def _convert(self, color):
+        """
+        a helper method that shifts a single packed color
+        """
+        converted = self._converted.get(color)
+        if converted is None:
+            h, l, s = colorsys.rgb_to_hls(*[x / 255.0 for x in color])
+            h = (h + self.hue) % 1.0
+            l = min(1.0, max(0.0, l + self.lightness))
+            s = min(1.0, max(0.0, s + self.saturation))
+            converted = bytes(_clamp(x * 255)
+                              for x in colorsys.hls_to_rgb(h, l, s))
+            self._converted[color] = converted
+        return converted
+
+    def apply(self, buffer):
+        size = colorinterface.SCHEME_SIZE
+        color_offsets = self._byte_offsets()[::3]
+        result = bytearray(buffer)
+        for start in range(0, len(buffer), size):
+            for offset in color_offsets:
+                pos = start + offset
+                result[pos:pos + 3] = self._convert(bytes(buffer[pos:pos + 3]))
+        return bytes(result)
+
+def brightness(factor, colors=None):
+    """
+    Create a transform that scales every component, e.g. 0.9 darkens by
+    10% and 1.1 brightens by 10%.
+    """
+    return LookupTransform([_clamp(x * factor) for x in range(256)], colors)
+
+def contrast(factor, colors=None):
+    """
+    Create a transform that scales every component's distance from the
+    middle of the range; factors above 1 increase the contrast.
+    """
+    return LookupTransform([_clamp((x - 128) * factor + 128)
+                            for x in range(256)], colors)
+
+def gamma(value, colors=None):
+    """
+    Create a transform that applies a gamma correction; values above 1
+    brighten the midtones and values below 1 darken them.
+    """
+    if value <= 0:
+        raise ValueError('Gamma must be greater than zero.')
+    return LookupTransform([_clamp(255 * (x / 255.0) ** (1.0 / value))
+                            for x in range(256)], colors)
+
+def invert(colors=None):
+    """
+    Create a transform that inverts every component.
+    """
+    return LookupTransform([255 - x for x in range(256)], colors)
+
+def hsl_shift(hue=0.0, saturation=0.0, lightness=0.0, colors=None):
+    """
+    Create a transform that shifts the hue (in degrees), saturation and
+    lightness of colors.
+
+    See Also
+    --------
+    HSLTransform
+    """
+    return HSLTransform(hue, saturation, lightness, colors)
+
+def blend(target, amount, colors=None):
+    """
+    Create a transform that blends colors towards those of another
+    scheme.
+
+    See Also
+    --------
+    BlendTransform
+    """
+    return BlendTransform(target, amount, colors)
+
+def transform_schemes(schemes, transforms):
+    """
+    Apply transforms to many color schemes at once.
+
+    Parameters
+    ----------
+    schemes : dict
+        maps session names (or any other keys) to ColorSchemes or color
+        lists
+    transforms : list
+        the ColorTransforms to apply, in order
+
+    Returns
+    -------
+    dict
+        maps the same keys to their transformed, interned ColorSchemes
+    """
+    size = colorinterface.SCHEME_SIZE
+    schemes = {key: colorinterface.ColorScheme.intern(scheme)
+               for key, scheme in schemes.items()}
+    distinct = list(set(schemes.values()))
+    buffer = b''.join(scheme.data for scheme in distinct)
+
+    for transform in transforms:
+        buffer = transform.apply(buffer)
+
+    transformed = {}
+    for pos, scheme in enumerate(distinct):
+        transformed[scheme] = colorinterface.ColorScheme.intern(
+            colorinterface.ColorScheme(buffer[pos * size:(pos + 1) * size]))
+    return {key: transformed[scheme] for key, scheme in schemes.items()}
+
+def transform_sessions(session_names, transforms, store=None,
+                       max_workers=colorinterface.DEFAULT_APPLY_WORKERS,
+                       progress=None, cancel_event=None, history=None):
+    """
+    Apply transforms to the colors of PuTTY sessions and write the
+    results back through colorinterface.write_session_values, so only
+    the colors that actually change are written.
+
+    Parameters
+    ----------
+    session_names : list
+        the names of the sessions to transform, or None for every
+        session in the store
+    transforms : list
+        the ColorTransforms to apply, in order
+    store : sessionstore.SessionStore, optional
+        the store that holds the sessions
+    max_workers : int, optional
+        the number of threads used to write sessions
+    progress : callable, optional
+        called as progress(done, total) as sessions are written
+    cancel_event : threading.Event, optional
+        when set, sessions that haven't been written yet are skipped
+    history : journal.ApplyHistory, optional
+        when given, the results are written as a single transaction
+        through it instead, so they can be undone; its store is used in
+        place of store
+
+    Returns
+    -------
+    tuple
+        the colorinterface.BulkApplyResult of the write, in which
+        sessions whose colors couldn't be read are marked as failed,
+        and a dict mapping each transformed session to its new scheme
+    """
+    if history is not None:
+        store = history.store
+    elif store is None:
+        store = colorinterface.get_session_store()
+    read_errors = {}
+
+    if session_names is None:
+        schemes, problems = colorinterface.read_all_session_colors(store)
+        for session_name, messages in problems.items():
+            read_errors[session_name] = ValueError('; '.join(messages))
+    else:
+        schemes = {}
+        for session_name in session_names:
+            try:
+                schemes[session_name] = colorinterface.read_session_colors(
+                    session_name, store)
+            except (KeyError, ValueError) as e:
+                read_errors[session_name] = e
+
+    new_schemes = transform_schemes(schemes, transforms)
+    reg_values = {scheme: colorinterface.build_color_values(scheme)
+                  for scheme in set(new_schemes.values())}
+    session_values = ((session_name, reg_values[scheme])
+                      for session_name, scheme in new_schemes.items())
+    if history is not None and read_errors:
+        # A transaction changes every session or none of them.
+        result = colorinterface.BulkApplyResult()
+        result.rolled_back = True
+    elif history is not None:
+        result = history.apply(session_values, max_workers, progress,
+                               cancel_event)
+    else:
+        result = colorinterface.write_session_values(
+            session_values, store, max_workers, progress, cancel_event)
+    for session_name, error in read_errors.items():
+        result.statuses[session_name] = colorinterface.APPLY_FAILED
+        result.errors[session_name] = error
+    return result, new_schemes
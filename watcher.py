@@ -0,0 +1,185 @@
+import threading
+
+import colorinterface
+import snapshot
+
+"""
+watcher.py
+
+This file watches a session store for changes made by something other
+than this application, such as PuTTY itself or a script, so that the
+GUI can patch the sessions it shows instead of reading them all again.
+
+The store decides how changes are noticed (see
+sessionstore.SessionStore.wait_for_change): the registry signals an
+event when anything under the sessions key changes, a .reg file is
+checked by its modification time, and other stores are polled. Either
+way, the sessions that changed are then found by comparing last write
+times (see snapshot.reconcile_snapshot), so only those sessions are
+read again.
+"""
+
+# How long, in seconds, the watcher waits for a change before checking
+# whether it has been stopped; for stores that are polled, this is also
+# how often they are polled.
+DEFAULT_WATCH_INTERVAL = 2.0
+
+class SessionChanges(object):
+    """
+    the sessions that changed between two checks of a store
+
+    Attributes
+    ----------
+    added : list
+        the names of the new sessions
+    removed : list
+        the names of the sessions that no longer exist
+    renamed : list
+        (old name, new name) tuples; a rename shows up as a session
+        disappearing and another one appearing with the same colors, so
+        it is only reported when that pairing is unambiguous
+    recolored : list
+        the names of existing sessions whose colors changed
+    entries : dict
+        maps each added, renamed or recolored session to its
+        (write_time, scheme) entry, as in snapshot entries; the scheme
+        is None when the session's colors couldn't be read
+    """
+
+    def __init__(self):
+        self.added = []
+        self.removed = []
+        self.renamed = []
+        self.recolored = []
+        self.entries = {}
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.renamed or
+                    self.recolored)
+
+    def __len__(self):
+        return (len(self.added) + len(self.removed) + len(self.renamed) +
+                len(self.recolored))
+
+class SessionWatcher(object):
+    """
+    a background thread that reports changes to the sessions in a
+    store
+
+    Attributes
+    ----------
+    entries : dict
+        the last known (write_time, scheme) of every session, in the
+        same form as snapshot entries
+    """
+
+    def __init__(self, store=None, entries=None,
+                 interval=DEFAULT_WATCH_INTERVAL):
+        """
+        Parameters
+        ----------
+        store : sessionstore.SessionStore, optional
+            the store to watch
+        entries : dict, optional
+            the sessions as they are currently shown, e.g. from
+            snapshot.reconcile_snapshot; when omitted, the store is read
+            once when the watcher starts, and changes are reported from
+            then on
+        interval : float, optional
+            the longest time, in seconds, to wait between checks
+        """
+        self.store = (store if store is not None
+                      else colorinterface.get_session_store())
+        self.entries = entries
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def check(self):
+        """
+        Compare the store with the last known entries, reading only the
+        sessions whose last write time has changed, and update the
+        entries to match.
+
+        Returns
+        -------
+        SessionChanges
+            what changed since the last check
+        """
+        old_entries = self.entries or {}
+        updated, changed, removed = snapshot.reconcile_snapshot(
+            old_entries, self.store)
+        self.entries = updated
+
+        changes = SessionChanges()
+        added = [x for x in changed if x not in old_entries]
+        changes.recolored = [x for x in changed if x in old_entries]
+        # Pair each removed session with an added one when exactly one
+        # of each has a given scheme.
+        removed_by_scheme = {}
+        for session_name in removed:
+            removed_by_scheme.setdefault(old_entries[session_name][1],
+                                         []).append(session_name)
+        added_by_scheme = {}
+        for session_name in added:
+            added_by_scheme.setdefault(updated[session_name][1],
+                                       []).append(session_name)
+        renamed_from = {}
+        for scheme, new_names in added_by_scheme.items():
+            old_names = removed_by_scheme.get(scheme, [])
+            if scheme is not None and len(new_names) == len(old_names) == 1:
+                renamed_from[new_names[0]] = old_names[0]
+        changes.renamed = [(old_name, new_name) for new_name, old_name
+                           in renamed_from.items()]
+        renamed_old = set(renamed_from.values())
+        changes.added = [x for x in added if x not in renamed_from]
+        changes.removed = [x for x in removed if x not in renamed_old]
+        changes.entries = {session_name: updated[session_name]
+                           for session_name in changed}
+        return changes
+
+    def start(self, on_change, on_error=None):
+        """
+        Start watching on a background thread.
+
+        Parameters
+        ----------
+        on_change : callable
+            called as on_change(changes) on the watcher's thread with
+            each non-empty SessionChanges
+        on_error : callable, optional
+            called as on_error(exception) on the watcher's thread when
+            the store can't be checked; the watcher then stops
+        """
+        if self._thread is not None:
+            raise RuntimeError('The watcher has already been started.')
+        self._thread = threading.Thread(target=self._run,
+                                        args=(on_change, on_error))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self, on_change, on_error):
+        """
+        a helper method that waits for and reports changes until the
+        watcher is stopped
+        """
+        try:
+            if self.entries is None:
+                self.check()
+            while not self._stop_event.is_set():
+                if not self.store.wait_for_change(self.interval):
+                    continue
+                if self._stop_event.is_set():
+                    break
+                changes = self.check()
+                if changes:
+                    on_change(changes)
+        except Exception as e:
+            if on_error is not None:
+                on_error(e)
+
+    def stop(self):
+        """
+        Ask the watcher to stop. It stops within one interval.
+        """
+        self._stop_event.set()